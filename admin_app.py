@@ -22,41 +22,31 @@
 
 import os          # Работа с переменными окружения и файловой системой
 import math        # Математические операции для расчетов (размеры файлов, пагинация)
+from datetime import datetime  # Разбор курсора keyset-пагинации
 from flask import request, redirect, url_for, flash, render_template, session
-from functools import wraps  # Декораторы для функций (не используется в текущей версии)
+from functools import lru_cache, wraps  # Кэш проверки пароля администратора; декораторы
 
 # Импорт модулей базы данных
-from db import connect_db, close_db  # Основные функции подключения к БД
+from db import (
+    db_cursor,         # Курсор на соединении из пула
+    ADMIN_EMAILS,      # Множество email администраторов
+    MAIN_ADMIN_EMAIL,  # Email основного администратора
+    verify_password    # Проверка пароля по хешу (Argon2 или SHA-256)
+)
 from admin_db import (  # Специализированные функции для административной статистики
-    get_total_downloads,        # Получение общего количества скачиваний
-    get_total_files_size,       # Расчет общего размера файлов
+    get_dashboard_bundle,       # Все метрики панели одним запросом
     get_statistics_with_filters, # Получение статистики с фильтрами
     get_statistics_count,       # Подсчет записей для пагинации
-    get_unique_action_types,    # Получение уникальных типов действий
-    get_unique_users           # Получение списка пользователей
+    get_unique_users,           # Пользователи для фильтра (кэш в памяти процесса)
+    get_unique_action_types     # Типы действий для фильтра (поиск по индексу)
 )
 
 # ============================================================================
 # КОНФИГУРАЦИЯ АДМИНИСТРАТИВНЫХ ПРАВ
 # ============================================================================
 
-# Получение списка администраторов из переменных окружения
-# Формат переменной ADMIN_EMAILS: "admin1@example.com,admin2@example.com"
-# Это обеспечивает гибкость настройки без изменения кода
-ADMIN_EMAILS_STR = os.getenv('ADMIN_EMAILS', 'admin@example.com')
-
-# Парсинг строки администраторов в список
-# Удаляем пробелы и пустые строки для корректной обработки
-ADMIN_EMAILS = [email.strip() for email in ADMIN_EMAILS_STR.split(',') if email.strip()]
-
-# Основной администратор из отдельной переменной (для обратной совместимости)
-# Используется как fallback если ADMIN_EMAILS не настроена
-MAIN_ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
-
-# Обеспечиваем, что основной администратор всегда включен в список
-# Это гарантирует доступ даже при неправильной настройке ADMIN_EMAILS
-if MAIN_ADMIN_EMAIL not in ADMIN_EMAILS:
-    ADMIN_EMAILS.append(MAIN_ADMIN_EMAIL)
+# Множество администраторов (ADMIN_EMAILS + основной администратор ADMIN_EMAIL)
+# разбирается один раз при импорте модуля db и здесь только переиспользуется
 
 
 # ============================================================================
@@ -102,15 +92,10 @@ def is_admin():
     # Вторичная проверка: убеждаемся, что пользователь существует в базе данных
     # Это предотвращает доступ с устаревшими сессиями после перезапуска контейнеров
     try:
-        conn = connect_db()
-        if not conn:
-            return False
-        
-        cur = conn.cursor()
-        cur.execute("SELECT email, password_hash FROM users WHERE email = %s", (user_email,))
-        user_data = cur.fetchone()
-        cur.close()
-        close_db(conn)
+        # Курсор и соединение освобождаются и при исключении в запросе
+        with db_cursor() as cur:
+            cur.execute("SELECT email, password_hash FROM users WHERE email = %s", (user_email,))
+            user_data = cur.fetchone()
         
         # Если пользователь не существует в БД, очищаем сессию и запрещаем доступ
         if not user_data:
@@ -154,13 +139,12 @@ def _verify_main_admin_credentials(stored_password_hash):
               False в противном случае
               
     Security Notes:
-        - Использует тот же алгоритм хеширования (SHA-256), что и основная система
-        - Сравнивает хеши, а не пароли в открытом виде
+        - Проверяет пароль тем же способом, что и вход (db.verify_password)
+        - Результат кэшируется по значению хеша: проверка Argon2 занимает
+          десятки миллисекунд и выполняется на каждом запросе к админке.
+          Смена пароля меняет хеш, поэтому кэш не устаревает
         - Возвращает False при отсутствии переменной окружения ADMIN_PASSWORD
-        - Защищает от атак по времени через постоянное время выполнения
     """
-    import hashlib
-    
     # Получаем пароль администратора из переменных окружения
     admin_password = os.getenv('ADMIN_PASSWORD')
     
@@ -168,11 +152,13 @@ def _verify_main_admin_credentials(stored_password_hash):
     if not admin_password:
         return False
     
-    # Вычисляем хеш пароля из переменных окружения
-    expected_password_hash = hashlib.sha256(admin_password.encode()).hexdigest()
-    
-    # Сравниваем хеши (защита от атак по времени через постоянное время сравнения)
-    return stored_password_hash == expected_password_hash
+    return _verify_admin_password_cached(stored_password_hash, admin_password)
+
+
+@lru_cache(maxsize=16)
+def _verify_admin_password_cached(stored_password_hash, admin_password):
+    """Проверка пароля администратора с кэшированием результата."""
+    return verify_password(stored_password_hash, admin_password)
 
 
 # ============================================================================
@@ -305,92 +291,63 @@ def admin_statistics():
     per_page = int(request.args.get('per_page', 50))  # Записей на странице (оптимальное значение)
     
     # ========================================================================
-    # УСТАНОВКА СОЕДИНЕНИЯ С БАЗОЙ ДАННЫХ
+    # СБОР ОСНОВНОЙ СТАТИСТИКИ СИСТЕМЫ
     # ========================================================================
     
-    # Устанавливаем соединение с PostgreSQL для выполнения запросов статистики
-    conn = connect_db()
-    if not conn:
+    # Все метрики панели (пользователи, изображения, загрузки, просмотры,
+    # скачивания, размер файлов, загрузки по дням и топ пользователей)
+    # собираются одним запросом к базе данных
+    dashboard = get_dashboard_bundle()
+    if dashboard is None:
         # Критическая ошибка: без БД невозможно получить статистику
         flash('Ошибка подключения к базе данных')
         return redirect(url_for('index'))
     
-    # Создаем курсор для выполнения SQL запросов
-    cur = conn.cursor()
-    
-    # ========================================================================
-    # СБОР ОСНОВНОЙ СТАТИСТИКИ СИСТЕМЫ
-    # ========================================================================
-    
-    # Подсчет общего количества зарегистрированных пользователей
-    # Этот показатель отражает размер пользовательской базы
-    cur.execute("SELECT COUNT(*) FROM users")
-    total_users = cur.fetchone()[0]
-    
-    # Подсчет общего количества загруженных изображений
-    # Показывает объем контента в системе
-    cur.execute("SELECT COUNT(*) FROM images")
-    total_images = cur.fetchone()[0]
-    
-    # Подсчет успешных загрузок из таблицы статистики
-    # Отражает активность пользователей по загрузке контента
-    cur.execute("SELECT COUNT(*) FROM statistics WHERE action_type = 'успешная_загрузка'")
-    total_uploads = cur.fetchone()[0]
-    
-    # Подсчет просмотров изображений
-    # Показывает популярность и использование загруженного контента
-    cur.execute("SELECT COUNT(*) FROM statistics WHERE action_type = 'просмотр_изображения'")
-    total_views = cur.fetchone()[0]
-    
-    # ========================================================================
-    # РАСШИРЕННЫЕ МЕТРИКИ ЧЕРЕЗ СПЕЦИАЛИЗИРОВАННЫЕ ФУНКЦИИ
-    # ========================================================================
-    
-    # Получаем общее количество скачиваний через оптимизированную функцию
-    # Функция может включать дополнительную логику фильтрации и кэширования
-    total_downloads = get_total_downloads()
-    
-    # Вычисляем общий размер всех файлов в системе
-    # Важная метрика для мониторинга использования дискового пространства
-    total_files_size = get_total_files_size()
-    
-    # Статистика по дням (последние 7 дней)
-    cur.execute("""
-        SELECT DATE(timestamp) as date, COUNT(*) as count 
-        FROM statistics 
-        WHERE action_type = 'успешная_загрузка' 
-        AND timestamp >= NOW() - INTERVAL '7 days'
-        GROUP BY DATE(timestamp)
-        ORDER BY date DESC
-    """)
-    daily_uploads = cur.fetchall()
-    
-    # Топ пользователей по загрузкам
-    cur.execute("""
-        SELECT user_email, COUNT(*) as upload_count
-        FROM statistics 
-        WHERE action_type = 'успешная_загрузка'
-        GROUP BY user_email
-        ORDER BY upload_count DESC
-        LIMIT 10
-    """)
-    top_users = cur.fetchall()
-    
-    cur.close()
-    close_db(conn)
+    total_users = dashboard['total_users']
+    total_images = dashboard['total_images']
+    total_uploads = dashboard['total_uploads']
+    total_views = dashboard['total_views']
+    total_downloads = dashboard['total_downloads']
+    total_files_size = dashboard['total_files_size']
+    daily_uploads = dashboard['daily_uploads']
+    top_users = dashboard['top_users']
     
     # Получаем фильтрованные действия с пагинацией
     offset = (page - 1) * per_page
     filter_action_type = action_type if action_type else None
     filter_user_email = user_email if user_email else None
     
+    # Курсор последней записи предыдущей страницы (ссылка "Следующая"):
+    # с ним страница выбирается по индексу, без пропуска offset строк
+    before_timestamp = None
+    before_id = None
+    try:
+        if request.args.get('before_ts') and request.args.get('before_id'):
+            before_timestamp = datetime.fromisoformat(request.args['before_ts'])
+            before_id = int(request.args['before_id'])
+    except ValueError:
+        # Некорректный курсор - используем обычную пагинацию по номеру страницы
+        before_timestamp = None
+        before_id = None
+    
     recent_actions = get_statistics_with_filters(
         action_type=filter_action_type,
         user_email=filter_user_email,
         limit=per_page,
-        offset=offset
+        offset=offset,
+        before_timestamp=before_timestamp,
+        before_id=before_id
     )
     
+    # Курсор для перехода на следующую страницу
+    next_cursor = None
+    if len(recent_actions) == per_page and recent_actions[-1]['timestamp'] is not None:
+        last_action = recent_actions[-1]
+        next_cursor = {
+            'before_ts': last_action['timestamp'].isoformat(),
+            'before_id': last_action['id']
+        }
+    
     # Получаем общее количество записей для пагинации
     total_records = get_statistics_count(
         action_type=filter_action_type,
@@ -400,7 +357,10 @@ def admin_statistics():
     # Вычисляем пагинацию
     total_pages = (total_records + per_page - 1) // per_page
     
-    # Получаем данные для фильтров
+    # Типы действий для фильтра находятся "loose index scan" по индексу
+    # idx_statistics_action_type, без GROUP BY по всей таблице statistics.
+    # Список пользователей берется из кэша в памяти процесса: DISTINCT по
+    # всей таблице выполняется раз в UNIQUE_USERS_TTL секунд
     action_types = get_unique_action_types()
     users = get_unique_users()
     
@@ -433,4 +393,5 @@ def admin_statistics():
                          current_page=page,
                          total_pages=total_pages,
                          per_page=per_page,
-                         total_records=total_records)
\ No newline at end of file
+                         total_records=total_records,
+                         next_cursor=next_cursor)
\ No newline at end of file
@@ -21,14 +21,170 @@
 # ============================================================================
 
 import os  # Работа с файловой системой для расчета размеров файлов
-from psycopg2.extras import RealDictCursor  # Курсор для получения результатов в виде словарей
-from db import connect_db, close_db, create_table_statistics  # Основные функции работы с БД
+import atexit  # Запись остатка буфера статистики при завершении процесса
+import ipaddress  # Проверка IP-адреса перед записью в колонку INET
+import threading  # Фоновый поток пакетной записи статистики
+import time  # Время жизни кэша в памяти процесса
+from collections import deque  # Потокобезопасный буфер событий статистики
+from concurrent.futures import ThreadPoolExecutor, as_completed  # Параллельный обход папок пользователей
+from functools import lru_cache, wraps  # Кэш разбора фильтров и метаданные кэшируемых функций
+from itertools import groupby  # Группировка отсортированных файлов по владельцу
+from operator import itemgetter  # Ключ группировки (колонка user_email)
+from flask import has_app_context  # Кэш Flask-Caching доступен только в контексте приложения
+import psycopg2  # Базовый класс ошибок драйвера (psycopg2.Error)
+import psycopg2.pool  # Ошибка исчерпания пула соединений (PoolError)
+from psycopg2.extras import execute_values  # Пакетная вставка строк одним запросом
+from db import db_cursor, create_table_statistics  # Курсор из пула соединений и функции работы с БД
+
+# Максимальное количество потоков для параллельного подсчета размеров папок
+FILES_SIZE_WORKERS = int(os.getenv('FILES_SIZE_WORKERS', '16'))
+
+# Время жизни закэшированных метрик панели администратора (в секундах)
+STATS_CACHE_TIMEOUT = int(os.getenv('STATS_CACHE_TIMEOUT', '60'))
+
+# Начиная с этого размера таблицы statistics общее количество записей
+# берется из оценки планировщика вместо точного COUNT(*)
+STATS_ESTIMATE_THRESHOLD = int(os.getenv('STATS_ESTIMATE_THRESHOLD', '100000'))
+
+# Сколько строк за раз читает серверный курсор при выгрузке статистики
+STATS_STREAM_ITERSIZE = int(os.getenv('STATS_STREAM_ITERSIZE', '2000'))
+
+# Пакетная запись статистики: интервал сброса буфера (в секундах)
+# и максимальный размер пачки для одного INSERT
+STATS_FLUSH_INTERVAL = float(os.getenv('STATS_FLUSH_INTERVAL', '0.5'))
+STATS_FLUSH_BATCH = int(os.getenv('STATS_FLUSH_BATCH', '500'))
+
+# Пауза перед повторной попыткой записи, если БД недоступна (в секундах)
+STATS_RETRY_INTERVAL = float(os.getenv('STATS_RETRY_INTERVAL', '5'))
+
+# Предельный размер буфера: если БД не успевает или недоступна, новые
+# события отбрасываются (со счетчиком), а не накапливаются в памяти
+STATS_BUFFER_MAX = int(os.getenv('STATS_BUFFER_MAX', '10000'))
+
+# Куда отправлять события статистики: 'buffer' - буфер текущего процесса,
+# 'celery' - очередь statistics (требует запущенного воркера Celery)
+STATS_BACKEND = os.getenv('STATS_BACKEND', 'buffer').lower()
+
+# Буфер событий статистики и фоновый поток, который его записывает
+_stats_buffer = deque()
+_stats_dropped = 0  # Количество отброшенных событий (переполнение буфера, ошибки записи)
+_stats_flush_event = threading.Event()
+# Последний сброс буфера не удался из-за недоступности БД: пока флаг
+# установлен, переполнение буфера не пытается писать события напрямую
+_stats_db_unavailable = False
+_stats_flusher = None
+_stats_flusher_lock = threading.Lock()
+
+
+# ============================================================================
+# КЭШИРОВАНИЕ МЕТРИК
+# ============================================================================
+
+# Кэш списка пользователей из статистики в памяти процесса:
+# список, множество для быстрой проверки и момент устаревания
+UNIQUE_USERS_TTL = int(os.getenv('UNIQUE_USERS_TTL', '300'))
+_unique_users_cache = {'users': None, 'known': frozenset(), 'expires': 0.0}
+
+# Экземпляр Flask-Caching передается из app.py через init_statistics_cache,
+# прямой импорт из app.py привел бы к циклической зависимости модулей
+_stats_cache = None
+
+
+def init_statistics_cache(cache):
+    """
+    Подключает кэш приложения (Redis) к функциям сбора статистики.
+    
+    Args:
+        cache: Экземпляр flask_caching.Cache или None, если Redis недоступен
+    """
+    global _stats_cache
+    _stats_cache = cache
+
+
+def _cache_key(func_name, args=(), kwargs=None):
+    """Формирует ключ кэша из имени функции и ее аргументов."""
+    return f"admin_stats:{func_name}:{args!r}:{sorted((kwargs or {}).items())!r}"
+
+
+class _NotCached:
+    """
+    Результат функции статистики, который нельзя кэшировать.
+    
+    Функции возвращают его с безопасным значением (0, [], None) при ошибке
+    БД: иначе кратковременный сбой оставил бы в Redis нули и пустые списки
+    фильтров на все время жизни кэша.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _cached(timeout=STATS_CACHE_TIMEOUT):
+    """
+    Декоратор кэширования результата функции статистики на timeout секунд.
+    
+    Без подключенного кэша или вне контекста приложения (например, в задачах
+    Celery) функция выполняется напрямую. Ошибки Redis не прерывают работу.
+    Результат _NotCached возвращается вызывающему коду без сохранения в кэш.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _stats_cache is None or not has_app_context():
+                value = func(*args, **kwargs)
+                return value.value if isinstance(value, _NotCached) else value
+            
+            key = _cache_key(func.__name__, args, kwargs)
+            try:
+                value = _stats_cache.get(key)
+                if value is not None:
+                    return value
+            except Exception as e:
+                print(f'Error reading statistics cache: {str(e)}')
+            
+            value = func(*args, **kwargs)
+            if isinstance(value, _NotCached):
+                return value.value
+            try:
+                _stats_cache.set(key, value, timeout=timeout)
+            except Exception as e:
+                print(f'Error writing statistics cache: {str(e)}')
+            return value
+        return wrapper
+    return decorator
+
+
+def _invalidate_cached(func_name, *args, **kwargs):
+    """Удаляет закэшированный результат функции статистики."""
+    if _stats_cache is None or not has_app_context():
+        return
+    try:
+        _stats_cache.delete(_cache_key(func_name, args, kwargs))
+    except Exception as e:
+        print(f'Error invalidating statistics cache: {str(e)}')
+
+
+def _invalidate_cached_many(*func_names):
+    """
+    Удаляет закэшированные результаты нескольких функций без аргументов одной командой.
+    
+    Контекст приложения не требуется: кэш создан с привязкой к приложению
+    (Cache(app)), поэтому функция вызывается и из потока записи статистики.
+    """
+    if _stats_cache is None:
+        return
+    try:
+        _stats_cache.delete_many(*(_cache_key(name) for name in func_names))
+    except Exception as e:
+        print(f'Error invalidating statistics cache: {str(e)}')
 
 
 # ============================================================================
 # ФУНКЦИИ СБОРА МЕТРИК И СТАТИСТИКИ
 # ============================================================================
 
+@_cached()
 def get_total_downloads():
     """
     Получает общее количество скачиваний файлов из системы.
@@ -57,44 +213,60 @@ def get_total_downloads():
     
     Performance Notes:
         - Использует COUNT(*) для эффективного подсчета
-        - Индекс на поле action_type ускоряет выполнение
+        - Частичный индекс idx_statistics_downloads (database_optimization.sql)
+          позволяет выполнить подсчет index-only scan'ом
         - Минимальное использование памяти
     """
     try:
-        # Устанавливаем соединение с базой данных
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        # Выполняем оптимизированный запрос для подсчета скачиваний
-        # Фильтруем только записи с типом действия 'download'
-        cur.execute("SELECT COUNT(*) FROM statistics WHERE action_type = 'download'")
-        total = cur.fetchone()[0]
-        
-        # Освобождаем ресурсы базы данных
-        cur.close()
-        close_db(conn)
-        
-        return total
-    except Exception as e:
+        # Берем соединение из пула на время запроса
+        with db_cursor() as cur:
+            # Выполняем оптимизированный запрос для подсчета скачиваний
+            # Фильтруем только записи с типом действия 'download'
+            cur.execute("SELECT COUNT(*) FROM statistics WHERE action_type = 'download'")
+            return cur.fetchone()[0]
+    except psycopg2.Error as e:
         # Логируем ошибку для диагностики, но не прерываем работу приложения
         print(f'Error getting total downloads: {str(e)}')
-        return 0  # Возвращаем безопасное значение по умолчанию
+        return _NotCached(0)  # Безопасное значение по умолчанию, без записи в кэш
 
 
+def _sum_files_in_folder(folder, filenames):
+    """
+    Суммирует размеры указанных файлов в одной папке через os.scandir.
+    
+    DirEntry.stat() использует данные, уже прочитанные при обходе каталога,
+    поэтому папка читается одним проходом вместо отдельного stat на файл.
+    
+    Args:
+        folder (str): Путь к папке пользователя
+        filenames (set): Имена файлов, размер которых нужно учесть
+    
+    Returns:
+        int: Суммарный размер найденных файлов в байтах
+    """
+    try:
+        with os.scandir(folder) as entries:
+            return sum(entry.stat().st_size for entry in entries
+                       if entry.name in filenames and entry.is_file())
+    except FileNotFoundError:
+        # Папка пользователя могла быть удалена вручную
+        return 0
+
+
+@_cached()
 def get_total_files_size():
     """
     Вычисляет общий размер всех файлов, хранящихся в системе.
     
-    Эта функция выполняет комплексный анализ дискового пространства,
-    используемого приложением. Сначала получает список всех файлов
-    из базы данных, затем проверяет их физическое присутствие на диске
-    и суммирует их размеры.
+    Размер каждого файла записывается в колонку images.size в момент
+    загрузки, поэтому общий объем считается одним агрегатным запросом
+    в базе данных, без обращения к файловой системе для каждого файла.
     
     Процесс вычисления:
-    1. Извлекает список всех файлов и их владельцев из таблицы images
-    2. Для каждого файла строит путь в файловой системе
-    3. Проверяет существование файла на диске
-    4. Суммирует размеры всех существующих файлов
+    1. Суммирует колонку size по всей таблице images (SUM в SQL)
+    2. Для устаревших записей без размера (size IS NULL или 0)
+       размер определяется по файлу на диске
+    3. Возвращает сумму обеих частей
     
     Используется для:
     - Мониторинга использования дискового пространства
@@ -106,6 +278,11 @@ def get_total_files_size():
         {UPLOAD_FOLDER}/{user_email}/{filename}
         Например: images/user@example.com/photo.jpg
     
+    Database Query:
+        SELECT COALESCE(SUM(size), 0),
+               COUNT(*) FILTER (WHERE size IS NULL OR size <= 0)
+        FROM images
+    
     Returns:
         int: Общий размер всех файлов в байтах
              Возвращает 0 в случае ошибки или отсутствия файлов
@@ -114,60 +291,194 @@ def get_total_files_size():
         - Обрабатывает ошибки доступа к файловой системе
         - Пропускает несуществующие файлы без ошибок
         - Логирует проблемы для диагностики
-        - Возвращает частичный результат при частичных ошибках
     
     Performance Considerations:
-        - Может быть медленной при большом количестве файлов
-        - Выполняет системные вызовы для каждого файла
-        - Рекомендуется кэширование результата
-        - Возможна оптимизация через асинхронное выполнение
+        - Один агрегатный запрос вместо системного вызова на каждый файл
+        - Файловая система читается только для устаревших записей
     """
     try:
-        # Подключаемся к базе данных для получения списка файлов
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        # Получаем все зарегистрированные файлы с информацией о владельцах
-        # Эта информация необходима для построения правильных путей к файлам
-        cur.execute("SELECT filename, user_email FROM images")
-        files = cur.fetchall()
-        
-        # Инициализируем счетчик общего размера
-        total_size = 0
-        
-        # Получаем базовую папку для загрузок из переменных окружения
-        # Используем 'images' как значение по умолчанию для совместимости
-        upload_folder = os.getenv('UPLOAD_FOLDER', 'images')
-        
-        # Итерируем по всем файлам для подсчета их размеров
-        for filename, user_email in files:
-            # Строим полный путь к файлу в структуре папок пользователей
-            # Каждый пользователь имеет свою подпапку для изоляции файлов
-            user_folder = os.path.join(upload_folder, user_email)
-            file_path = os.path.join(user_folder, filename)
+        # Соединение нужно только для запросов: до обхода файловой
+        # системы оно уже возвращено в пул
+        legacy_files = {}
+        with db_cursor() as cur:
+            # Суммируем размеры, сохраненные при загрузке, и заодно считаем
+            # устаревшие записи, для которых размер не был записан
+            cur.execute("""
+                SELECT COALESCE(SUM(size), 0),
+                       COUNT(*) FILTER (WHERE size IS NULL OR size <= 0)
+                FROM images
+            """)
+            total_size, legacy_count = cur.fetchone()
+            total_size = int(total_size)
             
-            # Проверяем физическое существование файла перед получением размера
-            # Это защищает от ошибок при несинхронизированности БД и файловой системы
-            if os.path.exists(file_path):
-                # Добавляем размер файла к общему счетчику
-                total_size += os.path.getsize(file_path)
+            if legacy_count:
+                # Сортировка по владельцу позволяет сгруппировать файлы за один проход
+                cur.execute("""
+                    SELECT filename, user_email FROM images
+                    WHERE size IS NULL OR size <= 0
+                    ORDER BY user_email
+                """)
+                
+                # Группируем файлы по владельцам, чтобы читать каждую папку один раз
+                for user_email, rows in groupby(cur.fetchall(), key=itemgetter(1)):
+                    legacy_files[user_email] = {row[0] for row in rows}
         
-        # Освобождаем ресурсы базы данных
-        cur.close()
-        close_db(conn)
+        # Запасной путь: размер устаревших записей берем с диска
+        if legacy_files:
+            # Получаем базовую папку для загрузок из переменных окружения
+            # Используем 'images' как значение по умолчанию для совместимости.
+            # Префикс строится один раз, путь к папке - один раз на пользователя
+            upload_prefix = os.getenv('UPLOAD_FOLDER', 'images') + os.sep
+            
+            # Папки пользователей независимы, поэтому обходим их параллельно:
+            # системные вызовы отпускают GIL, а max_workers ограничивает
+            # количество одновременно открытых дескрипторов
+            workers = min(FILES_SIZE_WORKERS, len(legacy_files))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_sum_files_in_folder, upload_prefix + user_email, filenames)
+                    for user_email, filenames in legacy_files.items()
+                ]
+                for future in as_completed(futures):
+                    try:
+                        total_size += future.result()
+                    except OSError as e:
+                        # Ошибка в одной папке не должна обнулять весь результат
+                        print(f'Error scanning user folder: {str(e)}')
         
         return total_size
-    except Exception as e:
+    except (psycopg2.Error, OSError) as e:
         # Логируем ошибку с подробным описанием для диагностики
         print(f'Error calculating total files size: {str(e)}')
-        return 0  # Возвращаем безопасное значение при любых ошибках
+        return _NotCached(0)  # Безопасное значение при любых ошибках, без записи в кэш
+
+
+@_cached()
+def get_dashboard_bundle():
+    """
+    Собирает все метрики панели администратора за один запрос к базе данных.
+    
+    Вместо отдельного соединения и запроса на каждую метрику (пользователи,
+    изображения, загрузки, просмотры, скачивания, размер файлов, загрузки
+    по дням, топ пользователей) выполняется один SELECT
+    со скалярными подзапросами. Сводка по типам действий считается один раз
+    в CTE и переиспользуется для всех счетчиков.
+    
+    Returns:
+        dict: Словарь с ключами total_users, total_images, total_uploads,
+              total_views, total_downloads, total_files_size,
+              daily_uploads (список кортежей (дата, количество)),
+              top_users (список кортежей (email, количество)).
+              Возвращает None в случае ошибки
+    """
+    try:
+        with db_cursor(dict_cursor=True) as cur:
+            cur.execute("""
+                WITH per_action AS (
+                    SELECT action_type, COUNT(*) AS cnt
+                    FROM statistics
+                    GROUP BY action_type
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    (SELECT COUNT(*) FROM images) AS total_images,
+                    (SELECT COALESCE(SUM(size), 0) FROM images) AS total_files_size,
+                    (SELECT COUNT(*) FROM images WHERE size IS NULL OR size <= 0) AS legacy_files,
+                    (SELECT COALESCE(SUM(cnt), 0) FROM per_action
+                      WHERE action_type = 'успешная_загрузка') AS total_uploads,
+                    (SELECT COALESCE(SUM(cnt), 0) FROM per_action
+                      WHERE action_type = 'просмотр_изображения') AS total_views,
+                    (SELECT COALESCE(SUM(cnt), 0) FROM per_action
+                      WHERE action_type = 'download') AS total_downloads,
+                    (SELECT COALESCE(json_agg(json_build_array(day, cnt) ORDER BY day DESC), '[]')
+                       FROM (SELECT DATE(timestamp) AS day, COUNT(*) AS cnt
+                               FROM statistics
+                              WHERE action_type = 'успешная_загрузка'
+                                AND timestamp >= NOW() - INTERVAL '7 days'
+                              GROUP BY DATE(timestamp)) d) AS daily_uploads,
+                    (SELECT COALESCE(json_agg(json_build_array(user_email, cnt) ORDER BY cnt DESC), '[]')
+                       FROM (SELECT user_email, COUNT(*) AS cnt
+                               FROM statistics
+                              WHERE action_type = 'успешная_загрузка'
+                              GROUP BY user_email
+                              ORDER BY cnt DESC
+                              LIMIT 10) t) AS top_users
+            """)
+            row = cur.fetchone()
+        
+        # Для устаревших записей без размера нужен обход файловой системы
+        total_files_size = int(row['total_files_size'])
+        if row['legacy_files']:
+            total_files_size = get_total_files_size()
+        
+        # Шаблон обращается к строкам по индексу, поэтому JSON-массивы
+        # превращаем в кортежи, как у обычного курсора
+        return {
+            'total_users': row['total_users'],
+            'total_images': row['total_images'],
+            'total_uploads': int(row['total_uploads']),
+            'total_views': int(row['total_views']),
+            'total_downloads': int(row['total_downloads']),
+            'total_files_size': total_files_size,
+            'daily_uploads': [tuple(item) for item in row['daily_uploads']],
+            'top_users': [tuple(item) for item in row['top_users']],
+        }
+    except psycopg2.Error as e:
+        print(f'Error getting dashboard bundle: {str(e)}')
+        return _NotCached(None)
 
 
 # ============================================================================
 # ФУНКЦИИ ФИЛЬТРАЦИИ И ПАГИНАЦИИ ДАННЫХ
 # ============================================================================
 
-def get_statistics_with_filters(action_type=None, user_email=None, limit=50, offset=0):
+# Префикс фильтра со списком пользователей, который формирует панель администратора
+CUSTOM_LIST_PREFIX = 'CUSTOM_LIST:'
+
+
+@lru_cache(maxsize=64)
+def _parse_user_filter(user_email):
+    """
+    Преобразует значение фильтра по пользователю в условие SQL.
+    
+    Поддерживаемые значения:
+    - 'Гость': действия анонимных пользователей (user_email IS NULL)
+    - 'ACTIVE_USERS': реальные пользователи без тестовых и админских адресов
+    - 'CUSTOM_LIST:a@x,b@y': произвольный список email через запятую
+    - любой другой текст: точное совпадение email
+    
+    Результат кэшируется: панель повторяет один и тот же фильтр
+    для выборки записей и для подсчета их количества.
+    
+    Args:
+        user_email (str): Значение фильтра из запроса
+    
+    Returns:
+        tuple: (условие SQL или None, кортеж параметров)
+    """
+    # Специальная обработка для фильтрации анонимных пользователей
+    if user_email == 'Гость':
+        return "user_email IS NULL", ()
+    
+    # Специальная обработка для фильтрации активных пользователей:
+    # признак вычисляется в users.is_active_user, поэтому вместо LIKE
+    # по всей таблице statistics выполняется полусоединение по индексу
+    if user_email == 'ACTIVE_USERS':
+        return "user_email IN (SELECT email FROM users WHERE is_active_user)", ()
+    
+    # Специальная обработка для кастомного списка пользователей
+    if user_email.startswith(CUSTOM_LIST_PREFIX):
+        user_list = tuple(u.strip() for u in user_email[len(CUSTOM_LIST_PREFIX):].split(',') if u.strip())
+        if not user_list:
+            return None, ()
+        placeholders = ','.join(['%s'] * len(user_list))
+        return f"user_email IN ({placeholders})", user_list
+    
+    return "user_email = %s", (user_email,)
+
+
+def get_statistics_with_filters(action_type=None, user_email=None, limit=50, offset=0,
+                                before_timestamp=None, before_id=None):
     """
     Получает статистику действий пользователей с расширенной фильтрацией и пагинацией.
     
@@ -179,7 +490,8 @@ def get_statistics_with_filters(action_type=None, user_email=None, limit=50, off
     Функциональность:
     - Динамическое построение SQL запросов на основе переданных фильтров
     - Безопасная параметризация запросов для предотвращения SQL-инъекций
-    - Оптимизированная пагинация с использованием LIMIT/OFFSET
+    - Keyset-пагинация по (timestamp, id) без сканирования пропущенных строк
+    - Пагинация через LIMIT/OFFSET для произвольного перехода на страницу
     - Сортировка по времени (новые записи первыми)
     - Возврат данных в удобном формате словарей
     
@@ -198,11 +510,16 @@ def get_statistics_with_filters(action_type=None, user_email=None, limit=50, off
         limit (int): Максимальное количество записей для возврата
                     По умолчанию 50 - оптимальное значение для UI
         offset (int): Смещение для пагинации (количество пропускаемых записей)
-                     Используется для реализации постраничной навигации
+                     Используется для перехода на произвольную страницу
+        before_timestamp (datetime, optional): Время последней записи
+                     предыдущей страницы. Вместе с before_id включает
+                     keyset-пагинацию, offset при этом не используется
+        before_id (int, optional): ID последней записи предыдущей страницы
     
     Returns:
         list: Список словарей с записями статистики, отсортированный по времени
               Каждый словарь содержит поля:
+              - id: идентификатор записи (курсор для следующей страницы)
               - action_type: тип действия
               - user_email: email пользователя
               - ip_address: IP-адрес пользователя
@@ -211,11 +528,11 @@ def get_statistics_with_filters(action_type=None, user_email=None, limit=50, off
               Возвращает пустой список в случае ошибки
     
     Database Query Structure:
-        SELECT action_type, user_email, ip_address, timestamp, additional_info 
+        SELECT id, action_type, user_email, ip_address, timestamp, additional_info 
         FROM statistics 
-        [WHERE conditions] 
-        ORDER BY timestamp DESC 
-        LIMIT limit OFFSET offset
+        [WHERE conditions [AND (timestamp, id) < (before_timestamp, before_id)]] 
+        ORDER BY timestamp DESC, id DESC 
+        LIMIT limit [OFFSET offset]
     
     Security Features:
         - Использует параметризованные запросы для предотвращения SQL-инъекций
@@ -223,86 +540,84 @@ def get_statistics_with_filters(action_type=None, user_email=None, limit=50, off
         - Безопасная обработка пользовательского ввода
     
     Performance Optimizations:
-        - Индекс на поле timestamp для быстрой сортировки
-        - Индексы на поля action_type и user_email для фильтрации
+        - Покрывающий индекс idx_stats_ts_desc (timestamp DESC, id DESC)
+          INCLUDE (...): keyset-страница читается index-only scan'ом за
+          O(log n + limit) без сортировки и обращения к таблице
+        - Такие же покрывающие индексы с ведущими action_type и user_email
+          для отфильтрованного журнала
         - LIMIT предотвращает загрузку избыточных данных
         - RealDictCursor для эффективного преобразования результатов
     """
     try:
-        # Устанавливаем соединение с базой данных
-        conn = connect_db()
+        # Берем соединение из пула на время запроса
         # Используем RealDictCursor для получения результатов в виде словарей
         # Это упрощает работу с данными в шаблонах и API
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Строим базовый SQL запрос с необходимыми полями
-        # Выбираем только нужные поля для оптимизации производительности
-        query = "SELECT action_type, user_email, ip_address, timestamp, additional_info FROM statistics"
-        params = []      # Список параметров для безопасного выполнения запроса
-        conditions = []  # Список условий WHERE для динамического построения запроса
-        
-        # ====================================================================
-        # ДИНАМИЧЕСКОЕ ПОСТРОЕНИЕ УСЛОВИЙ ФИЛЬТРАЦИИ
-        # ====================================================================
-        
-        # Добавляем фильтр по типу действия, если указан
-        if action_type:
-            conditions.append("action_type = %s")
-            params.append(action_type)
-        
-        # Добавляем фильтр по пользователю, если указан
-        if user_email:
-            # Специальная обработка для фильтрации анонимных пользователей
-            if user_email == 'Гость':
-                conditions.append("user_email IS NULL")
-            # Специальная обработка для фильтрации активных пользователей
-            elif user_email == 'ACTIVE_USERS':
-                conditions.append("user_email IS NOT NULL AND user_email NOT LIKE '%example.com%' AND LOWER(user_email) NOT LIKE '%admin%'")
-            # Специальная обработка для кастомного списка пользователей
-            elif user_email.startswith('CUSTOM_LIST:'):
-                user_list = [u.strip() for u in user_email[12:].split(',') if u.strip()]
-                print(f"DEBUG: CUSTOM_LIST user_list = {user_list}")  # Отладочная информация
-                if user_list:
-                    placeholders = ','.join(['%s'] * len(user_list))
-                    conditions.append(f"user_email IN ({placeholders})")
-                    params.extend(user_list)
-                    print(f"DEBUG: SQL condition = user_email IN ({placeholders}), params = {user_list}")  # Отладочная информация
-            else:
-                conditions.append("user_email = %s")
-                params.append(user_email)
-        
-        # Объединяем все условия в WHERE клаузулу, если есть фильтры
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        # ====================================================================
-        # ДОБАВЛЕНИЕ СОРТИРОВКИ И ПАГИНАЦИИ
-        # ====================================================================
-        
-        # Сортируем по времени в убывающем порядке (новые записи первыми)
-        # Добавляем пагинацию для эффективной работы с большими объемами данных
-        query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
-        
-        # Выполняем построенный запрос с параметрами
-        cur.execute(query, params)
-        statistics = cur.fetchall()
-        
-        # Освобождаем ресурсы базы данных
-        cur.close()
-        close_db(conn)
-        
-        return statistics
-    except Exception as e:
+        with db_cursor(dict_cursor=True) as cur:
+            
+            # Строим базовый SQL запрос с необходимыми полями
+            # Выбираем только нужные поля для оптимизации производительности
+            query = "SELECT id, action_type, user_email, ip_address, timestamp, additional_info FROM statistics"
+            params = []      # Список параметров для безопасного выполнения запроса
+            conditions = []  # Список условий WHERE для динамического построения запроса
+            
+            # ====================================================================
+            # ДИНАМИЧЕСКОЕ ПОСТРОЕНИЕ УСЛОВИЙ ФИЛЬТРАЦИИ
+            # ====================================================================
+            
+            # Добавляем фильтр по типу действия, если указан
+            if action_type:
+                conditions.append("action_type = %s")
+                params.append(action_type)
+            
+            # Добавляем фильтр по пользователю, если указан
+            if user_email:
+                user_condition, user_params = _parse_user_filter(user_email)
+                if user_condition:
+                    conditions.append(user_condition)
+                    params.extend(user_params)
+            
+            # Keyset-пагинация: продолжаем сразу после последней записи
+            # предыдущей страницы вместо пропуска offset строк
+            keyset = before_timestamp is not None and before_id is not None
+            if keyset:
+                conditions.append("(timestamp, id) < (%s, %s)")
+                params.extend([before_timestamp, before_id])
+            
+            # Объединяем все условия в WHERE клаузулу, если есть фильтры
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            
+            # ====================================================================
+            # ДОБАВЛЕНИЕ СОРТИРОВКИ И ПАГИНАЦИИ
+            # ====================================================================
+            
+            # Сортируем по времени в убывающем порядке (новые записи первыми),
+            # id делает порядок однозначным для записей с одинаковым временем
+            query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+            params.append(limit)
+            if not keyset:
+                query += " OFFSET %s"
+                params.append(offset)
+            
+            # Выполняем построенный запрос с параметрами
+            cur.execute(query, params)
+            return cur.fetchall()
+    except psycopg2.Error as e:
         # Логируем ошибку с контекстной информацией для диагностики
         print(f'Error getting filtered statistics: {str(e)}')
         return []  # Возвращаем пустой список для безопасного продолжения работы
 
 
+@_cached()
 def get_statistics_count(action_type=None, user_email=None):
     """
     Получает общее количество записей статистики с учетом фильтров.
     
+    Без фильтров используется оценка PostgreSQL (pg_class.reltuples),
+    которая читается из системного каталога без сканирования таблицы.
+    Для небольших или еще не проанализированных таблиц (оценка ниже
+    STATS_ESTIMATE_THRESHOLD) выполняется точный COUNT(*).
+    
     Args:
         action_type (str, optional): Тип действия для фильтрации
         user_email (str, optional): Email пользователя для фильтрации
@@ -311,133 +626,334 @@ def get_statistics_count(action_type=None, user_email=None):
         int: Общее количество записей
     """
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        # Базовый запрос
-        query = "SELECT COUNT(*) FROM statistics"
-        params = []
-        conditions = []
-        
-        # Добавляем фильтры
-        if action_type:
-            conditions.append("action_type = %s")
-            params.append(action_type)
-        
-        if user_email:
-            # Специальная обработка для подсчета анонимных пользователей
-            if user_email == 'Гость':
-                conditions.append("user_email IS NULL")
-            # Специальная обработка для подсчета активных пользователей
-            elif user_email == 'ACTIVE_USERS':
-                conditions.append("user_email IS NOT NULL AND user_email NOT LIKE '%example.com%' AND LOWER(user_email) NOT LIKE '%admin%'")
-            # Специальная обработка для подсчета кастомного списка пользователей
-            elif user_email.startswith('CUSTOM_LIST:'):
-                user_list = [u.strip() for u in user_email[12:].split(',') if u.strip()]
-                if user_list:
-                    placeholders = ','.join(['%s'] * len(user_list))
-                    conditions.append(f"user_email IN ({placeholders})")
-                    params.extend(user_list)
-            else:
-                conditions.append("user_email = %s")
-                params.append(user_email)
-        
-        # Добавляем условия к запросу
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        cur.execute(query, params)
-        count = cur.fetchone()[0]
-        
-        cur.close()
-        close_db(conn)
-        
-        return count
-    except Exception as e:
+        with db_cursor() as cur:
+            # Без фильтров точное число для пагинации не требуется:
+            # берем оценку, которую обновляют ANALYZE и autovacuum
+            if not action_type and not user_email:
+                cur.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'statistics'::regclass")
+                row = cur.fetchone()
+                if row and row[0] >= STATS_ESTIMATE_THRESHOLD:
+                    return row[0]
+            
+            # Базовый запрос
+            query = "SELECT COUNT(*) FROM statistics"
+            params = []
+            conditions = []
+            
+            # Добавляем фильтры
+            if action_type:
+                conditions.append("action_type = %s")
+                params.append(action_type)
+            
+            if user_email:
+                user_condition, user_params = _parse_user_filter(user_email)
+                if user_condition:
+                    conditions.append(user_condition)
+                    params.extend(user_params)
+            
+            # Добавляем условия к запросу
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            
+            cur.execute(query, params)
+            return cur.fetchone()[0]
+    except psycopg2.Error as e:
         print(f'Error getting statistics count: {str(e)}')
-        return 0
+        return _NotCached(0)
 
 
+@_cached()
 def get_unique_action_types():
     """
     Получает список уникальных типов действий из статистики.
     
+    Использует "loose index scan" через рекурсивный CTE: каждый следующий
+    тип действия находится одним поиском по индексу idx_statistics_action_type
+    (MIN(action_type) WHERE action_type > предыдущего), поэтому запрос
+    выполняет столько обращений к индексу, сколько существует типов,
+    вместо полного сканирования таблицы statistics.
+    
     Returns:
         list: Список уникальных типов действий
     """
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT DISTINCT action_type FROM statistics ORDER BY action_type")
-        action_types = [row[0] for row in cur.fetchall()]
-        
-        cur.close()
-        close_db(conn)
-        
-        return action_types
-    except Exception as e:
+        with db_cursor() as cur:
+            cur.execute("""
+                WITH RECURSIVE t AS (
+                    SELECT MIN(action_type) AS action_type FROM statistics
+                    UNION ALL
+                    SELECT (SELECT MIN(action_type) FROM statistics WHERE action_type > t.action_type)
+                    FROM t
+                    WHERE t.action_type IS NOT NULL
+                )
+                SELECT action_type FROM t WHERE action_type IS NOT NULL
+            """)
+            return [row[0] for row in cur.fetchall()]
+    except psycopg2.Error as e:
         print(f'Error getting unique action types: {str(e)}')
-        return []
+        return _NotCached([])
 
 
 def get_unique_users():
     """
     Получает список уникальных пользователей из статистики.
     
+    Список меняется редко, поэтому хранится в памяти процесса
+    UNIQUE_USERS_TTL секунд (без обращения к БД и Redis). Кэш сбрасывается
+    досрочно, когда log_statistics получает событие от пользователя,
+    которого еще нет в списке.
+    
     Returns:
         list: Список уникальных email пользователей
     """
+    if _unique_users_cache['users'] is not None and time.monotonic() < _unique_users_cache['expires']:
+        return _unique_users_cache['users']
+    
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT DISTINCT user_email FROM statistics WHERE user_email IS NOT NULL ORDER BY user_email")
-        users = [row[0] for row in cur.fetchall()]
-        
-        cur.close()
-        close_db(conn)
+        with db_cursor() as cur:
+            cur.execute("SELECT DISTINCT user_email FROM statistics WHERE user_email IS NOT NULL ORDER BY user_email")
+            users = [row[0] for row in cur.fetchall()]
         
+        _unique_users_cache.update(
+            users=users,
+            known=frozenset(users),
+            expires=time.monotonic() + UNIQUE_USERS_TTL
+        )
         return users
-    except Exception as e:
+    except psycopg2.Error as e:
         print(f'Error getting unique users: {str(e)}')
         return []
 
 
-def log_statistics(action_type, user_email=None, file_id=None, ip_address=None, user_agent=None, additional_info=None):
+def _insert_statistics_batch(rows):
     """
-    Записывает статистику действий пользователей.
+    Записывает пачку строк статистики одним запросом через execute_values.
+    
+    Email сверяется с таблицей users через LEFT JOIN, поэтому неизвестный
+    пользователь не срывает вставку всей пачки, а записывается как NULL.
+    Порядковый номер строки сохраняет порядок событий в пределах пачки.
     
     Args:
-        action_type (str): Тип действия (например, 'upload', 'download', 'view')
-        user_email (str, optional): Email пользователя
-        file_id (int, optional): ID файла
-        ip_address (str, optional): IP-адрес пользователя
-        user_agent (str, optional): User-Agent браузера
-        additional_info (str, optional): Дополнительная информация
+        rows (list): Кортежи (action_type, user_email, file_id,
+                     ip_address, user_agent, additional_info)
+    """
+    numbered = [(n,) + tuple(row) for n, row in enumerate(rows)]
+    with db_cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO statistics (action_type, user_email, file_id, ip_address, user_agent, additional_info)
+            SELECT v.action_type, u.email, v.file_id, v.ip_address, v.user_agent, v.additional_info
+            FROM (VALUES %s) AS v(n, action_type, user_email, file_id, ip_address, user_agent, additional_info)
+            LEFT JOIN users u ON u.email = v.user_email
+            ORDER BY v.n
+        """, numbered, template="(%s, %s, %s, %s::integer, %s::inet, %s, %s)", page_size=STATS_FLUSH_BATCH)
+
+
+def _flush_statistics_buffer():
+    """
+    Записывает в БД все накопленные в буфере события пачками по STATS_FLUSH_BATCH.
     
     Returns:
-        bool: True если запись успешна, False в противном случае
+        int: Количество записанных строк
     """
-    try:
-        conn = connect_db()
-        cur = conn.cursor()
+    global _stats_db_unavailable
+    written = 0
+    downloads_flushed = False
+    while _stats_buffer:
+        batch = []
+        try:
+            while len(batch) < STATS_FLUSH_BATCH:
+                batch.append(_stats_buffer.popleft())
+        except IndexError:
+            # Буфер опустел раньше, чем набралась полная пачка
+            pass
         
-        # Проверяем существование пользователя, если user_email указан
-        if user_email:
-            cur.execute("SELECT email FROM users WHERE email = %s", (user_email,))
-            if not cur.fetchone():
-                # Если пользователь не найден, записываем статистику без email
-                user_email = None
+        has_downloads = any(row[0] == 'download' for row in batch)
+        try:
+            _insert_statistics_batch(batch)
+            written += len(batch)
+            downloads_flushed = downloads_flushed or has_downloads
+            _stats_db_unavailable = False
+        except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+            # БД недоступна: пачка возвращается в начало буфера и будет
+            # записана при следующем сбросе. Сверх STATS_BUFFER_MAX события
+            # отбрасываются и учитываются в счетчике _stats_dropped
+            room = max(STATS_BUFFER_MAX - len(_stats_buffer), 0)
+            _stats_buffer.extendleft(reversed(batch[:room]))
+            lost = len(batch) - min(room, len(batch))
+            if lost:
+                _count_dropped_statistics(lost)
+            _stats_db_unavailable = True
+            print(f'Error flushing statistics buffer ({len(batch) - lost} rows kept, {lost} rows lost): {str(e)}')
+            break
+        except Exception as e:
+            # Ошибка в данных: пачка делится пополам, чтобы потерять
+            # только строки, которые не удается записать
+            print(f'Error flushing statistics buffer, retrying in parts: {str(e)}')
+            part_written = _insert_statistics_split(batch)
+            written += part_written
+            downloads_flushed = downloads_flushed or (has_downloads and part_written > 0)
+    
+    # Закэшированные счетчики скачиваний устаревают только после записи
+    # строк в БД: сброс при постановке события в буфер не имел смысла -
+    # запрос панели до записи пачки снова положил бы в кэш старое значение.
+    # Оба ключа удаляются одной командой Redis один раз на сброс буфера.
+    # В воркере Celery кэш не подключен, там счетчики обновляются по TTL
+    if downloads_flushed and written:
+        _invalidate_cached_many('get_total_downloads', 'get_dashboard_bundle')
+    return written
+
+
+def _insert_statistics_split(rows):
+    """
+    Записывает пачку, которую не удалось вставить целиком, делением пополам.
+    
+    Корректные строки записываются, а каждая строка, на которой вставка
+    падает и в одиночку, отбрасывается с записью в лог.
+    
+    Args:
+        rows (list): Строки статистики (см. _insert_statistics_batch)
+    
+    Returns:
+        int: Количество записанных строк
+    """
+    if len(rows) == 1:
+        _count_dropped_statistics(1)
+        print(f'Statistics row lost: {rows[0]!r}')
+        return 0
+    
+    written = 0
+    middle = len(rows) // 2
+    for part in (rows[:middle], rows[middle:]):
+        try:
+            _insert_statistics_batch(part)
+            written += len(part)
+        except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+            _count_dropped_statistics(len(part))
+            print(f'Error flushing statistics buffer ({len(part)} rows lost): {str(e)}')
+        except Exception:
+            written += _insert_statistics_split(part)
+    return written
+
+
+def _count_dropped_statistics(count):
+    """Учитывает потерянные при записи события в счетчике _stats_dropped."""
+    global _stats_dropped
+    _stats_dropped += count
+
+
+def flush_statistics():
+    """
+    Записывает остаток буфера статистики, не дожидаясь фонового потока.
+    
+    Вызывается из cleanup() приложения до закрытия пула соединений:
+    обработчики atexit выполняются в обратном порядке регистрации, и
+    зарегистрированный здесь сброс буфера иначе запускался бы уже после
+    закрытия пула.
+    
+    Returns:
+        int: Количество записанных строк
+    """
+    return _flush_statistics_buffer()
+
+
+# Остаток буфера записывается при штатном завершении процесса
+# (если приложение не вызвало flush_statistics раньше)
+atexit.register(_flush_statistics_buffer)
+
+
+def _statistics_flusher_loop():
+    """Фоновый поток: сбрасывает буфер раз в STATS_FLUSH_INTERVAL или при заполнении пачки."""
+    while True:
+        _stats_flush_event.wait(STATS_FLUSH_INTERVAL)
+        _stats_flush_event.clear()
+        _flush_statistics_buffer()
+        if _stats_db_unavailable:
+            # Сигналы о переполнении буфера не должны превращать повторные
+            # попытки подключения к недоступной БД в непрерывный цикл
+            time.sleep(STATS_RETRY_INTERVAL)
+
+
+def _ensure_statistics_flusher():
+    """
+    Запускает фоновый поток записи статистики при первом обращении.
+    
+    Поток создается лениво, а не при импорте модуля, чтобы он появлялся
+    уже в рабочем процессе (gunicorn, Celery), а не в родительском до fork.
+    """
+    global _stats_flusher
+    if _stats_flusher is not None and _stats_flusher.is_alive():
+        return
+    with _stats_flusher_lock:
+        if _stats_flusher is None or not _stats_flusher.is_alive():
+            _stats_flusher = threading.Thread(
+                target=_statistics_flusher_loop,
+                name='statistics-flusher',
+                daemon=True
+            )
+            _stats_flusher.start()
+
+
+def _normalize_ip(ip_address):
+    """
+    Проверяет IP-адрес перед записью в колонку INET.
+    
+    Адрес берется из заголовка X-Forwarded-For, который задает клиент:
+    некорректное значение (например, 'unknown') сорвало бы вставку всей
+    пачки статистики, поэтому оно заменяется на None.
+    
+    Returns:
+        str or None: Нормализованный IP-адрес или None
+    """
+    if not ip_address:
+        return None
+    try:
+        return str(ipaddress.ip_address(str(ip_address).strip()))
+    except ValueError:
+        return None
+
+
+def _log_statistics_local(action_type, user_email=None, file_id=None, ip_address=None, user_agent=None, additional_info=None):
+    """
+    Помещает событие статистики в буфер текущего процесса.
+    
+    Фоновый поток записывает накопленные события пачками: каждые
+    STATS_FLUSH_INTERVAL секунд или по достижении STATS_FLUSH_BATCH событий.
+    При завершении процесса остаток буфера записывается через atexit.
+    Используется напрямую в log_statistics и в задаче Celery.
+    
+    Буфер ограничен STATS_BUFFER_MAX событиями: при переполнении событие
+    записывается сразу отдельным запросом, а если и это не удалось -
+    отбрасывается и учитывается в счетчике _stats_dropped.
+    
+    Returns:
+        bool: True если событие принято к записи, False в противном случае
+    """
+    global _stats_dropped
+    row = (action_type, user_email, file_id, _normalize_ip(ip_address), user_agent, additional_info)
+    try:
+        if len(_stats_buffer) >= STATS_BUFFER_MAX:
+            _stats_flush_event.set()
+            # Буфер переполнен: пробуем записать событие сразу, а если
+            # БД недоступна - отбрасываем его. Если недоступность уже
+            # обнаружил поток записи, запрос не ждет попытки подключения
+            try:
+                if _stats_db_unavailable:
+                    raise psycopg2.OperationalError('Statistics database is unavailable')
+                _insert_statistics_batch([row])
+                return True
+            except psycopg2.Error:
+                _stats_dropped += 1
+                # Сообщаем о первом отброшенном событии и далее о каждой тысяче
+                if _stats_dropped % 1000 == 1:
+                    print(f'Statistics buffer is full, dropped events: {_stats_dropped}')
+                return False
         
-        cur.execute("""
-        INSERT INTO statistics (action_type, user_email, file_id, ip_address, user_agent, additional_info)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        """, (action_type, user_email, file_id, ip_address, user_agent, additional_info))
+        _stats_buffer.append(row)
+        _ensure_statistics_flusher()
         
-        conn.commit()
-        cur.close()
-        close_db(conn)
+        # Полная пачка записывается, не дожидаясь интервала
+        if len(_stats_buffer) >= STATS_FLUSH_BATCH:
+            _stats_flush_event.set()
         
         return True
     except Exception as e:
@@ -445,6 +961,66 @@ def log_statistics(action_type, user_email=None, file_id=None, ip_address=None,
         return False
 
 
+def get_statistics_buffer_stats():
+    """
+    Состояние буфера статистики текущего процесса (для мониторинга).
+    
+    Returns:
+        dict: Количество ожидающих записи и отброшенных событий
+    """
+    return {
+        'buffered': len(_stats_buffer),
+        'dropped': _stats_dropped,
+        'max_size': STATS_BUFFER_MAX
+    }
+
+
+def log_statistics(action_type, user_email=None, file_id=None, ip_address=None, user_agent=None, additional_info=None):
+    """
+    Записывает статистику действий пользователей.
+    
+    Запись в БД никогда не выполняется на пути обработки запроса:
+    - STATS_BACKEND=celery: событие уходит в очередь statistics, где его
+      принимает воркер Celery и пишет пачками через тот же буфер;
+    - STATS_BACKEND=buffer (по умолчанию): событие попадает в буфер
+      текущего процесса.
+    Если брокер Celery недоступен, событие записывается через буфер.
+    
+    Args:
+        action_type (str): Тип действия (например, 'upload', 'download', 'view')
+        user_email (str, optional): Email пользователя
+        file_id (int, optional): ID файла
+        ip_address (str, optional): IP-адрес пользователя
+        user_agent (str, optional): User-Agent браузера
+        additional_info (str, optional): Дополнительная информация
+    
+    Returns:
+        bool: True если событие принято к записи, False в противном случае
+    """
+    # Новый пользователь в статистике делает устаревшим список пользователей
+    if user_email and user_email not in _unique_users_cache['known']:
+        _unique_users_cache['expires'] = 0.0
+    
+    if STATS_BACKEND == 'celery':
+        try:
+            from celery_app import log_statistics_async
+            log_statistics_async.delay(
+                action_type,
+                user_email,
+                file_id=file_id,
+                # Некорректный адрес отбрасывается до постановки в очередь
+                # (в воркере он проверяется еще раз в _log_statistics_local)
+                ip_address=_normalize_ip(ip_address),
+                user_agent=user_agent,
+                additional_info=additional_info
+            )
+            return True
+        except Exception as e:
+            print(f'Error queueing statistics to Celery, using local buffer: {str(e)}')
+    
+    return _log_statistics_local(action_type, user_email, file_id, ip_address, user_agent, additional_info)
+
+
 def get_statistics(action_type=None, user_email=None, limit=100, offset=0):
     """
     Получает статистику действий пользователей с фильтрацией.
@@ -459,39 +1035,80 @@ def get_statistics(action_type=None, user_email=None, limit=100, offset=0):
         list: Список записей статистики
     """
     try:
-        conn = connect_db()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = "SELECT * FROM statistics"
-        params = []
-        conditions = []
-        
-        if action_type:
-            conditions.append("action_type = %s")
-            params.append(action_type)
-        
-        if user_email:
-            conditions.append("user_email = %s")
-            params.append(user_email)
-        
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        
-        query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
-        
-        cur.execute(query, params)
-        statistics = cur.fetchall()
-        
-        cur.close()
-        close_db(conn)
-        
-        return statistics
-    except Exception as e:
+        with db_cursor(dict_cursor=True) as cur:
+            query = "SELECT * FROM statistics"
+            params = []
+            conditions = []
+            
+            if action_type:
+                conditions.append("action_type = %s")
+                params.append(action_type)
+            
+            if user_email:
+                conditions.append("user_email = %s")
+                params.append(user_email)
+            
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            
+            query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
+            
+            cur.execute(query, params)
+            return cur.fetchall()
+    except psycopg2.Error as e:
         print(f'Error getting statistics: {str(e)}')
         return []
 
 
+def iter_statistics(action_type=None, user_email=None):
+    """
+    Построчно выдает записи статистики через серверный курсор PostgreSQL.
+    
+    В отличие от get_statistics, результат не загружается в память целиком:
+    именованный курсор читает строки с сервера порциями по
+    STATS_STREAM_ITERSIZE, поэтому потребление памяти не зависит от объема
+    выборки. Подходит для выгрузки (например, в CSV) всего журнала действий.
+    
+    Соединение удерживается, пока генератор не будет исчерпан или закрыт.
+    
+    Args:
+        action_type (str, optional): Тип действия для фильтрации
+        user_email (str, optional): Фильтр по пользователю (те же значения,
+                                    что и в get_statistics_with_filters)
+    
+    Yields:
+        dict: Запись статистики (RealDictRow), новые записи первыми
+    """
+    query = "SELECT * FROM statistics"
+    params = []
+    conditions = []
+    
+    if action_type:
+        conditions.append("action_type = %s")
+        params.append(action_type)
+    
+    if user_email:
+        user_condition, user_params = _parse_user_filter(user_email)
+        if user_condition:
+            conditions.append(user_condition)
+            params.extend(user_params)
+    
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    
+    query += " ORDER BY timestamp DESC, id DESC"
+    
+    try:
+        with db_cursor(dict_cursor=True, name='statistics_stream') as cur:
+            cur.itersize = STATS_STREAM_ITERSIZE
+            cur.execute(query, params)
+            yield from cur
+    except psycopg2.Error as e:
+        print(f'Error streaming statistics: {str(e)}')
+
+
+@_cached()
 def get_statistics_summary():
     """
     Получает сводную статистику по типам действий.
@@ -500,17 +1117,9 @@ def get_statistics_summary():
         list: Список кортежей (action_type, count) отсортированный по убыванию количества
     """
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        query = "SELECT action_type, COUNT(*) FROM statistics GROUP BY action_type ORDER BY COUNT(*) DESC"
-        cur.execute(query)
-        summary = cur.fetchall()
-        
-        cur.close()
-        close_db(conn)
-        
-        return summary
-    except Exception as e:
+        with db_cursor() as cur:
+            cur.execute("SELECT action_type, COUNT(*) FROM statistics GROUP BY action_type ORDER BY COUNT(*) DESC")
+            return cur.fetchall()
+    except psycopg2.Error as e:
         print(f'Error getting statistics summary: {str(e)}')
-        return []
\ No newline at end of file
+        return _NotCached([])
\ No newline at end of file
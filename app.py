@@ -24,8 +24,23 @@ import os                    # Работа с операционной сист
 import logging              # Система логирования для отслеживания событий
 import time                 # Работа со временем
 import atexit               # Регистрация функций завершения
+import signal               # Обработка SIGTERM при остановке контейнера
+import sys                  # Завершение процесса из обработчика сигнала
+import gzip                 # Сжатие ответа /metrics
+import json                 # Метаданные временных ссылок
+import io                   # Сборка небольших ZIP-архивов в памяти
+import zlib                 # CRC-32 загружаемых файлов
+import threading            # Фоновые задачи при запуске
+import weakref              # Учет соединений с подготовленными запросами
+import mimetypes            # Content-Type для ответов X-Accel-Redirect
+import secrets              # Токены временных ссылок
+import sqlite3              # Резервное хранилище временных ссылок без Redis
 from datetime import datetime  # Работа с датой и временем
+from concurrent.futures import ThreadPoolExecutor  # Параллельное сохранение загружаемых файлов
 from functools import wraps    # Декораторы для функций
+from pathlib import Path       # Пути к папкам пользователей
+from typing import Final       # Константы конфигурации
+from urllib.parse import quote # Экранирование путей в X-Accel-Redirect
 
 # Flask - основной веб-фреймворк
 from flask import (
@@ -37,32 +52,43 @@ from flask import (
     render_template,       # Рендеринг HTML-шаблонов
     session,               # Работа с пользовательскими сессиями
     send_from_directory,   # Отправка файлов из директории
+    send_file,             # Отправка архивов, собранных в памяти
     abort,                 # Прерывание запроса с HTTP-ошибкой
-    jsonify                # Создание JSON-ответов
+    jsonify,               # Создание JSON-ответов
+    Response,              # Ответы с произвольными заголовками
+    g                      # Данные текущего запроса
 )
 
 # Дополнительные библиотеки
-from werkzeug.utils import secure_filename  # Безопасная обработка имен файлов
+from werkzeug.security import safe_join     # Проверка путей для X-Accel-Redirect
+from werkzeug.exceptions import HTTPException, NotFound  # HTTP-ошибки (abort, send_from_directory)
 from PIL import Image                       # Обработка изображений (Pillow)
 from dotenv import load_dotenv              # Загрузка переменных окружения
+import psycopg2                             # Типы ошибок PostgreSQL
 
 # Загружаем переменные окружения из .env файла
 # Это должно быть выполнено ДО импорта наших модулей
 load_dotenv()
 
+# Логгер модуля: сообщения передаются корневому логгеру, который
+# настраивает setup_logging(). Параметры сообщений передаются отдельно
+# (logger.error('...: %s', e)) и форматируются только при выводе записи
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # ИМПОРТЫ МОДУЛЕЙ ПРОЕКТА
 # ============================================================================
 
 # Модуль работы с базой данных PostgreSQL
 from db import (
-    connect_db,           # Подключение к базе данных
-    close_db,             # Закрытие соединения с БД
-    save_image,           # Сохранение метаданных изображения
+    db_cursor,            # Курсор на соединении из пула
+    save_images_bulk,     # Сохранение метаданных нескольких изображений
     get_images_list,      # Получение списка изображений
     get_total_images,     # Подсчет общего количества изображений
     get_image_by_id,      # Получение изображения по ID
+    get_images_by_ids,    # Получение нескольких изображений одним запросом
     delete_image,         # Удаление изображения из БД
+    delete_images_bulk,   # Удаление нескольких изображений одним запросом
     create_table_images,  # Создание таблицы изображений
     create_table_users,   # Создание таблицы пользователей
     register_user,        # Регистрация нового пользователя
@@ -78,8 +104,14 @@ from db import (
 # ============================================================================
 
 # Пул соединений для высокой производительности
-# Временно отключен из-за проблем с кодировкой
-# from db_pool import db_pool, get_pool_metrics
+# Пул создается при импорте; если БД недоступна при старте, приложение
+# работает через прямые соединения (db.db_cursor повторит попытку позже)
+try:
+    from db_pool import db_pool, get_pool_metrics
+    DB_POOL_AVAILABLE = True
+except Exception as e:
+    DB_POOL_AVAILABLE = False
+    logger.warning("Database pool not available: %s", e)
 
 # Асинхронная обработка задач
 try:
@@ -87,7 +119,7 @@ try:
     CELERY_AVAILABLE = True
 except ImportError:
     CELERY_AVAILABLE = False
-    logging.warning("Celery not available. Async processing disabled.")
+    logger.warning("Celery not available. Async processing disabled.")
 
 # Мониторинг производительности
 from monitoring import (
@@ -106,7 +138,21 @@ try:
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    logging.warning("Redis components not available. Using fallback options.")
+    logger.warning("Redis components not available. Using fallback options.")
+
+# msgpack для компактного хранения метаданных ссылок в Redis (опционально)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# orjson для JSON-ответов API временных ссылок (опционально)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Модуль статистики и администрирования
 from admin_db import (
@@ -119,11 +165,15 @@ from admin_db import (
     get_statistics_with_filters, # Статистика с фильтрами
     get_statistics_count,     # Подсчет записей статистики
     get_unique_action_types as get_action_types,  # Типы действий
-    get_unique_users as get_all_users             # Все пользователи
+    get_unique_users as get_all_users,            # Все пользователи
+    init_statistics_cache,    # Подключение кэша к функциям статистики
+    get_statistics_buffer_stats, # Состояние буфера записи статистики
+    flush_statistics          # Запись остатка буфера при завершении
 )
 
 # Модуль административных функций
 from admin_app import (
+    ADMIN_EMAILS,          # Множество email администраторов
     is_admin,              # Проверка прав администратора
     inject_admin_status,   # Внедрение статуса админа в контекст
     admin_statistics       # Административная статистика
@@ -137,6 +187,12 @@ from flash_utils import (
     flash_summary_message      # Универсальные сводные сообщения
 )
 
+# Утилиты для создания ZIP-архивов с изображениями
+from archive_utils import (
+    stream_zip,                # Потоковое формирование ZIP-архива
+    stored_zip_size            # Размер архива без сжатия, известный заранее
+)
+
 # Модуль конфигурации логирования
 from logging_config import (
     setup_logging,         # Настройка системы логирования
@@ -167,13 +223,17 @@ app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 50 * 1024
 # Настройка Redis соединения
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 
+# Клиент без decode_responses для двоичных данных (метаданные ссылок в msgpack)
+share_redis_client = None
+
 if REDIS_AVAILABLE:
     try:
         # Инициализация Redis клиента
         redis_client = redis.from_url(REDIS_URL, decode_responses=True)
         # Проверка соединения
         redis_client.ping()
-        logging.info("Redis connection established")
+        share_redis_client = redis.from_url(REDIS_URL)
+        logger.info("Redis connection established")
         
         # Конфигурация сессий с Redis
         app.config['SESSION_TYPE'] = 'redis'
@@ -194,7 +254,7 @@ if REDIS_AVAILABLE:
         }
         
     except Exception as e:
-        logging.error(f"Redis connection failed: {e}")
+        logger.error("Redis connection failed: %s", e)
         redis_client = None
         REDIS_AVAILABLE = False
         
@@ -205,7 +265,7 @@ if not REDIS_AVAILABLE:
         'CACHE_TYPE': 'simple',
         'CACHE_DEFAULT_TIMEOUT': 300
     }
-    logging.warning("Using filesystem sessions and simple cache (not recommended for production)")
+    logger.warning("Using filesystem sessions and simple cache (not recommended for production)")
 
 # Инициализация сессий и кэша
 if REDIS_AVAILABLE:
@@ -214,6 +274,9 @@ if REDIS_AVAILABLE:
 else:
     cache = None
 
+# Метрики панели администратора кэшируются в Redis (если он доступен)
+init_statistics_cache(cache)
+
 # Папка для хранения загруженных изображений
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'images')
 
@@ -221,6 +284,18 @@ app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'images')
 # Каждый пользователь получает свою подпапку в UPLOAD_FOLDER
 app.config['USER_FOLDERS'] = True
 
+# Отдача файлов изображений обратным прокси вместо Python-процесса.
+# USE_X_SENDFILE=true - заголовок X-Sendfile (Apache, lighttpd), его Flask
+# выставляет сам в send_from_directory.
+# X_ACCEL_REDIRECT_PREFIX=/_protected/ - заголовок X-Accel-Redirect для nginx,
+# префикс должен совпадать с internal-локацией в nginx.conf.
+# По умолчанию оба выключены и файлы отдает Flask
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+X_ACCEL_REDIRECT_PREFIX: Final[str] = os.getenv('X_ACCEL_REDIRECT_PREFIX', '')
+
+# Срок кэширования изображений по прямой ссылке в браузере и CDN (1 год)
+IMAGE_CACHE_MAX_AGE: Final[int] = 365 * 24 * 3600
+
 # Конфигурация сессий
 # Сессии не сохраняются после закрытия браузера
 app.config['SESSION_PERMANENT'] = False
@@ -231,11 +306,80 @@ app.config['SESSION_TYPE'] = 'filesystem'
 # ИНИЦИАЛИЗАЦИЯ ДИРЕКТОРИЙ
 # ============================================================================
 
-# Создаем необходимые директории, если они не существуют
+# Папка логов нужна сразу: в нее пишет обработчик из setup_logging()
 # exist_ok=True предотвращает ошибку, если директория уже существует
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)  # Папка для изображений
 os.makedirs('logs', exist_ok=True)                       # Папка для логов
-os.makedirs('backups', exist_ok=True)                    # Папка для резервных копий
+
+# Базовая папка загрузок (создается перед первым запросом, поэтому папке
+# пользователя достаточно одного вызова mkdir без обхода родительских каталогов)
+UPLOAD_BASE = Path(app.config['UPLOAD_FOLDER'])
+
+# Остальные директории создаются при первом запросе, а не при импорте:
+# импорт не делает лишних системных вызовов и не падает, если папка
+# загрузок смонтирована только для чтения
+_dirs_ready = False
+_dirs_lock = threading.Lock()
+
+
+@app.before_request
+def ensure_directories():
+    """Создание папок для изображений и резервных копий перед первым запросом."""
+    global _dirs_ready
+    if _dirs_ready:
+        return
+    with _dirs_lock:
+        if not _dirs_ready:
+            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)  # Папка для изображений
+            os.makedirs('backups', exist_ok=True)                    # Папка для резервных копий
+            _dirs_ready = True
+
+
+# Папки пользователей, уже созданные или проверенные этим процессом.
+# Папки не удаляются во время работы приложения, поэтому повторный mkdir
+# при каждой загрузке не нужен (одна запись на пользователя)
+_known_user_folders = set()
+
+
+def ensure_user_folder(email):
+    """
+    Создание персональной папки пользователя, если ее еще нет.
+    
+    Системный вызов выполняется только при первом обращении к папке
+    в текущем процессе.
+    
+    Args:
+        email (str): Email пользователя (имя папки)
+        
+    Returns:
+        str: Путь к папке пользователя
+    """
+    user_folder = str(UPLOAD_BASE / email)
+    if user_folder not in _known_user_folders:
+        os.makedirs(user_folder, exist_ok=True)
+        # set.add атомарен под GIL, отдельная блокировка не нужна
+        _known_user_folders.add(user_folder)
+    return user_folder
+
+
+def list_user_files(email):
+    """
+    Имена файлов в папке пользователя, прочитанные одним проходом scandir.
+    
+    Проверка принадлежности множеству заменяет отдельный stat на каждый
+    файл при подготовке архива. Файл может исчезнуть после проверки -
+    stream_zip пропускает файлы, которые не удалось открыть.
+    
+    Args:
+        email (str): Email пользователя (имя папки)
+        
+    Returns:
+        set: Имена файлов (пустое множество, если папки нет)
+    """
+    try:
+        with os.scandir(UPLOAD_BASE / email) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
 
 
 def get_client_ip():
@@ -247,7 +391,7 @@ def get_client_ip():
     Если заголовки отсутствуют, возвращает прямой IP-адрес.
     
     Проверяемые заголовки (в порядке приоритета):
-    1. HTTP_X_FORWARDED_FOR - стандартный заголовок для прокси
+    1. HTTP_X_FORWARDED_FOR - стандартный заголовок для прокси (берется первый адрес)
     2. HTTP_X_REAL_IP - альтернативный заголовок для Nginx
     3. request.remote_addr - прямое соединение
     
@@ -258,15 +402,101 @@ def get_client_ip():
         >>> get_client_ip()
         '192.168.1.100'
     """
-    # Проверяем заголовок X-Forwarded-For (может содержать несколько IP)
-    if request.environ.get('HTTP_X_FORWARDED_FOR') is not None:
-        return request.environ['HTTP_X_FORWARDED_FOR']
-    # Проверяем заголовок X-Real-IP (содержит один IP)
-    elif request.environ.get('HTTP_X_REAL_IP') is not None:
-        return request.environ['HTTP_X_REAL_IP']
-    # Возвращаем прямой IP-адрес
+    # IP-адрес не меняется в пределах запроса, поэтому вычисляем его один раз
+    if 'client_ip' in g:
+        return g.client_ip
+    
+    # Окружение WSGI читается через прокси request один раз.
+    # X-Forwarded-For имеет вид "client, proxy1, proxy2" - клиент указан первым;
+    # далее X-Real-IP (содержит один IP) и прямой IP-адрес (REMOTE_ADDR,
+    # из которого request.remote_addr и берет значение)
+    env = request.environ
+    g.client_ip = client_ip = (
+        env.get('HTTP_X_FORWARDED_FOR', '').split(',', 1)[0].strip()
+        or env.get('HTTP_X_REAL_IP')
+        or env.get('REMOTE_ADDR')
+    )
+    return client_ip
+
+def get_user_agent():
+    """
+    Получение строки User-Agent клиента для записи статистики.
+    
+    Статистике нужна только исходная строка заголовка, поэтому она
+    берется напрямую из заголовков без обращения к request.user_agent.
+    
+    Returns:
+        str: Значение заголовка User-Agent или 'Unknown'
+    """
+    return request.headers.get('User-Agent', 'Unknown')
+
+
+# Кэш проверки существования пользователя для login_required.
+# Набор пользователей меняется редко, поэтому подтвержденный email
+# считается действительным USER_EXISTS_TTL секунд без запроса к БД
+USER_EXISTS_TTL = 30           # Время жизни записи кэша в секундах
+USER_EXISTS_CACHE_SIZE = 4096  # Максимальное количество записей
+_user_exists_cache = {}        # email -> момент истечения (time.monotonic)
+
+# Подготовленный запрос проверки живет в сессии PostgreSQL (не откатывается
+# вместе с транзакцией), поэтому запоминаем соединения, где он уже создан.
+# Слабые ссылки не удерживают закрытые соединения
+USER_EXISTS_PREPARE_SQL = (
+    "PREPARE user_exists_stmt(text) AS "
+    "SELECT 1 FROM users WHERE email = $1 LIMIT 1"
+)
+_user_exists_prepared = weakref.WeakSet()
+
+
+def _user_exists(email):
+    """
+    Проверка существования пользователя с кэшированием на USER_EXISTS_TTL.
+    
+    Кэшируются только положительные ответы: для несуществующего
+    пользователя сессия все равно очищается.
+    
+    Args:
+        email (str): Email пользователя из сессии
+        
+    Returns:
+        bool: True если пользователь существует в БД
+    """
+    now = time.monotonic()
+    expires = _user_exists_cache.get(email)
+    if expires is not None and expires > now:
+        return True
+    
+    # Достаточно факта наличия строки: поиск идет по первичному ключу
+    # users(email), колонка в ответ не передается. Запрос подготавливается
+    # один раз на соединение, дальше сервер пропускает разбор и планирование
+    with db_cursor() as cur:
+        conn = cur.connection
+        if conn not in _user_exists_prepared:
+            cur.execute(USER_EXISTS_PREPARE_SQL)
+            _user_exists_prepared.add(conn)
+        cur.execute("EXECUTE user_exists_stmt(%s)", (email,))
+        exists = cur.fetchone() is not None
+    
+    if exists:
+        # Простое ограничение размера: при переполнении кэш сбрасывается
+        if len(_user_exists_cache) >= USER_EXISTS_CACHE_SIZE:
+            _user_exists_cache.clear()
+        _user_exists_cache[email] = now + USER_EXISTS_TTL
     else:
-        return request.remote_addr
+        _user_exists_cache.pop(email, None)
+    return exists
+
+
+def _forget_user(email):
+    """
+    Удаление пользователя из кэша проверки (выход, устаревшая сессия).
+    
+    Args:
+        email (str): Email пользователя
+    """
+    if email:
+        _user_exists_cache.pop(email, None)
+
 
 def login_required(f):
     """
@@ -297,29 +527,28 @@ def login_required(f):
         # Это предотвращает доступ с устаревшими сессиями после перезапуска контейнеров
         user_email = session['user_email']
         try:
-            conn = connect_db()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("SELECT email FROM users WHERE email = %s", (user_email,))
-                user_exists = cur.fetchone() is not None
-                cur.close()
-                close_db(conn)
-                
-                # Если пользователь не существует в БД, очищаем сессию и требуем повторного входа
-                if not user_exists:
-                    session.clear()
-                    flash('Ваша сессия устарела. Пожалуйста, войдите в систему заново.', 'warning')
-                    return redirect(url_for('login'))
-            else:
-                # Если нет подключения к БД, требуем повторного входа для безопасности
-                flash('Ошибка подключения к базе данных. Пожалуйста, войдите заново.', 'error')
-                return redirect(url_for('login'))
+            # Результат запоминается в g, чтобы цепочка декораторов в одном
+            # запросе проверяла пользователя один раз; между запросами
+            # работает TTL-кэш _user_exists
+            user_exists = g.get('user_exists')
+            if user_exists is None:
+                user_exists = g.user_exists = _user_exists(user_email)
+        except psycopg2.OperationalError:
+            # Если нет подключения к БД, требуем повторного входа для безопасности
+            flash('Ошибка подключения к базе данных. Пожалуйста, войдите заново.', 'error')
+            return redirect(url_for('login'))
         except Exception:
             # При любых ошибках БД требуем повторного входа для безопасности
             session.clear()
             flash('Произошла ошибка проверки сессии. Пожалуйста, войдите заново.', 'error')
             return redirect(url_for('login'))
         
+        # Если пользователь не существует в БД, очищаем сессию и требуем повторного входа
+        if not user_exists:
+            session.clear()
+            flash('Ваша сессия устарела. Пожалуйста, войдите в систему заново.', 'warning')
+            return redirect(url_for('login'))
+        
         return f(*args, **kwargs)
     return decorated_function
 
@@ -330,8 +559,18 @@ def login_required(f):
 
 # Настройка системы логирования с автоматической ротацией файлов
 setup_logging()          # Основная конфигурация логирования
-setup_monthly_archive()  # Настройка месячного архивирования логов
-cleanup_old_archives()   # Очистка старых архивных файлов
+
+
+def _archive_logs():
+    """Архивирование старых логов и очистка архивов (в фоновом потоке)."""
+    setup_monthly_archive()  # Настройка месячного архивирования логов
+    cleanup_old_archives()   # Очистка старых архивных файлов
+
+
+# Обход и сжатие файлов в logs/ не должны задерживать запуск воркера:
+# логирование уже настроено, а операции идемпотентны - если процесс
+# завершится раньше, работа будет доделана при следующем запуске
+threading.Thread(target=_archive_logs, name='log-archiver', daemon=True).start()
 
 # ============================================================================
 # КОНСТАНТЫ И НАСТРОЙКИ ПРИЛОЖЕНИЯ
@@ -340,18 +579,35 @@ cleanup_old_archives()   # Очистка старых архивных файл
 # Разрешенные расширения файлов для загрузки
 # Поддерживаются только основные форматы изображений для обеспечения безопасности
 # и совместимости с веб-браузерами
-ALLOWED_EXTENSIONS = {
+ALLOWED_EXTENSIONS: Final[frozenset[str]] = frozenset({
     'png',   # Portable Network Graphics - поддержка прозрачности
     'jpeg',  # JPEG - сжатие с потерями, хорошо для фотографий
     'jpg',   # Альтернативное расширение для JPEG
     'gif',   # Graphics Interchange Format - поддержка анимации
     'webp'   # WebP - современный формат изображений, поддерживающий прозрачность
-}
+})
+
+# Суффиксы разрешенных расширений для проверки через str.endswith
+# и длина самого длинного из них (достаточно проверить только хвост имени)
+_ALLOWED_SUFFIXES: Final[tuple[str, ...]] = tuple(sorted('.' + ext for ext in ALLOWED_EXTENSIONS))
+_ALLOWED_SUFFIX_MAX_LEN: Final[int] = max(map(len, _ALLOWED_SUFFIXES))
 
 # Максимальные размеры и ограничения
-MAX_IMAGE_DIMENSION = 4096  # Максимальный размер изображения в пикселях
-MAX_IMAGES_PER_USER = 1000  # Максимальное количество изображений на пользователя
-DEFAULT_STORAGE_DAYS = 30   # Срок хранения по умолчанию (дни)
+MAX_IMAGE_DIMENSION: Final[int] = 4096  # Максимальный размер изображения в пикселях
+MAX_IMAGES_PER_USER: Final[int] = 1000  # Максимальное количество изображений на пользователя
+DEFAULT_STORAGE_DAYS: Final[int] = 30   # Срок хранения по умолчанию (дни)
+UPLOAD_WRITE_BUFFER_SIZE: Final[int] = 1024 * 1024  # Размер блока записи загружаемого файла (1MB)
+UPLOAD_NAME_ATTEMPTS: Final[int] = 100  # Попыток подобрать свободное имя для одноименных файлов
+
+# Пул потоков для файловых операций над несколькими файлами (сохранение
+# при множественной загрузке, удаление при групповом удалении).
+# Небольшое значение по умолчанию не перегружает очередь диска (особенно HDD)
+UPLOAD_WORKERS: Final[int] = int(os.getenv('UPLOAD_WORKERS', '4'))
+_upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+
+# Кэш главной страницы для гостей (в секундах)
+INDEX_CACHE_TTL = 60
+_index_page_cache = {'html': None, 'expires': 0.0}
 
 # Настройки пагинации
 IMAGES_PER_PAGE = 12        # Количество изображений на странице
@@ -384,15 +640,9 @@ def allowed_file(filename):
         >>> allowed_file('image')
         False
     """
-    # Проверяем наличие точки в имени файла
-    if '.' not in filename:
-        return False
-    
-    # Извлекаем расширение файла и приводим к нижнему регистру
-    file_extension = filename.rsplit('.', 1)[1].lower()
-    
-    # Проверяем, что расширение входит в список разрешенных
-    return file_extension in ALLOWED_EXTENSIONS
+    # Приводим к нижнему регистру только хвост имени и сравниваем его
+    # с суффиксами разрешенных расширений (имя без точки не совпадет ни с одним)
+    return filename[-_ALLOWED_SUFFIX_MAX_LEN:].lower().endswith(_ALLOWED_SUFFIXES)
 
 
 # ============================================================================
@@ -431,12 +681,23 @@ def index():
             action_type='главная_страница',
             user_email=user_email,  # Передаем email если пользователь авторизован
             ip_address=get_client_ip(),
-            user_agent=request.headers.get('User-Agent', 'Unknown'),
+            user_agent=get_user_agent(),
             additional_info=f'Посещение главной страницы пользователем {user_email or "гость"}'
         )
     except Exception as e:
         # Не прерываем работу при ошибке логирования
-        logging.warning(f"Failed to log main page visit: {e}")
+        logger.warning("Failed to log main page visit: %s", e)
+    
+    # Для гостя без flash-сообщений страница всегда одинакова, поэтому
+    # отдаем HTML, отрендеренный не более INDEX_CACHE_TTL секунд назад.
+    # Кэш серверный: публичный Cache-Control не ставим, иначе повторные
+    # посещения не доходили бы до приложения и не попадали в статистику
+    if 'user_email' not in session and '_flashes' not in session:
+        now = time.monotonic()
+        if _index_page_cache['html'] is None or _index_page_cache['expires'] <= now:
+            _index_page_cache['html'] = render_template('index.html')
+            _index_page_cache['expires'] = now + INDEX_CACHE_TTL
+        return _index_page_cache['html']
     
     return render_template('index.html')
 
@@ -472,30 +733,26 @@ def register():
         if password and confirm_password and password != confirm_password:
             validation_errors.append('Пароли не совпадают')
         
+        # Ошибки проверки формы не меняют состояние, поэтому форма
+        # отображается сразу, без дополнительного запроса через редирект
         if validation_errors:
             flash_validation_errors(validation_errors, "регистрации")
-            return redirect(url_for('register'))
+            return render_template('register.html'), 400
         
         # Получаем IP-адрес и User-Agent для логирования
         client_ip = get_client_ip()
-        user_agent = request.headers.get('User-Agent', '')
+        user_agent = get_user_agent()
         
         # Проверяем, является ли это попыткой регистрации администратора
-        admin_email = os.getenv('ADMIN_EMAIL', 'admin@example.com')
-        admin_emails_str = os.getenv('ADMIN_EMAILS', 'admin@example.com')
-        admin_emails = [e.strip() for e in admin_emails_str.split(',') if e.strip()]
-        if admin_email not in admin_emails:
-            admin_emails.append(admin_email)
-        
-        is_admin_registration = email in admin_emails
+        # (множество администраторов разбирается один раз при импорте admin_app)
+        is_admin_registration = email in ADMIN_EMAILS
         
         # Регистрация пользователя
         success, message = register_user(email, password)
         if success:
             # Создаем папку для пользователя
-            user_folder = os.path.join(app.config['UPLOAD_FOLDER'], email)
-            os.makedirs(user_folder, exist_ok=True)
-            logging.info(f'Created folder for user: {email}')
+            ensure_user_folder(email)
+            logger.info('Created folder for user: %s', email)
             
             # Логируем успешную регистрацию
             if is_admin_registration:
@@ -565,17 +822,21 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        # Проверка валидности данных
+        # Проверка валидности данных (форма отображается сразу, без редиректа)
         if not email or not password:
             flash('Пожалуйста, заполните все поля', 'warning')
-            return redirect(url_for('login'))
+            return render_template('login.html'), 400
             
+        # Получаем IP-адрес и User-Agent один раз для всех записей статистики
+        client_ip = get_client_ip()
+        user_agent = get_user_agent()
+        
         # Запись статистики попытки входа
         log_statistics(
             action_type='попытка_входа',
             user_email=email,
-            ip_address=get_client_ip(),
-            user_agent=request.user_agent.string
+            ip_address=client_ip,
+            user_agent=user_agent
         )
         
         # Аутентификация пользователя
@@ -587,8 +848,8 @@ def login():
             log_statistics(
                 action_type='успешный_вход',
                 user_email=email,
-                ip_address=get_client_ip(),
-                user_agent=request.user_agent.string
+                ip_address=client_ip,
+                user_agent=user_agent
             )
             
             flash(message, 'success')
@@ -598,8 +859,8 @@ def login():
             log_statistics(
                 action_type='неудачный_вход',
                 user_email=email,
-                ip_address=get_client_ip(),
-                user_agent=request.user_agent.string,
+                ip_address=client_ip,
+                user_agent=user_agent,
                 additional_info=message
             )
             
@@ -619,7 +880,7 @@ def logout():
     Returns:
         Response: Редирект на главную страницу
     """
-    session.pop('user_email', None)
+    _forget_user(session.pop('user_email', None))
     flash('Вы вышли из системы', 'info')
     return redirect(url_for('index'))
 
@@ -635,26 +896,62 @@ def inject_admin_status_processor():
 # НОВЫЕ ENDPOINTS ДЛЯ МОНИТОРИНГА И ОПТИМИЗАЦИИ
 # ============================================================================
 
-@app.route('/health')
-def health_check():
+# Результаты /health и /metrics/json кэшируются на короткое время: частые
+# проверки балансировщика или оркестратора не должны каждый раз занимать
+# соединения пула и обращаться к Redis
+HEALTH_CACHE_TTL = 1.0    # Время жизни результата /health (секунды)
+METRICS_CACHE_TTL = 5.0   # Время жизни результата /metrics/json (секунды)
+_endpoint_cache = {}      # имя endpoint -> (момент истечения, данные, код ответа)
+_endpoint_cache_lock = threading.Lock()
+
+
+def _cached_endpoint(name, ttl, build):
     """
-    Health check endpoint для мониторинга состояния приложения.
+    Возврат JSON-ответа служебного endpoint из кэша с коротким TTL.
     
-    Проверяет:
-    - Состояние приложения Flask
-    - Подключение к базе данных
-    - Состояние пула соединений
-    - Доступность Redis (если используется)
+    Пока запись не устарела, проверки не выполняются. Пересчет идет под
+    блокировкой, поэтому одновременные запросы запускают его один раз.
+    Администратор может запросить свежие данные параметром ?fresh=1.
     
+    Args:
+        name (str): Имя endpoint (ключ кэша)
+        ttl (float): Время жизни результата в секундах
+        build (callable): Функция без аргументов, возвращающая (dict, код ответа)
+        
     Returns:
-        JSON: Статус здоровья системы
+        tuple: (JSON-ответ, HTTP-код)
+    """
+    fresh = request.args.get('fresh') == '1' and is_admin()
+    
+    entry = _endpoint_cache.get(name)
+    if not fresh and entry and entry[0] > time.monotonic():
+        return jsonify(entry[1]), entry[2]
+    
+    with _endpoint_cache_lock:
+        # Пока ждали блокировку, результат мог обновить другой поток
+        entry = _endpoint_cache.get(name)
+        if not fresh and entry and entry[0] > time.monotonic():
+            return jsonify(entry[1]), entry[2]
+        
+        payload, status_code = build()
+        _endpoint_cache[name] = (time.monotonic() + ttl, payload, status_code)
+    
+    return jsonify(payload), status_code
+
+
+def _build_health():
+    """
+    Выполнение проверок состояния приложения для /health.
+    
+    Returns:
+        tuple: (dict со статусом, HTTP-код 200 или 503)
     """
     try:
         # Проверка базы данных
         db_health = db_pool.health_check()
         
-        # Получение метрик пула
-        pool_metrics = get_pool_metrics()
+        # Получение метрик пула (без повторной проверки БД)
+        pool_metrics = get_pool_metrics(db_health)
         
         # Проверка Redis (если доступен)
         redis_health = True
@@ -667,47 +964,108 @@ def health_check():
         # Общий статус
         overall_health = db_health and (redis_health if REDIS_AVAILABLE else True)
         
-        return jsonify({
+        return {
             'status': 'healthy' if overall_health else 'unhealthy',
             'database': 'ok' if db_health else 'error',
             'redis': 'ok' if redis_health else 'error' if REDIS_AVAILABLE else 'not_configured',
             'pool_metrics': pool_metrics,
+            'statistics_buffer': get_statistics_buffer_stats(),
             'timestamp': time.time()
-        }), 200 if overall_health else 503
+        }, 200 if overall_health else 503
         
     except Exception as e:
-        logging.error(f"Health check failed: {e}")
-        return jsonify({
+        logger.error("Health check failed: %s", e)
+        return {
             'status': 'unhealthy',
             'error': str(e),
             'timestamp': time.time()
-        }), 503
+        }, 503
+
+
+@app.route('/health')
+def health_check():
+    """
+    Health check endpoint для мониторинга состояния приложения.
+    
+    Проверяет:
+    - Состояние приложения Flask
+    - Подключение к базе данных
+    - Состояние пула соединений
+    - Доступность Redis (если используется)
+    
+    Результат кэшируется на HEALTH_CACHE_TTL секунд.
+    
+    Returns:
+        JSON: Статус здоровья системы
+    """
+    return _cached_endpoint('health', HEALTH_CACHE_TTL, _build_health)
+
+# Готовый текст Prometheus хранится в байтах (и сразу в gzip): за время
+# жизни буфера повторные опросы отдают его без повторной сериализации
+PROMETHEUS_CACHE_TTL = 1.0   # Время жизни буфера /metrics (секунды)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+_prometheus_cache = {'expires': 0.0, 'body': b'', 'gzip': b''}
+
+
+def _render_prometheus_payload():
+    """
+    Сериализация метрик Prometheus в байты.
+    
+    Returns:
+        bytes: Метрики в текстовом формате Prometheus
+    """
+    # Системные метрики (CPU, память, диск) публикуются в JSON через
+    # /metrics/json; здесь они не использовались и не собираются
+    prometheus_metrics = get_prometheus_metrics()
+    
+    if isinstance(prometheus_metrics, str):
+        prometheus_metrics = prometheus_metrics.encode('utf-8')
+    return prometheus_metrics
+
 
 @app.route('/metrics')
 def metrics():
     """
     Endpoint для получения метрик приложения в формате Prometheus.
     Используется системами мониторинга.
+    
+    Текст метрик пересобирается не чаще раза в PROMETHEUS_CACHE_TTL секунд.
+    Клиентам с Accept-Encoding: gzip отдается заранее сжатая версия.
     """
     try:
-        # Получаем метрики в формате Prometheus
-        prometheus_metrics = get_prometheus_metrics()
-        
-        # Добавляем дополнительные метрики
-        additional_metrics = performance_monitor.get_comprehensive_metrics()
+        cached = _prometheus_cache
+        if cached['expires'] <= time.monotonic():
+            with _endpoint_cache_lock:
+                # Пока ждали блокировку, буфер мог обновить другой поток
+                if _prometheus_cache['expires'] <= time.monotonic():
+                    body = _render_prometheus_payload()
+                    _prometheus_cache.update(
+                        expires=time.monotonic() + PROMETHEUS_CACHE_TTL,
+                        body=body,
+                        gzip=gzip.compress(body, compresslevel=1)
+                    )
+                cached = _prometheus_cache.copy()
         
-        # Возвращаем в формате Prometheus
-        from flask import Response
-        return Response(prometheus_metrics, mimetype='text/plain')
+        # Качество из разобранного Accept-Encoding: 'gzip;q=0' означает отказ от gzip
+        if request.accept_encodings['gzip'] > 0:
+            response = Response(cached['gzip'], mimetype=PROMETHEUS_CONTENT_TYPE)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(cached['body'], mimetype=PROMETHEUS_CONTENT_TYPE)
+        response.vary.add('Accept-Encoding')
+        return response
         
     except Exception as e:
-        logging.error(f"Error generating metrics: {e}")
+        logger.error("Error generating metrics: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/metrics/json')
-def metrics_json():
+
+def _build_metrics_json():
     """
-    Endpoint для получения метрик в JSON формате.
+    Сбор метрик для /metrics/json.
+    
+    Returns:
+        tuple: (dict с метриками, HTTP-код 200 или 500)
     """
     try:
         metrics_data = {
@@ -720,38 +1078,64 @@ def metrics_json():
                 'celery_available': CELERY_AVAILABLE
             }
         }
-        return jsonify(metrics_data)
+        return metrics_data, 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+
+@app.route('/metrics/json')
+def metrics_json():
+    """
+    Endpoint для получения метрик в JSON формате.
+    Результат кэшируется на METRICS_CACHE_TTL секунд.
+    """
+    return _cached_endpoint('metrics_json', METRICS_CACHE_TTL, _build_metrics_json)
+
+def _safe_unlink(file_path):
+    """
+    Удаление файла с диска без ошибки, если файла уже нет.
+    
+    Args:
+        file_path (str): Путь к файлу
+        
+    Returns:
+        bool: True если файл был удален, False если его не было
+    """
+    try:
+        os.unlink(file_path)
+        return True
+    except FileNotFoundError:
+        return False
 
-def process_single_file(file, user_email, user_folder, storage_days):
+
+def _persist_to_disk(file, user_folder, timestamp):
     """
-    Комплексная обработка одного загружаемого файла.
+    Проверка загружаемого файла и сохранение его на диск.
     
-    Выполняет полный цикл обработки файла:
+    Выполняет первую часть обработки файла (без обращения к БД):
     - Проверка размера и формата
     - Генерация безопасного уникального имени
     - Сохранение в файловую систему
     - Валидация как изображения
-    - Сохранение метаданных в БД
-    - Логирование статистики
     
     Args:
         file: Объект загружаемого файла из Flask request
-        user_email (str): Email пользователя-владельца
         user_folder (str): Путь к папке пользователя
-        storage_days (int): Количество дней хранения файла
+        timestamp (str): Время загрузки для имени файла, общее для всех
+                         файлов запроса (формат '%Y-%m-%d_%H-%M-%S')
     
     Returns:
-        dict: Результат обработки с ключами:
+        dict: Результат с ключами:
             - success (bool): Успешность операции
             - filename (str): Имя сохраненного файла (при успехе)
             - original_name (str): Оригинальное имя файла (при успехе)
-            - url (str): URL для доступа к файлу (при успехе)
+            - file_path (str): Путь к сохраненному файлу (при успехе)
             - size (int): Размер файла в байтах (при успехе)
-            - file_id (int): ID файла в БД (при успехе)
+            - file_type (str): Тип файла по расширению (при успехе)
+            - crc32 (int): Контрольная сумма CRC-32 содержимого (при успехе)
             - error (str): Описание ошибки (при неудаче)
     """
+    created_path = None
     try:
         # Проверка размера файла
         file.seek(0, 2)
@@ -771,88 +1155,167 @@ def process_single_file(file, user_email, user_folder, storage_days):
                 'error': f'Неподдерживаемый формат файла. Разрешены: {", ".join(ALLOWED_EXTENSIONS)}'
             }
         
-        # Генерация безопасного имени файла
-        base_name, ext_name = os.path.splitext(file.filename)
-        safe_filename = secure_filename(base_name) + ext_name
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        new_filename = f"{base_name}_(Foto-Hosting_{timestamp}){ext_name}"
-        
-        file_path = os.path.join(user_folder, new_filename)
-        
-        # Сохранение файла
-        file.save(file_path)
-        logging.info(f'File {new_filename} successfully saved to {file_path}')
-        
-        # Проверка, что файл является изображением
-        with Image.open(file_path) as img:
+        # Генерация уникального имени файла. allowed_file уже гарантировал
+        # наличие расширения, поэтому хватает одного rpartition; результат
+        # secure_filename здесь нигде не использовался и больше не вычисляется
+        base_name, _, extension = file.filename.rpartition('.')
+        ext_name = '.' + extension
+        
+        # Проверка, что файл является изображением - прямо по загруженному
+        # потоку (в памяти или во временном файле Werkzeug), до записи на диск.
+        # Так файл не приходится перечитывать с диска после сохранения
+        stream = file.stream
+        stream.seek(0)
+        with Image.open(stream) as img:
             img.verify()
-            actual_size = os.path.getsize(file_path)
-            logging.info(f'File {new_filename} successfully verified as an image (size: {actual_size} bytes)')
-        
-        # Сохранение метаданных в базу данных
-        file_type = ext_name.lower().replace('.', '')
-        upload_time = datetime.now()
-        try:
-            save_image(new_filename, file.filename, actual_size, upload_time, file_type, user_email, storage_days)
-        except Exception as db_error:
-            # Проверяем, если ошибка связана с foreign key constraint (пользователь не существует)
-            if "foreign key constraint" in str(db_error) and "user_email" in str(db_error):
-                # Удаляем загруженный файл
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # Очищаем сессию и перенаправляем на главную страницу
-                session.clear()
-                raise Exception("Сессия пользователя устарела. Пожалуйста, войдите в систему заново.")
-            else:
-                # Если это другая ошибка БД, пробрасываем её дальше
-                raise db_error
-        
-        # Получение ID загруженного изображения
-        conn = connect_db()
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM images WHERE filename = %s ORDER BY upload_time DESC LIMIT 1", (new_filename,))
-        file_id = cur.fetchone()[0] if cur.rowcount > 0 else None
-        cur.close()
-        close_db(conn)
-        
-        # Запись статистики успешной загрузки
-        log_statistics(
-            action_type='успешная_загрузка',
-            user_email=user_email,
-            file_id=file_id,
-            ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
-            additional_info=f"Size: {actual_size} bytes, Type: {file_type}, Storage: {storage_days} days"
-        )
-        
-        # Генерация URL
-        image_url = url_for('get_image', user_email=user_email, filename=new_filename, _external=True)
-        view_url = url_for('view_image', user_email=user_email, filename=new_filename, _external=True)
-        download_url = url_for('download_image', user_email=user_email, filename=new_filename, _external=True)
+        logger.info('File %s successfully verified as an image (size: %s bytes)', file.filename, file_size)
+        
+        # Файл создается в режиме 'xb': одноименные файлы одного запроса
+        # (время в имени общее и с точностью до секунды) сохраняются
+        # параллельно, и существующий файл нельзя перезаписать - вместо
+        # этого к имени добавляется номер
+        suffix = ''
+        for attempt in range(2, UPLOAD_NAME_ATTEMPTS + 2):
+            new_filename = f"{base_name}_(Foto-Hosting_{timestamp}{suffix}){ext_name}"
+            file_path = os.path.join(user_folder, new_filename)
+            try:
+                destination = open(file_path, 'xb')
+                break
+            except FileExistsError:
+                suffix = f'_{attempt}'
+        else:
+            raise FileExistsError(f'Could not create a unique file name for {file.filename}')
+        created_path = file_path
+        
+        # Сохранение файла крупными блоками: файл до 5MB записывается
+        # несколькими вызовами write вместо сотен по 16KB. Попутно считается
+        # CRC-32: с ним файл упаковывается в ZIP без повторного чтения для CRC
+        stream.seek(0)
+        crc32 = 0
+        with destination:
+            while chunk := stream.read(UPLOAD_WRITE_BUFFER_SIZE):
+                crc32 = zlib.crc32(chunk, crc32)
+                destination.write(chunk)
+        logger.info('File %s successfully saved to %s', new_filename, file_path)
         
         return {
             'success': True,
             'filename': new_filename,
             'original_name': file.filename,
-            'url': image_url,
-            'view_url': view_url,
-            'download_url': download_url,
-            'size': actual_size,
-            'file_id': file_id
+            'file_path': file_path,
+            # Размер уже известен из проверки выше, повторный stat не нужен
+            'size': file_size,
+            'file_type': extension.lower(),
+            'crc32': crc32
         }
         
     except Exception as e:
-        # Удаляем файл в случае ошибки
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-            logging.error(f'File {new_filename if "new_filename" in locals() else file.filename} deleted due to error: {str(e)}')
+        # Удаляем файл в случае ошибки - только созданный этим вызовом:
+        # файл с тем же именем мог сохранить другой поток
+        if created_path is not None:
+            try:
+                os.remove(created_path)
+            except FileNotFoundError:
+                pass
+            logger.error('File %s deleted due to error: %s', created_path, e)
         
-        logging.error(f'Error processing file {file.filename}: {str(e)}')
+        logger.error('Error processing file %s: %s', file.filename, e)
         return {
             'success': False,
             'error': f'Ошибка при обработке файла: {str(e)}'
         }
 
+
+# Подстановка имени файла в шаблоны ссылок _bulk_commit и символы,
+# которые Werkzeug не экранирует в сегментах пути
+_FILENAME_PLACEHOLDER: Final[str] = '__filename__'
+_URL_SAFE_CHARS: Final[str] = "!$&'()*+,:;=@"
+
+def _bulk_commit(saved_files, user_email, storage_days, upload_time):
+    """
+    Сохранение метаданных всех сохраненных на диск файлов одной транзакцией.
+    
+    Вместо отдельного INSERT на каждый файл все записи вставляются
+    одним запросом (db.save_images_bulk). Если транзакция не удалась,
+    файлы удаляются с диска, чтобы не оставлять файлы без записей в БД.
+    
+    Args:
+        saved_files (list): Результаты _persist_to_disk с success=True
+        user_email (str): Email пользователя-владельца
+        storage_days (int): Количество дней хранения файлов
+        upload_time (datetime): Время загрузки, общее для всех файлов запроса
+    
+    Returns:
+        list: Словари загруженных файлов с ключами filename, original_name,
+              url, view_url, download_url, size, file_id
+    
+    Raises:
+        Exception: При ошибке БД; при устаревшей сессии (пользователь
+                   удален из БД) - с сообщением "Сессия пользователя устарела..."
+    """
+    rows = [
+        (meta['filename'], meta['original_name'], meta['size'], upload_time,
+         meta['file_type'], user_email, storage_days, meta['crc32'])
+        for meta in saved_files
+    ]
+    
+    try:
+        file_ids = save_images_bulk(rows)
+    except Exception as db_error:
+        # Удаляем файлы, для которых не удалось сохранить записи
+        for meta in saved_files:
+            if os.path.exists(meta['file_path']):
+                os.remove(meta['file_path'])
+        
+        # Проверяем, если ошибка связана с foreign key constraint (пользователь не существует)
+        if "foreign key constraint" in str(db_error) and "user_email" in str(db_error):
+            # Очищаем сессию и перенаправляем на главную страницу
+            _forget_user(user_email)
+            session.clear()
+            raise Exception("Сессия пользователя устарела. Пожалуйста, войдите в систему заново.")
+        
+        # Если это другая ошибка БД, пробрасываем её дальше
+        raise
+    
+    # Шаблоны ссылок строятся через url_for один раз на запрос, а не трижды
+    # на каждый файл: email владельца общий, меняется только имя файла.
+    # Имя экранируется так же, как это делает маршрутизация Werkzeug
+    url_templates = {
+        key: url_for(endpoint, user_email=user_email, filename=_FILENAME_PLACEHOLDER, _external=True)
+        for key, endpoint in (('url', 'get_image'), ('view_url', 'view_image'), ('download_url', 'download_image'))
+    }
+    
+    # IP и User-Agent одинаковы для всех файлов запроса
+    client_ip = get_client_ip()
+    user_agent = get_user_agent()
+    
+    uploaded_files = []
+    for meta, file_id in zip(saved_files, file_ids):
+        # Запись статистики успешной загрузки (события буферизуются
+        # и записываются в БД пачками фоновым потоком)
+        log_statistics(
+            action_type='успешная_загрузка',
+            user_email=user_email,
+            file_id=file_id,
+            ip_address=client_ip,
+            user_agent=user_agent,
+            additional_info=f"Size: {meta['size']} bytes, Type: {meta['file_type']}, Storage: {storage_days} days"
+        )
+        
+        # Генерация URL
+        new_filename = meta['filename']
+        quoted_filename = quote(new_filename, safe=_URL_SAFE_CHARS)
+        uploaded_files.append({
+            'filename': new_filename,
+            'original_name': meta['original_name'],
+            **{key: template.replace(_FILENAME_PLACEHOLDER, quoted_filename)
+               for key, template in url_templates.items()},
+            'size': meta['size'],
+            'file_id': file_id
+        })
+    
+    return uploaded_files
+
 @app.route('/statistics')
 @login_required
 def view_statistics():
@@ -939,7 +1402,7 @@ def upload_file():
     - Проверяет формат и размер
     - Создает уникальное имя с временной меткой
     - Сохраняет в персональную папку пользователя
-    - Записывает метаданные в БД
+    - Записывает метаданные в БД (все файлы запроса - одной транзакцией)
     - Логирует статистику
     
     Returns:
@@ -963,7 +1426,7 @@ def upload_file():
         files = request.files.getlist('file')
         
         if not files or all(f.filename == '' for f in files):
-            logging.warning('Upload attempt without selecting files')
+            logger.warning('Upload attempt without selecting files')
             flash('Файлы не выбраны', 'warning')
             
             # Запись статистики ошибки загрузки
@@ -971,7 +1434,7 @@ def upload_file():
                 action_type='upload_error',
                 user_email=session['user_email'],
                 ip_address=get_client_ip(),
-                user_agent=request.user_agent.string,
+                user_agent=get_user_agent(),
                 additional_info='Нет выбранных файлов'
             )
             
@@ -982,29 +1445,48 @@ def upload_file():
         storage_days = 30 if storage_period == '30' else 15
         
         user_email = session['user_email']
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-        os.makedirs(user_folder, exist_ok=True)
+        user_folder = ensure_user_folder(user_email)
         
         uploaded_files = []
         failed_files = []
+        saved_files = []
         
-        for file in files:
-            if file.filename == '':
-                continue
-                
+        # Сначала проверяем и сохраняем на диск все файлы. Запись на диск
+        # отпускает GIL, поэтому несколько файлов обрабатываются параллельно
+        # (не более UPLOAD_WORKERS одновременно); map сохраняет порядок файлов
+        files = [file for file in files if file.filename != '']
+        
+        # Время загрузки берется один раз на запрос: оно входит в имена
+        # файлов и в upload_time записей БД
+        upload_time = datetime.now()
+        timestamp = upload_time.strftime('%Y-%m-%d_%H-%M-%S')
+        if len(files) > 1:
+            results = _upload_pool.map(
+                _persist_to_disk, files, [user_folder] * len(files), [timestamp] * len(files)
+            )
+        else:
+            results = [_persist_to_disk(file, user_folder, timestamp) for file in files]
+        
+        for file, result in zip(files, results):
+            if result['success']:
+                saved_files.append(result)
+            else:
+                failed_files.append({'filename': file.filename, 'error': result['error']})
+        
+        # Затем записываем метаданные всех сохраненных файлов одной транзакцией
+        if saved_files:
             try:
-                result = process_single_file(file, user_email, user_folder, storage_days)
-                if result['success']:
-                    uploaded_files.append(result)
-                else:
-                    failed_files.append({'filename': file.filename, 'error': result['error']})
+                uploaded_files = _bulk_commit(saved_files, user_email, storage_days, upload_time)
             except Exception as e:
-                logging.error(f'Error processing file {file.filename}: {str(e)}')
+                logger.error('Error saving uploaded files for user %s: %s', user_email, e)
                 # Проверяем, если ошибка связана с устаревшей сессией
                 if "Сессия пользователя устарела" in str(e):
                     flash('Ваша сессия устарела. Пожалуйста, войдите в систему заново.', 'warning')
                     return redirect(url_for('login'))
-                failed_files.append({'filename': file.filename, 'error': str(e)})
+                failed_files.extend(
+                    {'filename': meta['original_name'], 'error': f'Ошибка при обработке файла: {str(e)}'}
+                    for meta in saved_files
+                )
         
         # Результаты загрузки
         # Используем группировку flash-сообщений вместо множественных отдельных сообщений
@@ -1046,19 +1528,15 @@ def view_image(user_email, filename):
     Returns:
         Response: Перенаправление на изображение
     """
-    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-    file_path = os.path.join(user_folder, filename)
-    
-    if not os.path.exists(file_path):
-        logging.warning(f'Attempt to view non-existent file: {filename} for user: {user_email}')
-        abort(404)
+    # Наличие файла здесь не проверяем: get_image после редиректа
+    # сам вернет 404 и запишет предупреждение в лог
     
     # Записываем статистику просмотра только при явном действии пользователя
     log_statistics(
         action_type='просмотр_изображения',
         user_email=session.get('user_email', 'anonymous'),
         ip_address=get_client_ip(),
-        user_agent=request.user_agent.string,
+        user_agent=get_user_agent(),
         additional_info=f'Image: {filename}, Owner: {user_email}'
     )
     
@@ -1085,42 +1563,85 @@ def download_image(user_email, filename):
         action_type='download',
         user_email=session.get('user_email', 'anonymous'),
         ip_address=get_client_ip(),
-        user_agent=request.user_agent.string,
+        user_agent=get_user_agent(),
         additional_info=f'Download: {filename}, Owner: {user_email}'
     )
     
     # Перенаправляем на фактическое скачивание
     return redirect(url_for('get_image', user_email=user_email, filename=filename))
 
-@app.route('/images/<user_email>/<filename>')
-def get_image(user_email, filename):
+def _send_user_image(user_email, filename):
     """
-    Прямой доступ к изображениям без записи статистики.
+    Отправка файла из папки пользователя.
     
-    Позволяет получить изображение по URL вида /images/user@email.com/filename.jpg
-    без записи статистики. Статистика скачиваний ведется только через кнопку "Скачать".
+    При заданном X_ACCEL_REDIRECT_PREFIX возвращает пустой ответ с заголовком
+    X-Accel-Redirect: байты файла nginx отдает сам через sendfile, минуя Python.
+    Это предпочтительный вариант, когда перед приложением стоит nginx.
+    
+    Иначе используется send_from_directory (с учетом USE_X_SENDFILE) в режиме
+    conditional: ответ поддерживает 304 и Range, а файл передается через
+    wsgi.file_wrapper, который Gunicorn отправляет системным вызовом sendfile
+    (включен по умолчанию, отключается только флагом --no-sendfile).
     
     Args:
-        user_email (str): Email пользователя-владельца изображения
+        user_email (str): Email владельца (имя папки)
         filename (str): Имя файла изображения
     
     Returns:
-        Response: Файл изображения или 404 если файл не найден
+        Response: Ответ с файлом или с заголовком для обратного прокси
     """
     user_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-    file_path = os.path.join(user_folder, filename)
     
-    if not os.path.exists(file_path):
-        logging.warning(f'Attempt to access non-existent file: {filename} for user: {user_email}')
+    if not X_ACCEL_REDIRECT_PREFIX:
+        return send_from_directory(user_folder, filename, conditional=True, etag=True)
+    
+    # safe_join отсекает '..' и абсолютные пути в имени папки и файла
+    if safe_join(X_ACCEL_REDIRECT_PREFIX, user_email, filename) is None:
         abort(404)
     
-    return send_from_directory(user_folder, filename)
+    response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = (
+        f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(user_email)}/{quote(filename)}"
+    )
+    return response
 
-@app.route('/images/<filename>')
-@login_required
-def uploaded_file(filename):
+@app.route('/images/<user_email>/<filename>')
+def get_image(user_email, filename):
     """
-    Защищенный доступ к изображениям текущего пользователя.
+    Прямой доступ к изображениям без записи статистики.
+    
+    Позволяет получить изображение по URL вида /images/user@email.com/filename.jpg
+    без записи статистики. Статистика скачиваний ведется только через кнопку "Скачать".
+    
+    Args:
+        user_email (str): Email пользователя-владельца изображения
+        filename (str): Имя файла изображения
+    
+    Returns:
+        Response: Файл изображения или 404 если файл не найден
+    """
+    # send_from_directory сам проверяет файл и бросает NotFound,
+    # отдельный os.path.exists дал бы лишний stat на каждый запрос
+    try:
+        response = _send_user_image(user_email, filename)
+    except NotFound:
+        logger.warning('Attempt to access non-existent file: %s for user: %s', filename, user_email)
+        raise
+    
+    # Имя файла содержит время загрузки, и содержимое по этому URL больше
+    # не меняется: браузеры и CDN могут хранить его год без перепроверки.
+    # ETag и Last-Modified выставляет send_from_directory (conditional=True
+    # по умолчанию), повторные запросы получают 304 Not Modified
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_CACHE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/images/<filename>')
+@login_required
+def uploaded_file(filename):
+    """
+    Защищенный доступ к изображениям текущего пользователя.
     
     Позволяет авторизованному пользователю получить доступ к своим изображениям
     по короткому URL вида /images/filename.jpg
@@ -1138,16 +1659,14 @@ def uploaded_file(filename):
     """
     # Проверяем, что файл принадлежит текущему пользователю
     user_email = session['user_email']
-    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-    file_path = os.path.join(user_folder, filename)
     
-    if not os.path.exists(file_path):
-        logging.warning(f'Attempt to access non-existent file: {filename} by user: {user_email}')
+    # Возвращаем файл напрямую из папки пользователя
+    try:
+        return _send_user_image(user_email, filename)
+    except NotFound:
+        logger.warning('Attempt to access non-existent file: %s by user: %s', filename, user_email)
         flash('Файл не найден или у вас нет доступа к нему', 'error')
         return redirect(url_for('images_list'))
-    
-    # Возвращаем файл напрямую из папки пользователя
-    return send_from_directory(user_folder, filename)
 
 
 @app.route('/images-list')
@@ -1199,7 +1718,7 @@ def images_list():
             return redirect(url_for('login'))
         else:
             # Если это другая ошибка БД, логируем и показываем общую ошибку
-            logging.error(f'Error getting user images: {str(e)}')
+            logger.error('Error getting user images: %s', e)
             flash('Произошла ошибка при загрузке изображений.', 'error')
             return redirect(url_for('login'))
 
@@ -1241,7 +1760,7 @@ def delete_image_route(id):
             user_email=session['user_email'],
             file_id=id,
             ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
+            user_agent=get_user_agent(),
             additional_info='Изображение не найдено'
         )
         
@@ -1252,7 +1771,7 @@ def delete_image_route(id):
     image_user_email = image[6]  # Индекс user_email в результате запроса
     
     if image_user_email != user_email:
-        logging.warning(f'User {user_email} attempted to delete image {id} belonging to {image_user_email}')
+        logger.warning('User %s attempted to delete image %s belonging to %s', user_email, id, image_user_email)
         flash('У вас нет прав для удаления этого изображения', 'error')
         
         # Запись статистики ошибки доступа при удалении
@@ -1261,7 +1780,7 @@ def delete_image_route(id):
             user_email=user_email,
             file_id=id,
             ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
+            user_agent=get_user_agent(),
             additional_info=f'Попытка удаления изображения пользователя {image_user_email}'
         )
         
@@ -1274,11 +1793,11 @@ def delete_image_route(id):
     try:
         if os.path.exists(file_path):
             os.remove(file_path)
-            logging.info(f'File {filename} deleted from disk for user {user_email}')
+            logger.info('File %s deleted from disk for user %s', filename, user_email)
         
         # Удаляем запись из базы данных
         delete_image(id)
-        logging.info(f'Image with ID {id} deleted from database for user {user_email}')
+        logger.info('Image with ID %s deleted from database for user %s', id, user_email)
         
         # Запись статистики успешного удаления
         log_statistics(
@@ -1286,13 +1805,13 @@ def delete_image_route(id):
             user_email=user_email,
             file_id=id,
             ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
+            user_agent=get_user_agent(),
             additional_info=f'Удалено изображение {filename}'
         )
         
         flash('Изображение успешно удалено', 'success')
     except Exception as e:
-        logging.error(f'Error deleting image with ID {id} for user {user_email}: {str(e)}')
+        logger.error('Error deleting image with ID %s for user %s: %s', id, user_email, e)
         flash('Ошибка при удалении изображения', 'error')
         
         # Запись статистики ошибки при удалении
@@ -1301,7 +1820,7 @@ def delete_image_route(id):
             user_email=user_email,
             file_id=id,
             ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
+            user_agent=get_user_agent(),
             additional_info=f'Ошибка: {str(e)}'
         )
     
@@ -1347,81 +1866,92 @@ def delete_multiple_images():
     failed_deletions = 0
     deleted_filenames = []
     
-    for image_id in image_ids:
-        try:
-            # Получаем информацию об изображении
-            image = get_image_by_id(int(image_id))
+    def log_delete_error(file_id, action_type, additional_info):
+        """Запись статистики неудачного удаления одного изображения."""
+        log_statistics(
+            action_type=action_type,
+            user_email=user_email,
+            file_id=file_id,
+            ip_address=get_client_ip(),
+            user_agent=get_user_agent(),
+            additional_info=additional_info
+        )
+    
+    # Разбираем ID (повторы убираем, порядок сохраняем)
+    requested_ids = []
+    for image_id in dict.fromkeys(image_ids):
+        if image_id.isdigit():
+            requested_ids.append(int(image_id))
+        else:
+            logger.warning('Invalid image ID %s in bulk deletion for user %s', image_id, user_email)
+            failed_deletions += 1
+            log_delete_error(0, 'delete_error', f'Ошибка группового удаления: некорректный ID {image_id}')
+    
+    # ID, судьба которых еще не определена: при ошибке БД они считаются неудачными
+    pending_ids = requested_ids
+    try:
+        # Получаем информацию обо всех изображениях одним запросом
+        images = {image[0]: image for image in get_images_by_ids(requested_ids)}
+        
+        owned_ids = []
+        for image_id in requested_ids:
+            image = images.get(image_id)
             if not image:
-                logging.warning(f'Image with ID {image_id} not found for user {user_email}')
+                logger.warning('Image with ID %s not found for user %s', image_id, user_email)
                 failed_deletions += 1
-                
-                # Запись статистики ошибки удаления
-                log_statistics(
-                    action_type='delete_error',
-                    user_email=user_email,
-                    file_id=int(image_id),
-                    ip_address=get_client_ip(),
-                    user_agent=request.user_agent.string,
-                    additional_info='Изображение не найдено при групповом удалении'
-                )
+                log_delete_error(image_id, 'delete_error', 'Изображение не найдено при групповом удалении')
                 continue
             
             # Проверяем принадлежность изображения текущему пользователю
             image_user_email = image[6]  # Индекс user_email в результате запроса
-            
             if image_user_email != user_email:
-                logging.warning(f'User {user_email} attempted to delete image {image_id} belonging to {image_user_email} in bulk operation')
+                logger.warning('User %s attempted to delete image %s belonging to %s in bulk operation', user_email, image_id, image_user_email)
                 failed_deletions += 1
-                
-                # Запись статистики ошибки доступа при удалении
-                log_statistics(
-                    action_type='delete_access_denied',
-                    user_email=user_email,
-                    file_id=int(image_id),
-                    ip_address=get_client_ip(),
-                    user_agent=request.user_agent.string,
-                    additional_info=f'Попытка группового удаления изображения пользователя {image_user_email}'
-                )
+                log_delete_error(image_id, 'delete_access_denied', f'Попытка группового удаления изображения пользователя {image_user_email}')
                 continue
             
-            # Удаляем физический файл
-            filename = image[1]  # Получаем имя файла из результата запроса
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
-            
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logging.info(f'File {filename} deleted from disk for user {user_email} (bulk operation)')
-            
-            # Удаляем запись из базы данных
-            delete_image(int(image_id))
-            logging.info(f'Image with ID {image_id} deleted from database for user {user_email} (bulk operation)')
-            
-            # Запись статистики успешного удаления
-            log_statistics(
-                action_type='успешное_удаление',
-                user_email=user_email,
-                file_id=int(image_id),
-                ip_address=get_client_ip(),
-                user_agent=request.user_agent.string,
-                additional_info=f'Групповое удаление изображения {filename}'
-            )
-            
-            successful_deletions += 1
-            deleted_filenames.append(filename)
-            
-        except Exception as e:
-            logging.error(f'Error deleting image with ID {image_id} for user {user_email} in bulk operation: {str(e)}')
+            owned_ids.append(image_id)
+        
+        # Удаляем записи из базы данных одним запросом; условие по user_email
+        # повторно защищает от удаления чужих изображений
+        pending_ids = owned_ids
+        deleted = delete_images_bulk(owned_ids, user_email)
+    except Exception as e:
+        logger.error('Error deleting images for user %s in bulk operation: %s', user_email, e)
+        deleted = []
+        for image_id in pending_ids:
             failed_deletions += 1
-            
-            # Запись статистики ошибки при удалении
-            log_statistics(
-                action_type='delete_error',
-                user_email=user_email,
-                file_id=int(image_id) if image_id.isdigit() else 0,
-                ip_address=get_client_ip(),
-                user_agent=request.user_agent.string,
-                additional_info=f'Ошибка группового удаления: {str(e)}'
-            )
+            log_delete_error(image_id, 'delete_error', f'Ошибка группового удаления: {str(e)}')
+    
+    # Удаляем физические файлы: вызовы unlink независимы, поэтому
+    # выполняются параллельно в пуле потоков файловых операций
+    file_paths = [os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename) for _, filename in deleted]
+    if len(file_paths) > 1:
+        removed = list(_upload_pool.map(_safe_unlink, file_paths))
+    else:
+        removed = [_safe_unlink(path) for path in file_paths]
+    
+    # IP и User-Agent одинаковы для всех удаляемых изображений
+    client_ip = get_client_ip()
+    user_agent = get_user_agent()
+    
+    for (image_id, filename), file_removed in zip(deleted, removed):
+        logger.info('Image with ID %s deleted from database for user %s (bulk operation)', image_id, user_email)
+        if file_removed:
+            logger.info('File %s deleted from disk for user %s (bulk operation)', filename, user_email)
+        
+        # Запись статистики успешного удаления
+        log_statistics(
+            action_type='успешное_удаление',
+            user_email=user_email,
+            file_id=image_id,
+            ip_address=client_ip,
+            user_agent=user_agent,
+            additional_info=f'Групповое удаление изображения {filename}'
+        )
+        
+        successful_deletions += 1
+        deleted_filenames.append(filename)
 
     # Показываем результат операции
     flash_bulk_operation_result(
@@ -1432,13 +1962,73 @@ def delete_multiple_images():
     
     # Дополнительная информация о удаленных файлах
     if successful_deletions > 0:
-        logging.info(f'Bulk deletion completed for user {user_email}: {successful_deletions} successful, {failed_deletions} failed')
+        logger.info('Bulk deletion completed for user %s: %s successful, %s failed', user_email, successful_deletions, failed_deletions)
         if len(deleted_filenames) <= 3:  # Показываем имена файлов только если их немного
             flash(f'Удалены файлы: {", ".join(deleted_filenames)}', 'info')
     
     return redirect(url_for('images_list'))
 
 
+# Архивы, файлы которых в сумме не больше этого размера, собираются
+# в памяти и отдаются с Content-Length; большие отдаются потоком
+ZIP_MEMORY_MAX_SIZE: Final[int] = int(os.getenv('ZIP_MEMORY_MAX_SIZE', str(16 * 1024 * 1024)))
+
+
+def _zip_response(archive_entries, archive_name, total_size):
+    """
+    Ответ с ZIP-архивом.
+    
+    Архив формируется генератором archive_utils.stream_zip, временный файл
+    на диске и поток его отложенного удаления не нужны:
+    - небольшие архивы (файлы в сумме до ZIP_MEMORY_MAX_SIZE) собираются
+      в памяти и отдаются через send_file с Content-Length и поддержкой Range:
+      прерванное скачивание по ссылке (GET) докачивается с места обрыва;
+    - большие отдаются потоком: клиент начинает получать данные, пока
+      остальные файлы еще читаются с диска. Если все файлы записываются
+      без сжатия с известной CRC-32 (фотографии по ссылке), размер архива
+      вычисляется заранее по заголовкам: ответ получает Content-Length,
+      ETag и поддержку Range. При докачке начало архива формируется
+      заново и отбрасывается - файлы перечитываются, но по сети
+      повторно не передаются.
+    
+    Args:
+        archive_entries (list): Кортежи (путь к файлу, имя файла в архиве, CRC-32 или None)
+        archive_name (str): Имя архива для скачивания
+        total_size (int): Суммарный размер файлов по данным БД (байты)
+    
+    Returns:
+        Response: Ответ application/zip с Content-Disposition: attachment
+    """
+    if total_size <= ZIP_MEMORY_MAX_SIZE:
+        # Размеры известны заранее, поэтому архив гарантированно помещается
+        # в память (сжатие не увеличивает данные больше чем на доли процента)
+        buffer = io.BytesIO()
+        for chunk in stream_zip(archive_entries):
+            buffer.write(chunk)
+        buffer.seek(0)
+        # Архив из тех же файлов побайтно совпадает (даты берутся из mtime
+        # файлов), поэтому ETag по содержимому позволяет клиенту докачать
+        # его запросом Range с If-Range: при изменении файлов архив придет целиком
+        with buffer.getbuffer() as view:
+            etag = f'{zlib.crc32(view):08x}-{view.nbytes:x}'
+        return send_file(buffer, as_attachment=True, download_name=archive_name,
+                         mimetype='application/zip', conditional=True, etag=etag)
+    
+    archive_size = stored_zip_size(archive_entries)
+    response = Response(stream_zip(archive_entries), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+    if archive_size is None:
+        # Размер сжатого архива заранее не известен - только поток
+        return response
+    
+    # ETag по заголовкам архива (имена, размеры, даты и CRC-32 файлов):
+    # при изменении файлов If-Range не совпадет и архив придет целиком
+    length, headers_crc = archive_size
+    response.content_length = length
+    response.set_etag(f'{headers_crc:08x}-{length:x}')
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+
 @app.route('/download-multiple', methods=['POST'])
 @login_required
 def download_multiple_images():
@@ -1463,13 +2053,8 @@ def download_multiple_images():
         - Создает временный ZIP-архив
         - Добавляет файлы в архив с оригинальными именами
         - Логирует операции в статистику
-        - Отправляет архив пользователю
-        - Удаляет временный файл
+        - Отправляет архив пользователю потоком, без временного файла
     """
-    import zipfile
-    import tempfile
-    from flask import send_file
-    
     # Получаем список ID изображений для скачивания
     image_ids = request.form.getlist('image_ids')
     
@@ -1480,118 +2065,299 @@ def download_multiple_images():
     user_email = session['user_email']
     successful_downloads = 0
     failed_downloads = 0
-    downloaded_filenames = []
-    
-    # Создаем временный ZIP-файл
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
+    archive_entries = []
+    archive_size = 0
+    
+    # IP и User-Agent одинаковы для всех событий запроса
+    client_ip = get_client_ip()
+    user_agent = get_user_agent()
+    
+    # Разбираем ID (повторы убираем, порядок сохраняем)
+    requested_ids = []
+    for image_id in dict.fromkeys(image_ids):
+        if image_id.isdigit():
+            requested_ids.append(int(image_id))
+        else:
+            logger.warning('Invalid image ID %s in bulk download for user %s', image_id, user_email)
+            failed_downloads += 1
     
     try:
-        with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for image_id in image_ids:
-                try:
-                    # Получаем информацию об изображении
-                    image = get_image_by_id(int(image_id))
-                    if not image:
-                        logging.warning(f'Image with ID {image_id} not found for user {user_email}')
-                        failed_downloads += 1
-                        continue
-                    
-                    # Проверяем принадлежность изображения текущему пользователю
-                    image_user_email = image[6]  # Индекс user_email в результате запроса
-                    
-                    if image_user_email != user_email:
-                        logging.warning(f'User {user_email} attempted to download image {image_id} belonging to {image_user_email} in bulk operation')
-                        failed_downloads += 1
-                        continue
-                    
-                    # Получаем пути к файлу
-                    filename = image[1]  # Системное имя файла
-                    original_name = image[2]  # Оригинальное имя файла
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
-                    
-                    if not os.path.exists(file_path):
-                        logging.warning(f'File {filename} not found on disk for user {user_email}')
-                        failed_downloads += 1
-                        continue
-                    
-                    # Добавляем файл в архив с оригинальным именем
-                    zipf.write(file_path, original_name)
-                    
-                    # Запись статистики скачивания
-                    log_statistics(
-                        action_type='download',
-                        user_email=user_email,
-                        file_id=int(image_id),
-                        ip_address=get_client_ip(),
-                        user_agent=request.user_agent.string,
-                        additional_info=f'Групповое скачивание: {original_name}'
-                    )
-                    
-                    successful_downloads += 1
-                    downloaded_filenames.append(original_name)
-                    
-                except Exception as e:
-                    logging.error(f'Error processing image with ID {image_id} for user {user_email} in bulk download: {str(e)}')
-                    failed_downloads += 1
-        
-        # Проверяем, есть ли файлы для скачивания
-        if successful_downloads == 0:
-            flash('Не удалось подготовить файлы для скачивания', 'error')
-            os.unlink(temp_zip.name)  # Удаляем пустой архив
-            return redirect(url_for('images_list'))
-        
-        # Формируем имя архива
-        archive_name = f'images_{user_email}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
-        
-        # Логируем общую операцию группового скачивания
-        log_statistics(
-            action_type='bulk_download',
-            user_email=user_email,
-            ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
-            additional_info=f'Групповое скачивание: {successful_downloads} файлов, {failed_downloads} ошибок'
-        )
-        
-        logging.info(f'Bulk download completed for user {user_email}: {successful_downloads} successful, {failed_downloads} failed')
-        
-        # Отправляем архив пользователю
-        return send_file(
-            temp_zip.name,
-            as_attachment=True,
-            download_name=archive_name,
-            mimetype='application/zip'
-        )
-        
+        # Метаданные всех выбранных изображений пользователя - одним запросом.
+        # Принадлежность проверяется в SQL: чужие и несуществующие ID
+        # в результат не попадают и выводятся в лог одной записью
+        images = {image[0]: image for image in get_images_by_ids(requested_ids, user_email)}
+        unavailable_ids = set(requested_ids) - images.keys()
+        if unavailable_ids:
+            logger.warning('Images %s not found or not owned by user %s in bulk download', sorted(unavailable_ids), user_email)
+            failed_downloads += len(unavailable_ids)
+        
+        # Содержимое папки пользователя читается один раз вместо stat на файл
+        present_files = list_user_files(user_email) if images else set()
+        
+        for image_id in requested_ids:
+            image = images.get(image_id)
+            if not image:
+                continue
+            
+            # Получаем пути к файлу
+            filename = image[1]  # Системное имя файла
+            original_name = image[2]  # Оригинальное имя файла
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
+            
+            if filename not in present_files:
+                logger.warning('File %s not found on disk for user %s', filename, user_email)
+                failed_downloads += 1
+                continue
+            
+            # Файл попадет в архив с оригинальным именем; image[8] - CRC-32
+            # из БД (NULL у файлов, загруженных до появления колонки)
+            archive_entries.append((file_path, original_name, image[8]))
+            archive_size += image[3]
+            
+            # Запись статистики скачивания
+            log_statistics(
+                action_type='download',
+                user_email=user_email,
+                file_id=image_id,
+                ip_address=client_ip,
+                user_agent=user_agent,
+                additional_info=f'Групповое скачивание: {original_name}'
+            )
+            
+            successful_downloads += 1
+    
     except Exception as e:
-        logging.error(f'Error creating ZIP archive for user {user_email}: {str(e)}')
+        logger.error('Error preparing ZIP archive for user %s: %s', user_email, e)
         flash('Ошибка при создании архива для скачивания', 'error')
-        
-        # Удаляем временный файл в случае ошибки
-        try:
-            os.unlink(temp_zip.name)
-        except:
-            pass
-        
         return redirect(url_for('images_list'))
     
-    finally:
-        # Планируем удаление временного файла через некоторое время
-        # В production лучше использовать фоновую задачу
+    # Проверяем, есть ли файлы для скачивания
+    if successful_downloads == 0:
+        flash('Не удалось подготовить файлы для скачивания', 'error')
+        return redirect(url_for('images_list'))
+    
+    # Формируем имя архива
+    archive_name = f'images_{user_email}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+    
+    # Логируем общую операцию группового скачивания
+    log_statistics(
+        action_type='bulk_download',
+        user_email=user_email,
+        ip_address=client_ip,
+        user_agent=user_agent,
+        additional_info=f'Групповое скачивание: {successful_downloads} файлов, {failed_downloads} ошибок'
+    )
+    
+    logger.info('Bulk download completed for user %s: %s successful, %s failed', user_email, successful_downloads, failed_downloads)
+    
+    # Отправляем архив по мере формирования
+    return _zip_response(archive_entries, archive_name, archive_size)
+
+
+# ============================================================================
+# ХРАНИЛИЩЕ ВРЕМЕННЫХ ССЫЛОК ДЛЯ СКАЧИВАНИЯ
+# ============================================================================
+
+SHARE_LINK_TTL = 24 * 3600                               # Время жизни ссылки (секунды)
+SHARE_LINKS_DB = os.path.join('logs', 'share_links.sqlite')  # Резервное хранилище без Redis
+SHARE_LINKS_DIR = os.path.join('logs', 'share_links')   # Прежнее хранилище: файл <token>.json на ссылку
+
+# 24 случайных байта (192 бита) дают токен из 32 символов base64url:
+# короче ключ share_link:<token> в Redis и сама ссылка
+SHARE_TOKEN_BYTES = 24
+
+# После ошибки Redis ссылки REDIS_RETRY_INTERVAL секунд обслуживаются через
+# файловую систему, затем Redis снова используется. Кратковременный сбой
+# не переключает процесс на диск до перезапуска
+REDIS_RETRY_INTERVAL = 5.0
+_redis_down_until = 0.0
+
+
+def _share_redis():
+    """Клиент Redis для ссылок или None, если Redis недоступен сейчас."""
+    if share_redis_client is None or time.monotonic() < _redis_down_until:
+        return None
+    return share_redis_client
+
+
+def _mark_redis_down(error):
+    """Временно отключает Redis для ссылок после ошибки."""
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+    logger.error('Redis error in share link storage, using SQLite for %ss: %s', REDIS_RETRY_INTERVAL, error)
+
+
+# Соединение с SQLite открывается в каждом процессе отдельно: соединение,
+# открытое до fork воркера, в дочернем процессе использовать нельзя
+_share_db_conn = None
+_share_db_pid = None
+_share_db_lock = threading.Lock()
+
+
+def _share_db_execute(sql, params=()):
+    """
+    Выполнение запроса к SQLite-хранилищу ссылок.
+    
+    Все ссылки хранятся в одном файле SHARE_LINKS_DB (таблица links с
+    первичным ключом token) вместо отдельного файла на каждую ссылку:
+    поиск идет по индексу, а просроченные ссылки удаляются одним DELETE.
+    
+    Returns:
+        tuple | int: Первая строка результата SELECT (или None),
+                     для остальных запросов - число измененных строк
+    """
+    global _share_db_conn, _share_db_pid
+    with _share_db_lock:
+        if _share_db_conn is None or _share_db_pid != os.getpid():
+            os.makedirs(os.path.dirname(SHARE_LINKS_DB), exist_ok=True)
+            conn = sqlite3.connect(SHARE_LINKS_DB, timeout=5.0, isolation_level=None, check_same_thread=False)
+            # WAL: чтение ссылок не блокируется записью из других процессов
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS links (token TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at INTEGER NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_links_expires_at ON links(expires_at)')
+            _share_db_conn, _share_db_pid = conn, os.getpid()
+        cursor = _share_db_conn.execute(sql, params)
+        return cursor.fetchone() if cursor.description else cursor.rowcount
+
+
+def purge_expired_share_links():
+    """
+    Удаление просроченных ссылок из SQLite-хранилища одним запросом.
+    
+    Returns:
+        int: Количество удаленных ссылок
+    """
+    return _share_db_execute('DELETE FROM links WHERE expires_at < ?', (int(time.time()),))
+
+
+def _pack_share_data(share_data):
+    """Сериализация метаданных ссылки для Redis (msgpack, без него - JSON)."""
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(share_data, use_bin_type=True)
+    return json.dumps(share_data, ensure_ascii=False).encode('utf-8')
+
+
+def _unpack_share_data(raw):
+    """Разбор метаданных ссылки из Redis; записи в JSON начинаются с '{'."""
+    if raw[:1] == b'{' or not MSGPACK_AVAILABLE:
+        return json.loads(raw)
+    return msgpack.unpackb(raw, raw=False)
+
+
+def _json_response(payload, status=200):
+    """
+    JSON-ответ API ссылок: через orjson (сразу bytes в UTF-8), без него - jsonify.
+    """
+    if ORJSON_AVAILABLE:
+        return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+    return jsonify(payload), status
+
+
+def _compact_share_data(share_data):
+    """
+    Приведение метаданных ссылки прежнего формата к компактному.
+    
+    Компактный формат: {'u': email владельца, 'e': время истечения (Unix),
+    'c': время создания, 's': суммарный размер файлов, 'f': список
+    [путь к файлу, имя в архиве, CRC-32 или None]}. Ссылки, созданные до
+    его появления ('images' со словарем на файл, время в ISO), живут не
+    дольше SHARE_LINK_TTL и преобразуются при загрузке.
+    """
+    if 'f' in share_data:
+        return share_data
+    
+    expires_at = share_data['expires_at']
+    if isinstance(expires_at, str):
+        expires_at = datetime.fromisoformat(expires_at).timestamp()
+    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], share_data['user_email'])
+    images = share_data['images']
+    return {
+        'u': share_data['user_email'],
+        'e': expires_at,
+        's': sum(image.get('size', 0) for image in images),
+        'f': [[os.path.join(user_folder, image['filename']), image['original_name'], image.get('crc32')]
+              for image in images]
+    }
+
+
+def _save_share_link(token, share_data):
+    """
+    Сохранение метаданных ссылки в Redis с истечением через SHARE_LINK_TTL,
+    при недоступном Redis - в SQLite-хранилище SHARE_LINKS_DB.
+    """
+    client = _share_redis()
+    if client is not None:
         try:
-            import threading
-            def cleanup_temp_file():
-                import time
-                time.sleep(60)  # Ждем минуту перед удалением
-                try:
-                    os.unlink(temp_zip.name)
-                except:
-                    pass
-            
-            cleanup_thread = threading.Thread(target=cleanup_temp_file)
-            cleanup_thread.daemon = True
-            cleanup_thread.start()
-        except:
-            pass
+            client.setex(f'share_link:{token}', SHARE_LINK_TTL, _pack_share_data(share_data))
+            logger.info('Share link saved to Redis: %s for user %s', token, share_data['u'])
+            return
+        except Exception as e:
+            _mark_redis_down(e)
+    
+    _share_db_execute(
+        'INSERT OR REPLACE INTO links (token, data, expires_at) VALUES (?, ?, ?)',
+        (token, _pack_share_data(share_data), share_data['e'])
+    )
+    logger.info('Share link saved to SQLite: %s for user %s', token, share_data['u'])
+
+
+def _load_share_link(token):
+    """
+    Загрузка метаданных ссылки из Redis или из SQLite-хранилища.
+    
+    Returns:
+        dict: Метаданные ссылки или None, если ссылка не найдена
+    """
+    client = _share_redis()
+    if client is not None:
+        try:
+            raw = client.get(f'share_link:{token}')
+            if raw:
+                return _compact_share_data(_unpack_share_data(raw))
+        except Exception as e:
+            _mark_redis_down(e)
+    
+    # Ссылки, созданные во время недоступности Redis, хранятся в SQLite
+    try:
+        row = _share_db_execute('SELECT data FROM links WHERE token = ?', (token,))
+        if row:
+            return _compact_share_data(_unpack_share_data(row[0]))
+    except Exception as e:
+        logger.error('Error loading share link from SQLite: %s', e)
+    
+    # Ссылки, сохраненные в файлы до перехода на SQLite (живут SHARE_LINK_TTL).
+    # Файл открывается сразу, без отдельной проверки os.path.exists
+    share_file = os.path.join(SHARE_LINKS_DIR, f'{token}.json')
+    try:
+        with open(share_file, 'r', encoding='utf-8') as f:
+            share_data = json.load(f)
+        logger.info('Share link data loaded from file: %s', token)
+        return _compact_share_data(share_data)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error('Error loading share link from file: %s', e)
+        return None
+
+
+def _delete_share_link(token):
+    """Удаление ссылки из Redis и из резервных хранилищ."""
+    client = _share_redis()
+    if client is not None:
+        try:
+            client.delete(f'share_link:{token}')
+        except Exception as e:
+            _mark_redis_down(e)
+    
+    try:
+        _share_db_execute('DELETE FROM links WHERE token = ?', (token,))
+    except Exception as e:
+        logger.error('Error deleting share link from SQLite: %s', e)
+    
+    try:
+        os.remove(os.path.join(SHARE_LINKS_DIR, f'{token}.json'))
+    except OSError:
+        pass
 
 
 @app.route('/create-share-link', methods=['POST'])
@@ -1630,114 +2396,94 @@ def create_share_link():
         - Возвращает URL для скачивания
         - Логирует создание ссылки
     """
-    import secrets
-    import json
-    from datetime import datetime, timedelta
-    
-    global REDIS_AVAILABLE
-    
     try:
         # Получаем данные из JSON запроса
         data = request.get_json()
         if not data or 'image_ids' not in data:
-            return jsonify({
+            return _json_response({
                 'success': False,
                 'error': 'Не указаны изображения для создания ссылки'
-            }), 400
+            }, 400)
         
         image_ids = data['image_ids']
         if not image_ids or not isinstance(image_ids, list):
-            return jsonify({
+            return _json_response({
                 'success': False,
                 'error': 'Список изображений пуст или некорректен'
-            }), 400
+            }, 400)
         
         user_email = session['user_email']
         valid_images = []
+        archive_size = 0
+        
+        # Разбираем ID (повторы убираем, порядок сохраняем)
+        requested_ids = []
+        for image_id in dict.fromkeys(map(str, image_ids)):
+            if image_id.isdigit():
+                requested_ids.append(int(image_id))
+            else:
+                logger.warning('Invalid image ID %s for share link creation by user %s', image_id, user_email)
+        
+        # Получаем изображения пользователя одним запросом; чужие
+        # и несуществующие ID отсеиваются условием по user_email
+        images = {image[0]: image for image in get_images_by_ids(requested_ids, user_email)}
+        unavailable_ids = set(requested_ids) - images.keys()
+        if unavailable_ids:
+            logger.warning('Images %s not found or not owned by user %s for share link creation', sorted(unavailable_ids), user_email)
+        
+        # Содержимое папки пользователя читается один раз вместо stat на файл
+        present_files = list_user_files(user_email) if images else set()
+        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
         
         # Проверяем каждое изображение
-        for image_id in image_ids:
+        for image_id in requested_ids:
+            image = images.get(image_id)
+            if not image:
+                continue
             try:
-                image = get_image_by_id(int(image_id))
-                if not image:
-                    logging.warning(f'Image with ID {image_id} not found for share link creation by user {user_email}')
-                    continue
-                
-                # Проверяем принадлежность изображения текущему пользователю
-                image_user_email = image[6]  # Индекс user_email в результате запроса
-                
-                if image_user_email != user_email:
-                    logging.warning(f'User {user_email} attempted to create share link for image {image_id} belonging to {image_user_email}')
-                    continue
-                
                 # Проверяем существование файла
                 filename = image[1]  # Системное имя файла
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
                 
-                if not os.path.exists(file_path):
-                    logging.warning(f'File {filename} not found on disk for share link creation by user {user_email}')
+                if filename not in present_files:
+                    logger.warning('File %s not found on disk for share link creation by user %s', filename, user_email)
                     continue
                 
-                valid_images.append({
-                    'id': int(image_id),
-                    'filename': filename,
-                    'original_name': image[2],
-                    'size': image[3],
-                    'file_type': image[5]
-                })
+                # В ссылке хранится готовая запись архива: путь к файлу,
+                # оригинальное имя и CRC-32 (image[8], NULL у старых файлов)
+                valid_images.append([os.path.join(user_folder, filename), image[2], image[8]])
+                archive_size += image[3]
                 
             except Exception as e:
-                logging.error(f'Error validating image {image_id} for share link: {str(e)}')
+                logger.error('Error validating image %s for share link: %s', image_id, e)
                 continue
         
         if not valid_images:
-            return jsonify({
+            return _json_response({
                 'success': False,
                 'error': 'Не найдено доступных изображений для создания ссылки'
-            }), 400
+            }, 400)
         
         # Генерируем уникальный токен
-        token = secrets.token_urlsafe(32)
+        token = secrets.token_urlsafe(SHARE_TOKEN_BYTES)
         
-        # Устанавливаем время истечения (24 часа)
-        expires_at = datetime.now() + timedelta(hours=24)
+        # Устанавливаем время истечения (24 часа). В метаданных время
+        # хранится числом секунд Unix: проверка при скачивании сводится
+        # к сравнению чисел без разбора строки
+        created_at = int(time.time())
+        expires_at = created_at + SHARE_LINK_TTL
         
-        # Подготавливаем метаданные ссылки
+        # Подготавливаем метаданные ссылки: только то, что нужно для
+        # скачивания, в компактном виде (см. _compact_share_data)
         share_data = {
-            'token': token,
-            'user_email': user_email,
-            'images': valid_images,
-            'created_at': datetime.now().isoformat(),
-            'expires_at': expires_at.isoformat(),
-            'file_count': len(valid_images)
+            'u': user_email,
+            'e': expires_at,
+            'c': created_at,
+            's': archive_size,
+            'f': valid_images
         }
         
-        # Сохраняем данные ссылки
-        if REDIS_AVAILABLE and redis_client:
-            try:
-                # Сохраняем в Redis с автоматическим истечением
-                redis_key = f'share_link:{token}'
-                redis_client.setex(
-                    redis_key,
-                    int(timedelta(hours=24).total_seconds()),
-                    json.dumps(share_data, ensure_ascii=False)
-                )
-                logging.info(f'Share link saved to Redis: {token} for user {user_email}')
-            except Exception as e:
-                logging.error(f'Error saving share link to Redis: {str(e)}')
-                # Fallback к файловой системе
-                REDIS_AVAILABLE = False
-        
-        if not REDIS_AVAILABLE:
-            # Сохраняем в файловую систему
-            share_links_dir = os.path.join('logs', 'share_links')
-            os.makedirs(share_links_dir, exist_ok=True)
-            
-            share_file = os.path.join(share_links_dir, f'{token}.json')
-            with open(share_file, 'w', encoding='utf-8') as f:
-                json.dump(share_data, f, ensure_ascii=False, indent=2)
-            
-            logging.info(f'Share link saved to file: {token} for user {user_email}')
+        # Сохраняем данные ссылки (Redis или файловая система)
+        _save_share_link(token, share_data)
         
         # Генерируем URL для скачивания
         share_url = url_for('download_shared', token=token, _external=True)
@@ -1747,26 +2493,26 @@ def create_share_link():
             action_type='share_link_created',
             user_email=user_email,
             ip_address=get_client_ip(),
-            user_agent=request.user_agent.string,
+            user_agent=get_user_agent(),
             additional_info=f'Создана ссылка для скачивания: {len(valid_images)} файлов, токен: {token[:8]}...'
         )
         
-        logging.info(f'Share link created successfully: {token} for user {user_email}, {len(valid_images)} files')
+        logger.info('Share link created successfully: %s for user %s, %s files', token, user_email, len(valid_images))
         
-        return jsonify({
+        return _json_response({
             'success': True,
             'share_url': share_url,
             'token': token,
-            'expires_at': expires_at.isoformat(),
+            'expires_at': datetime.fromtimestamp(expires_at).isoformat(),
             'file_count': len(valid_images)
         })
         
     except Exception as e:
-        logging.error(f'Error creating share link for user {session.get("user_email", "unknown")}: {str(e)}')
-        return jsonify({
+        logger.error('Error creating share link for user %s: %s', session.get("user_email", "unknown"), e)
+        return _json_response({
             'success': False,
             'error': 'Внутренняя ошибка сервера при создании ссылки'
-        }), 500
+        }, 500)
 
 
 @app.route('/shared/<token>')
@@ -1792,162 +2538,81 @@ def download_shared(token):
     Actions:
         - Загружает метаданные ссылки по токену
         - Проверяет срок действия ссылки
-        - Создает ZIP-архив с файлами
         - Логирует скачивание
-        - Отправляет архив пользователю
+        - Отправляет ZIP-архив с файлами потоком, без временного файла
     """
-    import zipfile
-    import tempfile
-    import json
-    from datetime import datetime
-    from flask import send_file
-    
-    global REDIS_AVAILABLE
+    # IP клиента нужен для всех записей журнала этого запроса
+    client_ip = get_client_ip()
     
     try:
         # Загружаем данные ссылки
-        share_data = None
-        
-        if REDIS_AVAILABLE and redis_client:
-            try:
-                # Пытаемся загрузить из Redis
-                redis_key = f'share_link:{token}'
-                redis_data = redis_client.get(redis_key)
-                if redis_data:
-                    share_data = json.loads(redis_data)
-                    logging.info(f'Share link data loaded from Redis: {token}')
-            except Exception as e:
-                logging.error(f'Error loading share link from Redis: {str(e)}')
-        
-        if not share_data:
-            # Пытаемся загрузить из файловой системы
-            share_file = os.path.join('logs', 'share_links', f'{token}.json')
-            if os.path.exists(share_file):
-                try:
-                    with open(share_file, 'r', encoding='utf-8') as f:
-                        share_data = json.load(f)
-                    logging.info(f'Share link data loaded from file: {token}')
-                except Exception as e:
-                    logging.error(f'Error loading share link from file: {str(e)}')
+        share_data = _load_share_link(token)
         
         if not share_data:
-            logging.warning(f'Share link not found: {token} from IP {get_client_ip()}')
+            logger.warning('Share link not found: %s from IP %s', token, client_ip)
             abort(404)
         
-        # Проверяем срок действия ссылки
-        expires_at = datetime.fromisoformat(share_data['expires_at'])
-        if datetime.now() > expires_at:
-            logging.warning(f'Expired share link accessed: {token} from IP {get_client_ip()}')
+        # Проверяем срок действия ссылки. Записи в Redis истекают сами
+        # (SETEX), проверка нужна для резервного хранилища
+        if time.time() > share_data['e']:
+            logger.warning('Expired share link accessed: %s from IP %s', token, client_ip)
             
             # Удаляем просроченную ссылку
-            if REDIS_AVAILABLE and redis_client:
-                try:
-                    redis_client.delete(f'share_link:{token}')
-                except:
-                    pass
-            
-            share_file = os.path.join('logs', 'share_links', f'{token}.json')
-            if os.path.exists(share_file):
-                try:
-                    os.remove(share_file)
-                except:
-                    pass
+            _delete_share_link(token)
             
             abort(410)  # Gone - ресурс больше не доступен
         
-        # Получаем информацию о файлах
-        images = share_data['images']
-        user_email = share_data['user_email']
+        # Получаем информацию о файлах: записи архива готовы при создании ссылки
+        files = share_data['f']
+        user_email = share_data['u']
         
-        if not images:
-            logging.warning(f'No images in share link: {token} from IP {get_client_ip()}')
+        if not files:
+            logger.warning('No images in share link: %s from IP %s', token, client_ip)
             abort(404)
         
-        # Создаем временный ZIP-файл
-        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-        
         successful_files = 0
         failed_files = 0
+        archive_entries = []
         
-        try:
-            with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for image_info in images:
-                    try:
-                        filename = image_info['filename']
-                        original_name = image_info['original_name']
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
-                        
-                        if not os.path.exists(file_path):
-                            logging.warning(f'File not found for shared download: {filename} for token {token}')
-                            failed_files += 1
-                            continue
-                        
-                        # Добавляем файл в архив с оригинальным именем
-                        zipf.write(file_path, original_name)
-                        successful_files += 1
-                        
-                    except Exception as e:
-                        logging.error(f'Error adding file to shared archive: {filename} for token {token}: {str(e)}')
-                        failed_files += 1
-            
-            if successful_files == 0:
-                logging.warning(f'No files available for shared download: {token} from IP {get_client_ip()}')
-                os.unlink(temp_zip.name)
-                abort(404)
-            
-            # Формируем имя архива
-            archive_name = f'shared_images_{token[:8]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
-            
-            # Логируем скачивание по ссылке
-            log_statistics(
-                action_type='shared_download',
-                user_email='anonymous',  # Анонимный доступ
-                ip_address=get_client_ip(),
-                user_agent=request.user_agent.string,
-                additional_info=f'Скачивание по ссылке: токен {token[:8]}..., владелец {user_email}, файлов: {successful_files}'
-            )
-            
-            logging.info(f'Shared download completed: token {token}, {successful_files} files, {failed_files} failed, IP {get_client_ip()}')
-            
-            # Отправляем архив
-            return send_file(
-                temp_zip.name,
-                as_attachment=True,
-                download_name=archive_name,
-                mimetype='application/zip'
-            )
-            
-        except Exception as e:
-            logging.error(f'Error creating shared ZIP archive for token {token}: {str(e)}')
-            
-            # Удаляем временный файл в случае ошибки
-            try:
-                os.unlink(temp_zip.name)
-            except:
-                pass
+        # Содержимое папки владельца читается один раз вместо stat на файл
+        present_files = list_user_files(user_email)
+        
+        for entry in files:
+            filename = os.path.basename(entry[0])
+            if filename not in present_files:
+                logger.warning('File not found for shared download: %s for token %s', filename, token)
+                failed_files += 1
+                continue
             
-            abort(500)
+            archive_entries.append(entry)
+            successful_files += 1
         
-        finally:
-            # Планируем удаление временного файла
-            try:
-                import threading
-                def cleanup_temp_file():
-                    import time
-                    time.sleep(60)  # Ждем минуту перед удалением
-                    try:
-                        os.unlink(temp_zip.name)
-                    except:
-                        pass
-                
-                cleanup_thread = threading.Thread(target=cleanup_temp_file)
-                cleanup_thread.daemon = True
-                cleanup_thread.start()
-            except:
-                pass
+        if successful_files == 0:
+            logger.warning('No files available for shared download: %s from IP %s', token, client_ip)
+            abort(404)
+        
+        # Формируем имя архива
+        archive_name = f'shared_images_{token[:8]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+        
+        # Логируем скачивание по ссылке
+        log_statistics(
+            action_type='shared_download',
+            user_email='anonymous',  # Анонимный доступ
+            ip_address=client_ip,
+            user_agent=get_user_agent(),
+            additional_info=f'Скачивание по ссылке: токен {token[:8]}..., владелец {user_email}, файлов: {successful_files}'
+        )
+        
+        logger.info('Shared download completed: token %s, %s files, %s failed, IP %s', token, successful_files, failed_files, client_ip)
         
+        # Отправляем архив по мере формирования. Суммарный размер известен
+        # для всех файлов ссылки и служит верхней оценкой размера архива
+        return _zip_response(archive_entries, archive_name, share_data['s'])
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f'Error in shared download for token {token}: {str(e)}')
+        logger.error('Error in shared download for token %s: %s', token, e)
         abort(500)
 
 
@@ -1967,11 +2632,12 @@ def db_test_connect():
     Usage:
         GET /db-test - возвращает статус подключения к БД
     """
-    conn = connect_db()
-    if conn:
-        close_db(conn)
+    # Соединение возвращается в пул даже при ошибке запроса
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT 1")
         return {'status': 'ok', "message": "Соединение с БД установлено"}
-    else:
+    except psycopg2.Error:
         return {'status': 'error', "message": "Соединение с БД НЕ установлено"}
 
 
@@ -1983,42 +2649,75 @@ with app.app_context():
         # Инициализируем схему базы данных
         # Создает все необходимые таблицы и обновляет существующие при необходимости
         ensure_schema()
-        logging.info('Database schema initialized successfully')
+        logger.info('Database schema initialized successfully')
         
         # Проверяем и удаляем изображения с истекшим сроком хранения
         # Автоматическая очистка при каждом запуске приложения
         # предотвращает накопление устаревших файлов
         try:
             expired_images = get_expired_images()
+            
+            # Сначала собираем пути файлов, затем удаляем их параллельно
+            expired_files = []
+            processed_ids = []
             for image in expired_images:
                 try:
                     image_id = image[0]
                     filename = str(image[1]) if image[1] else ''
                     user_email = str(image[6]) if image[6] else ''
                     
-                    # Удаляем физический файл с диска
                     if user_email:
                         file_path = os.path.join(app.config['UPLOAD_FOLDER'], user_email, filename)
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            logging.info(f'Expired file {filename} deleted for user {user_email}')
-                    
-                    # Удаляем запись из базы данных
-                    delete_image(image_id)
-                    logging.info(f'Expired image with ID {image_id} deleted from database')
+                        expired_files.append((image_id, file_path, filename, user_email))
+                    else:
+                        processed_ids.append(image_id)
                 except (UnicodeDecodeError, UnicodeError) as ue:
-                    logging.warning(f'Unicode error processing expired image {image_id}: {str(ue)}')
+                    logger.warning('Unicode error processing expired image %s: %s', image_id, ue)
                     # Пропускаем проблемную запись и продолжаем
                     continue
+            
+            def _unlink_expired(entry):
+                """Удаляет файл просроченного изображения; None - ошибка удаления."""
+                image_id, file_path, filename, user_email = entry
+                try:
+                    removed = _safe_unlink(file_path)
                 except Exception as ie:
-                    logging.error(f'Error processing expired image {image_id}: {str(ie)}')
-                    continue
+                    logger.error('Error processing expired image %s: %s', image_id, ie)
+                    return None
+                if removed:
+                    logger.info('Expired file %s deleted for user %s', filename, user_email)
+                return image_id
+            
+            # unlink отпускает GIL, поэтому задержки диска перекрываются.
+            # Пул создается только на время очистки: потоки общего пула,
+            # запущенные до fork воркеров, в дочерних процессах не существуют
+            if len(expired_files) > 1:
+                with ThreadPoolExecutor(max_workers=16, thread_name_prefix='expired-cleanup') as pool:
+                    unlinked = list(pool.map(_unlink_expired, expired_files))
+            else:
+                unlinked = [_unlink_expired(entry) for entry in expired_files]
+            # Запись остается в БД, если файл не удалось удалить
+            processed_ids.extend(image_id for image_id in unlinked if image_id is not None)
+            
+            # Удаляем записи из базы данных одним запросом
+            if processed_ids:
+                delete_images_bulk(processed_ids)
+                logger.info('%s expired images deleted from database', len(processed_ids))
         except Exception as ee:
-            logging.error(f'Error getting expired images: {str(ee)}')
+            logger.error('Error getting expired images: %s', ee)
         
-        logging.info('Database initialization completed successfully')
+        logger.info('Database initialization completed successfully')
     except Exception as e:
-        logging.error(f'Error initializing database: {str(e)}')
+        logger.error('Error initializing database: %s', e)
+
+# Просроченные ссылки из резервного хранилища удаляются при запуске
+# (записи Redis истекают сами по SETEX)
+try:
+    purged = purge_expired_share_links()
+    if purged:
+        logger.info('%s expired share links deleted from SQLite', purged)
+except Exception as e:
+    logger.error('Error purging expired share links: %s', e)
 
 
 # Запуск Flask-приложения
@@ -2030,7 +2729,11 @@ with app.app_context():
 
 # Время запуска приложения для метрик uptime и мониторинга
 app.start_time = time.time()
-logging.info(f"Application start time recorded: {datetime.fromtimestamp(app.start_time)}")
+logger.info("Application start time recorded: %s", datetime.fromtimestamp(app.start_time))
+
+
+# Признак того, что cleanup() уже выполнялась (atexit и SIGTERM)
+_cleanup_done = False
 
 
 def cleanup():
@@ -2038,6 +2741,7 @@ def cleanup():
     Функция graceful shutdown для корректного завершения приложения.
     
     Выполняет очистку ресурсов при завершении работы приложения:
+    - Записывает накопленные в буфере события статистики
     - Закрывает все соединения с базой данных
     - Освобождает ресурсы пула соединений
     - Записывает информацию о завершении в лог
@@ -2048,35 +2752,64 @@ def cleanup():
     - Исключениях, приводящих к завершению
     
     Note:
-        Функция зарегистрирована через atexit.register()
-        для автоматического вызова при завершении.
+        Функция зарегистрирована через atexit.register() и обработчик
+        SIGTERM; повторный вызов ничего не делает.
     """
+    global _cleanup_done
+    if _cleanup_done:
+        return
+    _cleanup_done = True
+    
     try:
         # Вычисляем время работы приложения
         uptime = time.time() - app.start_time
         uptime_str = f"{uptime:.2f} seconds"
         
-        logging.info(f"Starting application cleanup. Uptime: {uptime_str}")
+        logger.info("Starting application cleanup. Uptime: %s", uptime_str)
+        
+        # Буфер статистики пишется через пул, поэтому сбрасываем его до закрытия
+        try:
+            written = flush_statistics()
+            if written:
+                logger.info("Flushed %d buffered statistics events", written)
+        except Exception as e:
+            logger.error("Error flushing statistics buffer: %s", e)
         
         # Закрываем все соединения с базой данных
         if 'db_pool' in globals():
             db_pool.close_all_connections()
-            logging.info("Database connection pool closed")
+            logger.info("Database connection pool closed")
         
         # Логируем успешное завершение
-        logging.info("Application shutdown completed successfully")
+        logger.info("Application shutdown completed successfully")
         
     except Exception as e:
         # Логируем ошибки, но не прерываем процесс завершения
-        logging.error(f"Error during application cleanup: {e}")
+        logger.error("Error during application cleanup: %s", e)
     finally:
         # Финальное сообщение о завершении
-        logging.info("Image Hosting application terminated")
+        logger.info("Image Hosting application terminated")
 
 
 # Регистрируем функцию очистки для автоматического вызова при завершении
 atexit.register(cleanup)
 
+
+def _handle_sigterm(signum, frame):
+    """Graceful shutdown по SIGTERM (docker stop, systemd, Kubernetes)."""
+    logger.info("Received signal %s, shutting down", signum)
+    cleanup()
+    sys.exit(0)
+
+
+# По умолчанию SIGTERM завершает процесс без вызова atexit, и соединения
+# пула остаются открытыми на стороне PostgreSQL. Обработчик ставится только
+# если сигнал никем не обрабатывается: воркеры Gunicorn уже обрабатывают
+# SIGTERM сами (дожидаются текущих запросов и выходят через atexit)
+if (threading.current_thread() is threading.main_thread()
+        and signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None)):
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
 # ============================================================================
 # ЗАПУСК ПРИЛОЖЕНИЯ
 # ============================================================================
@@ -2099,28 +2832,28 @@ if __name__ == '__main__':
     """
     
     # Логируем информацию о запуске оптимизированной версии
-    logging.info("="*60)
-    logging.info("Starting Image Hosting v1.2.0-optimized")
-    logging.info("="*60)
+    logger.info("="*60)
+    logger.info("Starting Image Hosting v1.2.0-optimized")
+    logger.info("="*60)
     
     # Информация о доступности компонентов
-    logging.info(f"Redis caching available: {REDIS_AVAILABLE}")
-    logging.info(f"Celery async processing available: {CELERY_AVAILABLE}")
+    logger.info("Redis caching available: %s", REDIS_AVAILABLE)
+    logger.info("Celery async processing available: %s", CELERY_AVAILABLE)
     
     # Информация о конфигурации
-    logging.info(f"Upload folder: {app.config['UPLOAD_FOLDER']}")
-    logging.info(f"Max content length: {app.config['MAX_CONTENT_LENGTH'] / (1024*1024):.1f} MB")
-    logging.info(f"Session type: {app.config.get('SESSION_TYPE', 'filesystem')}")
+    logger.info("Upload folder: %s", app.config['UPLOAD_FOLDER'])
+    logger.info("Max content length: %.1f MB", app.config['MAX_CONTENT_LENGTH'] / (1024*1024))
+    logger.info("Session type: %s", app.config.get('SESSION_TYPE', 'filesystem'))
     
     # Информация о сетевых настройках
-    logging.info("Server configuration:")
-    logging.info("  - Host: 0.0.0.0 (all interfaces)")
-    logging.info("  - Port: 5000")
-    logging.info("  - Threading: Enabled")
-    logging.info("  - Debug mode: Disabled (production)")
+    logger.info("Server configuration:")
+    logger.info("  - Host: 0.0.0.0 (all interfaces)")
+    logger.info("  - Port: 5000")
+    logger.info("  - Threading: Enabled")
+    logger.info("  - Debug mode: Disabled (production)")
     
-    logging.info("Application ready to accept connections")
-    logging.info("="*60)
+    logger.info("Application ready to accept connections")
+    logger.info("="*60)
     
     # Запуск Flask development server
     # В production следует использовать Gunicorn или другой WSGI-сервер
@@ -2132,7 +2865,7 @@ if __name__ == '__main__':
             debug=False          # Отключаем debug в production
         )
     except KeyboardInterrupt:
-        logging.info("Application stopped by user (Ctrl+C)")
+        logger.info("Application stopped by user (Ctrl+C)")
     except Exception as e:
-        logging.error(f"Application failed to start: {e}")
+        logger.error("Application failed to start: %s", e)
         raise
\ No newline at end of file
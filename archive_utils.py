@@ -0,0 +1,212 @@
+# ============================================================================
+# УТИЛИТЫ ДЛЯ СОЗДАНИЯ ZIP-АРХИВОВ С ИЗОБРАЖЕНИЯМИ
+# ============================================================================
+#
+# Этот модуль содержит вспомогательные функции для упаковки изображений
+# в ZIP-архивы при групповом скачивании и скачивании по ссылке.
+#
+# Основные функции:
+# - Потоковое формирование архива без временного файла
+# - Чтение и упаковка файлов крупными блоками
+# - Упаковка уже сжатых форматов без повторного сжатия
+#
+# ============================================================================
+
+import io
+import logging
+import zipfile
+import zlib
+from typing import Final, Iterable, Iterator, Optional, Tuple
+
+# Размер блока чтения файла и записи в архив (1MB).
+# ZipFile.write копирует файл блоками по 8KB, что на многомегабайтных
+# изображениях дает сотни лишних системных вызовов
+ARCHIVE_COPY_BUFFER_SIZE: Final[int] = 1024 * 1024
+
+# Форматы, данные которых уже сжаты: DEFLATE уменьшает их меньше чем на
+# процент, поэтому они записываются в архив без сжатия (ZIP_STORED)
+PRECOMPRESSED_EXTENSIONS: Final[frozenset[str]] = frozenset({
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif', 'mp4', 'webm'
+})
+
+
+class _StreamSink(io.RawIOBase):
+    """
+    Приемник данных ZipFile без поддержки seek.
+
+    ZipFile, обнаружив что поток нельзя перематывать, пишет размеры и CRC
+    после данных каждого файла (data descriptor), поэтому архив можно
+    отдавать клиенту по мере формирования.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        # Объекты bytes сохраняются как есть: блок файла, записанный без
+        # сжатия, уходит клиенту без единого копирования в Python.
+        # memoryview и bytearray копируются - их буфер может переиспользоваться
+        if data:
+            self._chunks.append(data if type(data) is bytes else bytes(data))
+        return len(data)
+
+    def drain(self) -> list:
+        """Возвращает накопленные фрагменты и очищает буфер."""
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+def _write_stored_known_crc(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, src, crc32: int,
+                            sink: _StreamSink) -> Iterator[bytes]:
+    """
+    Запись файла в архив без сжатия с заранее известной CRC-32.
+
+    CRC и размер записываются прямо в локальный заголовок, поэтому data
+    descriptor не нужен и CRC по ходу чтения не вычисляется. Повторяет
+    действия ZipFile.open(..., 'w') и _ZipWriteFile.close для такого случая.
+
+    Args:
+        zipf: Архив, открытый на запись
+        zinfo: Описание файла (ZipInfo.from_file)
+        src: Открытый файл-источник
+        crc32 (int): CRC-32 содержимого файла (из БД)
+        sink: Приемник данных архива
+
+    Yields:
+        bytes: Фрагменты архива
+    """
+    _start_stored_entry(zipf, zinfo, crc32)
+    yield from sink.drain()
+
+    remaining = zinfo.file_size
+    while remaining > 0 and (chunk := src.read(min(ARCHIVE_COPY_BUFFER_SIZE, remaining))):
+        zipf.fp.write(chunk)
+        remaining -= len(chunk)
+        yield from sink.drain()
+    if remaining:
+        # Файл изменился после stat: заголовок уже отправлен с другим размером
+        raise OSError(f"File size changed while archiving: {zinfo.filename}")
+
+    _finish_stored_entry(zipf, zinfo)
+
+
+def _start_stored_entry(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, crc32: int) -> None:
+    """Записывает локальный заголовок файла без сжатия с известной CRC-32."""
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.CRC = crc32
+    zinfo.compress_size = zinfo.file_size
+    zinfo.header_offset = zipf.fp.tell()
+    zipf._writecheck(zinfo)
+    zipf._didModify = True
+    zipf.fp.write(zinfo.FileHeader(zinfo.file_size > zipfile.ZIP64_LIMIT))
+
+
+def _finish_stored_entry(zipf: zipfile.ZipFile, zinfo: zipfile.ZipInfo) -> None:
+    """Регистрирует записанный файл для центрального каталога архива."""
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+    zipf.start_dir = zipf.fp.tell()
+
+
+def stored_zip_size(entries: Iterable[Tuple[str, str, Optional[int]]]) -> Optional[Tuple[int, int]]:
+    """
+    Размер архива stream_zip и контрольная сумма его заголовков без чтения файлов.
+
+    Считается, только если каждый файл записывается без сжатия с известной
+    CRC-32 (формат из PRECOMPRESSED_EXTENSIONS): тогда размер архива
+    определяется заголовками и размерами файлов. Архив строится вхолостую
+    теми же функциями, что и в stream_zip, но вместо данных файлов только
+    сдвигается позиция записи. Заголовки содержат имена, размеры, даты и
+    CRC-32 файлов, поэтому их контрольная сумма меняется вместе с архивом.
+
+    Args:
+        entries: Кортежи (путь к файлу на диске, имя файла внутри архива,
+                 CRC-32 содержимого или None)
+
+    Returns:
+        tuple: (размер архива в байтах, CRC-32 заголовков) или None, если
+               размер заранее не известен (сжатие, неизвестная CRC-32,
+               недоступный файл)
+    """
+    sink = _StreamSink()
+    headers_crc = 0
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        # Поток без seek: ZipFile считает позицию сам (ZipFile.fp.offset)
+        position = zipf.fp
+        for file_path, arcname, crc32 in entries:
+            if crc32 is None or file_path.rpartition('.')[2].lower() not in PRECOMPRESSED_EXTENSIONS:
+                return None
+            try:
+                # Файл открывается, как в stream_zip: недоступный файл там
+                # пропускается, и размер архива был бы другим
+                with open(file_path, 'rb', buffering=0):
+                    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+            except OSError:
+                return None
+
+            _start_stored_entry(zipf, zinfo, crc32)
+            position.offset += zinfo.file_size
+            _finish_stored_entry(zipf, zinfo)
+            for chunk in sink.drain():
+                headers_crc = zlib.crc32(chunk, headers_crc)
+    # Центральный каталог записывается при закрытии архива
+    for chunk in sink.drain():
+        headers_crc = zlib.crc32(chunk, headers_crc)
+    return position.offset, headers_crc
+
+
+def stream_zip(entries: Iterable[Tuple[str, str, Optional[int]]],
+               compression: int = zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """
+    Генератор ZIP-архива для потоковой отдачи в Response.
+
+    Архив формируется по ходу чтения ответа: клиент начинает получать
+    данные сразу, а на диск и в память архив целиком не попадает.
+    Файл, который не удалось открыть, пропускается с записью в лог.
+    Файлы из PRECOMPRESSED_EXTENSIONS записываются без сжатия, а при
+    известной CRC-32 - без ее пересчета.
+
+    Args:
+        entries: Кортежи (путь к файлу на диске, имя файла внутри архива,
+                 CRC-32 содержимого или None, если она неизвестна)
+        compression (int): Метод сжатия остальных файлов (по умолчанию ZIP_DEFLATED)
+
+    Yields:
+        bytes: Очередной фрагмент архива
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression) as zipf:
+        for file_path, arcname, crc32 in entries:
+            try:
+                src = open(file_path, 'rb', buffering=0)
+            except OSError as e:
+                logging.error(f"Error adding file to archive: {file_path}: {e}")
+                continue
+
+            with src:
+                # Дата и права файла берутся так же, как в ZipFile.write
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                if file_path.rpartition('.')[2].lower() in PRECOMPRESSED_EXTENSIONS:
+                    compress_type = zipfile.ZIP_STORED
+                else:
+                    compress_type = compression
+                if compress_type == zipfile.ZIP_STORED and crc32 is not None:
+                    yield from _write_stored_known_crc(zipf, zinfo, src, crc32, sink)
+                    continue
+
+                zinfo.compress_type = compress_type
+                # force_zip64: размер заранее не передается, а архив может превысить 4GB
+                with zipf.open(zinfo, 'w', force_zip64=True) as dst:
+                    while chunk := src.read(ARCHIVE_COPY_BUFFER_SIZE):
+                        dst.write(chunk)
+                        # Фрагменты отдаются по отдельности, без склейки:
+                        # склейка заголовка с блоком файла копировала бы блок
+                        yield from sink.drain()
+            yield from sink.drain()
+    # Центральный каталог записывается при закрытии архива
+    yield from sink.drain()
@@ -1,8 +1,19 @@
 import os
+import gzip
+import shutil
 import subprocess
+import tempfile
 from datetime import datetime
 import logging
 
+# zstandard сжимает дампы сильнее и быстрее gzip (опционально,
+# без него бэкапы сжимаются gzip)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 # Настройка логирования
 logging.basicConfig(
     filename='logs/backup.log',
@@ -14,12 +25,37 @@ logging.basicConfig(
 # Создаем директорию для бэкапов, если она не существует
 os.makedirs('backups', exist_ok=True)
 
+# Размер блока при копировании дампа между процессом и файлом (1MB)
+BACKUP_CHUNK_SIZE = 1024 * 1024
+
+# Уровень gzip: 1 сжимает SQL-дамп в несколько раз и почти не
+# замедляет запись, ограниченную скоростью pg_dump
+BACKUP_COMPRESS_LEVEL = 1
+
+# Уровень zstd: 3 (по умолчанию) быстрее gzip -1 и сжимает сильнее
+BACKUP_ZSTD_LEVEL = 3
+
+# Расширение новых бэкапов
+BACKUP_EXTENSION = '.sql.zst' if ZSTD_AVAILABLE else '.sql.gz'
+
+
+def _open_backup(backup_path, mode):
+    """Открывает файл бэкапа в двоичном режиме (.zst - через zstd, .gz - через gzip)."""
+    if backup_path.endswith('.zst'):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Для бэкапов .zst требуется пакет zstandard")
+        return zstandard.open(backup_path, mode, cctx=zstandard.ZstdCompressor(level=BACKUP_ZSTD_LEVEL))
+    if backup_path.endswith('.gz'):
+        return gzip.open(backup_path, mode, compresslevel=BACKUP_COMPRESS_LEVEL)
+    return open(backup_path, mode)
+
+
 def create_backup():
     """Создает резервную копию базы данных PostgreSQL"""
     try:
         # Формируем имя файла с текущей датой и временем
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        backup_filename = f"backup_{timestamp}.sql"
+        backup_filename = f"backup_{timestamp}{BACKUP_EXTENSION}"
         backup_path = os.path.join('backups', backup_filename)
         
         # Формируем команду для создания бэкапа
@@ -29,18 +65,26 @@ def create_backup():
             'pg_dump', '-U', 'postgres', 'images_db'
         ]
         
-        # Выполняем команду и сохраняем результат в файл
-        with open(backup_path, 'w') as f:
-            result = subprocess.run(command, stdout=f, stderr=subprocess.PIPE, text=True)
+        # Дамп читается из канала блоками по BACKUP_CHUNK_SIZE и сразу
+        # сжимается в файл, без декодирования текста. stderr пишется во
+        # временный файл, чтобы заполненный канал не остановил pg_dump
+        with tempfile.TemporaryFile() as err, _open_backup(backup_path, 'wb') as f:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err)
+            with proc.stdout:
+                shutil.copyfileobj(proc.stdout, f, BACKUP_CHUNK_SIZE)
+            returncode = proc.wait()
+            err.seek(0)
+            stderr = err.read().decode('utf-8', errors='replace')
         
         # Проверяем результат выполнения команды
-        if result.returncode == 0:
+        if returncode == 0:
             logging.info(f"Резервная копия успешно создана: {backup_path}")
             print(f"Резервная копия успешно создана: {backup_path}")
             return True
         else:
-            logging.error(f"Ошибка при создании резервной копии: {result.stderr}")
-            print(f"Ошибка при создании резервной копии: {result.stderr}")
+            os.remove(backup_path)
+            logging.error(f"Ошибка при создании резервной копии: {stderr}")
+            print(f"Ошибка при создании резервной копии: {stderr}")
             return False
     
     except Exception as e:
@@ -64,18 +108,28 @@ def restore_backup(backup_file):
             'psql', '-U', 'postgres', '-d', 'images_db'
         ]
         
-        # Выполняем команду, передавая содержимое файла бэкапа
-        with open(backup_path, 'r') as f:
-            result = subprocess.run(command, stdin=f, stderr=subprocess.PIPE, text=True)
+        # Выполняем команду, передавая содержимое файла бэкапа блоками
+        # (сжатые бэкапы распаковываются на лету)
+        with tempfile.TemporaryFile() as err, _open_backup(backup_path, 'rb') as f:
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=err)
+            try:
+                with proc.stdin:
+                    shutil.copyfileobj(f, proc.stdin, BACKUP_CHUNK_SIZE)
+            except BrokenPipeError:
+                # psql завершился раньше времени - причина будет в stderr
+                pass
+            returncode = proc.wait()
+            err.seek(0)
+            stderr = err.read().decode('utf-8', errors='replace')
         
         # Проверяем результат выполнения команды
-        if result.returncode == 0:
+        if returncode == 0:
             logging.info(f"База данных успешно восстановлена из: {backup_path}")
             print(f"База данных успешно восстановлена из: {backup_path}")
             return True
         else:
-            logging.error(f"Ошибка при восстановлении базы данных: {result.stderr}")
-            print(f"Ошибка при восстановлении базы данных: {result.stderr}")
+            logging.error(f"Ошибка при восстановлении базы данных: {stderr}")
+            print(f"Ошибка при восстановлении базы данных: {stderr}")
             return False
     
     except Exception as e:
@@ -88,7 +142,7 @@ if __name__ == '__main__':
     import sys
     
     if len(sys.argv) > 1 and sys.argv[1] == 'restore' and len(sys.argv) > 2:
-        # Восстановление из бэкапа: python backup_db.py restore backup_filename.sql
+        # Восстановление из бэкапа: python backup_db.py restore backup_filename.sql.zst
         restore_backup(sys.argv[2])
     else:
         # Создание бэкапа: python backup_db.py
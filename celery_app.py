@@ -8,6 +8,14 @@ Celery конфигурация для асинхронной обработки
 - Периодические задачи очистки
 - Масштабируемую архитектуру
 
+Очереди и запуск воркеров:
+- image_processing - обработка изображений (PIL), нагружает CPU:
+    celery -A celery_app worker -Q image_processing --pool=prefork --concurrency=$(nproc)
+- statistics, maintenance - запись статистики, очистка и проверки,
+  время уходит на ожидание БД и диска, поэтому используется пул потоков
+  с большим числом потоков (соединения берутся из общего пула db_pool):
+    celery -A celery_app worker -Q statistics,maintenance --pool=threads --concurrency=20
+
 Автор: Image Hosting Project
 Версия: 2.0 (Async)
 """
@@ -39,19 +47,27 @@ celery_app.conf.update(
     timezone='UTC',
     enable_utc=True,
     
-    # Настройки производительности
-    worker_prefetch_multiplier=4,
+    # Настройки производительности.
+    # Задачи разной длительности (ресайз изображений идет секунды, запись
+    # статистики - миллисекунды), поэтому процесс воркера резервирует только
+    # одно сообщение: короткие задачи не ждут за уже взятыми длинными.
+    # Планирование -Ofair (по умолчанию с Celery 4) отдает задачу только
+    # свободному дочернему процессу
+    worker_prefetch_multiplier=1,
     task_acks_late=True,
     worker_disable_rate_limits=True,
     
     # Время жизни результатов
     result_expires=3600,  # 1 час
     
-    # Маршрутизация задач
+    # Маршрутизация задач по очередям (имена задач заданы в декораторах).
+    # CPU-задачи и задачи ввода-вывода обрабатывают разные воркеры
     task_routes={
         'image_hosting.process_image': {'queue': 'image_processing'},
         'image_hosting.log_statistics': {'queue': 'statistics'},
-        'image_hosting.cleanup_expired': {'queue': 'maintenance'},
+        'image_hosting.cleanup_expired_images': {'queue': 'maintenance'},
+        'image_hosting.generate_daily_statistics': {'queue': 'maintenance'},
+        'image_hosting.system_health_check': {'queue': 'maintenance'},
     },
     
     # Периодические задачи
@@ -71,11 +87,98 @@ celery_app.conf.update(
     },
 )
 
+# Точка отсчета загрузки CPU для system_health_check: cpu_percent(interval=None)
+# возвращает загрузку с предыдущего вызова (для задачи раз в 5 минут - среднюю
+# за интервал) и не блокирует воркер на время замера. Дочерние процессы
+# воркера наследуют точку отсчета при fork
+try:
+    import psutil
+    psutil.cpu_percent(interval=None)
+except ImportError:
+    pass
+
+# libvips для создания миниатюр (опционально, без него используется Pillow).
+# Уменьшает изображение при декодировании (shrink-on-load) и обрабатывает
+# его по частям, не распаковывая фотографию целиком в память
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except (ImportError, OSError):
+    # OSError - модуль установлен, но библиотека libvips не найдена
+    PYVIPS_AVAILABLE = False
+
+# Параметры миниатюр: наибольшая сторона и качество JPEG/WebP
+THUMBNAIL_MAX_SIZE = 1920
+THUMBNAIL_QUALITY = 85
+
+
+def _thumbnail_path(file_path):
+    """Путь миниатюры: photo.jpg -> photo_thumb.jpg (точки в папке не затрагиваются)."""
+    root, ext = os.path.splitext(file_path)
+    return f'{root}_thumb{ext}'
+
+
+def _process_image_vips(file_path):
+    """
+    Размеры и формат изображения и миниатюра через libvips.
+    
+    Returns:
+        tuple: (ширина, высота, формат - 'JPEG', 'PNG' и т.д.)
+    
+    Raises:
+        pyvips.Error: Формат не поддерживается сборкой libvips
+    """
+    # Читается только заголовок: пиксели декодируются при записи миниатюры
+    img = pyvips.Image.new_from_file(file_path, access='sequential')
+    width, height = img.width, img.height
+    format_type = img.get('vips-loader').split('load')[0].upper()
+    
+    if width > THUMBNAIL_MAX_SIZE or height > THUMBNAIL_MAX_SIZE:
+        thumbnail_path = _thumbnail_path(file_path)
+        thumb = pyvips.Image.thumbnail(file_path, THUMBNAIL_MAX_SIZE, height=THUMBNAIL_MAX_SIZE, size='down')
+        if os.path.splitext(file_path)[1].lower() in ('.jpg', '.jpeg', '.webp'):
+            thumb.write_to_file(thumbnail_path, Q=THUMBNAIL_QUALITY, strip=True)
+        else:
+            thumb.write_to_file(thumbnail_path, strip=True)
+        logging.info(f"Thumbnail created: {thumbnail_path}")
+    
+    return width, height, format_type
+
+
+def _process_image_pil(file_path):
+    """
+    Размеры и формат изображения и миниатюра через Pillow.
+    
+    Returns:
+        tuple: (ширина, высота, формат - 'JPEG', 'PNG' и т.д.)
+    """
+    from PIL import Image
+    
+    with Image.open(file_path) as img:
+        # Получаем информацию об изображении
+        width, height = img.size  # Размеры изображения
+        format_type = img.format  # Формат изображения (JPEG, PNG и т.д.)
+        
+        # Создаем миниатюру (если нужно)
+        if width > THUMBNAIL_MAX_SIZE or height > THUMBNAIL_MAX_SIZE:
+            # Создаем уменьшенную версию для быстрого просмотра
+            thumbnail_path = _thumbnail_path(file_path)
+            img.thumbnail((THUMBNAIL_MAX_SIZE, THUMBNAIL_MAX_SIZE), Image.Resampling.LANCZOS)
+            # optimize=True кодирует JPEG дважды ради таблиц Хаффмана;
+            # прогрессивный JPEG с субдискретизацией 4:2:0 дает такой же
+            # размер за один проход. Для PNG и других форматов эти
+            # параметры игнорируются
+            img.save(thumbnail_path, quality=THUMBNAIL_QUALITY, progressive=True, subsampling=2)
+            
+            logging.info(f"Thumbnail created: {thumbnail_path}")
+    
+    return width, height, format_type
+
 # ============================================================================
 # АСИНХРОННЫЕ ЗАДАЧИ
 # ============================================================================
 
-@celery_app.task(bind=True, max_retries=3)
+@celery_app.task(bind=True, max_retries=3, name='image_hosting.process_image')
 def process_image_async(self, file_path, user_email, original_name):
     """
     Асинхронная обработка загруженного изображения.
@@ -89,28 +192,20 @@ def process_image_async(self, file_path, user_email, original_name):
         dict: Результат обработки
     """
     try:
-        from PIL import Image
-        import os
-        
         # Проверяем существование файла
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
-        # Открываем и анализируем изображение
-        with Image.open(file_path) as img:
-            # Получаем информацию об изображении
-            width, height = img.size  # Размеры изображения
-            format_type = img.format  # Формат изображения (JPEG, PNG и т.д.)
-          
-                        
-            # Создаем миниатюру (если нужно)
-            if width > 1920 or height > 1920:
-                # Создаем уменьшенную версию для быстрого просмотра
-                thumbnail_path = file_path.replace('.', '_thumb.')
-                img.thumbnail((1920, 1920), Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, optimize=True, quality=85)
-                
-                logging.info(f"Thumbnail created: {thumbnail_path}")
+        # Открываем и анализируем изображение: libvips, а для форматов,
+        # которые сборка libvips не поддерживает, - Pillow
+        if PYVIPS_AVAILABLE:
+            try:
+                width, height, format_type = _process_image_vips(file_path)
+            except pyvips.Error as e:
+                logging.warning(f"libvips failed for {file_path}, using Pillow: {e}")
+                width, height, format_type = _process_image_pil(file_path)
+        else:
+            width, height, format_type = _process_image_pil(file_path)
         
         # Получаем размер файла
         file_size = os.path.getsize(file_path)
@@ -143,7 +238,7 @@ def process_image_async(self, file_path, user_email, original_name):
             'error': str(exc)
         }
 
-@celery_app.task(bind=True, max_retries=3)
+@celery_app.task(bind=True, max_retries=3, name='image_hosting.log_statistics')
 def log_statistics_async(self, action_type, user_email=None, **kwargs):
     """
     Асинхронная запись статистики.
@@ -157,12 +252,16 @@ def log_statistics_async(self, action_type, user_email=None, **kwargs):
         dict: Результат записи
     """
     try:
-        from admin_db import log_statistics
+        # Пишем через буфер воркера: события из очереди сохраняются пачками.
+        # log_statistics здесь не подходит - с STATS_BACKEND=celery
+        # она снова поставила бы задачу в очередь
+        from admin_db import _log_statistics_local
         
         # Записываем статистику
-        success = log_statistics(
+        success = _log_statistics_local(
             action_type=action_type,
             user_email=user_email,
+            file_id=kwargs.get('file_id'),
             ip_address=kwargs.get('ip_address'),
             user_agent=kwargs.get('user_agent'),
             additional_info=kwargs.get('additional_info')
@@ -182,40 +281,85 @@ def log_statistics_async(self, action_type, user_email=None, **kwargs):
         
         return {'status': 'error', 'error': str(exc)}
 
-@celery_app.task
+@celery_app.task(name='image_hosting.cleanup_expired_images')
 def cleanup_expired_images():
     """
     Периодическая очистка просроченных изображений.
     
+    Файлы удаляются параллельно в пуле потоков (unlink отпускает GIL),
+    записи из БД - одним запросом DELETE ... WHERE id = ANY(...).
+    Запись остается в БД, если ее файл удалить не удалось.
+    
     Returns:
         dict: Результат очистки
     """
     try:
-        from db import get_expired_images, delete_image
+        from db import get_expired_images, delete_images_bulk
+        from concurrent.futures import ThreadPoolExecutor
         import os
         
         expired_images = get_expired_images()
-        deleted_count = 0
         errors = []
         
+        # Группируем файлы по папкам пользователей: каждая папка открывается
+        # один раз, и файлы удаляются относительно нее (unlink с dir_fd) без
+        # разбора полного пути на каждый файл
+        upload_folder = os.getenv('UPLOAD_FOLDER', 'images')
+        use_dir_fd = os.unlink in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+        removed_ids = []
+        by_folder = {}
         for image in expired_images:
+            image_id = image[0]
+            filename = image[1]
+            user_email = image[6]
+            if user_email and filename:
+                by_folder.setdefault(os.path.join(upload_folder, user_email), []).append((image_id, filename))
+            else:
+                # Файла нет - удаляем только запись
+                removed_ids.append(image_id)
+        
+        def remove_folder_files(item):
+            """Удаляет файлы одной папки; возвращает (удаленные ID, ошибки)."""
+            folder, files = item
+            removed, folder_errors = [], []
+            try:
+                # Без поддержки dir_fd (Windows) файлы удаляются по полному пути
+                dir_fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY) if use_dir_fd else None
+            except FileNotFoundError:
+                # Папки нет - файлов тоже нет
+                return [image_id for image_id, _ in files], folder_errors
+            except OSError as e:
+                return removed, [f"Error opening folder {folder}: {str(e)}"]
             try:
-                image_id = image[0]
-                filename = image[1]
-                user_email = image[6]
-                
-                # Удаляем файл
-                if user_email and filename:
-                    file_path = os.path.join('images', user_email, filename)
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                
-                # Удаляем запись из БД
-                delete_image(image_id)
-                deleted_count += 1
-                
-            except Exception as e:
-                errors.append(f"Error deleting image {image_id}: {str(e)}")
+                for image_id, filename in files:
+                    try:
+                        if dir_fd is not None:
+                            os.unlink(filename, dir_fd=dir_fd)
+                        else:
+                            os.unlink(os.path.join(folder, filename))
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        folder_errors.append(f"Error deleting image {image_id}: {str(e)}")
+                        continue
+                    removed.append(image_id)
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+            return removed, folder_errors
+        
+        # Папки обрабатываются параллельно: задержки диска перекрываются
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            for removed, folder_errors in pool.map(remove_folder_files, by_folder.items()):
+                removed_ids.extend(removed)
+                errors.extend(folder_errors)
+        
+        # Удаляем записи из БД одним запросом
+        try:
+            deleted_count = len(delete_images_bulk(removed_ids))
+        except Exception as e:
+            deleted_count = 0
+            errors.append(f"Error deleting {len(removed_ids)} images from database: {str(e)}")
         
         # Логируем результат
         log_statistics_async.delay(
@@ -233,7 +377,7 @@ def cleanup_expired_images():
         logging.error(f"Cleanup task failed: {e}")
         return {'status': 'error', 'error': str(e)}
 
-@celery_app.task
+@celery_app.task(name='image_hosting.generate_daily_statistics')
 def generate_daily_statistics():
     """
     Генерация ежедневной статистики.
@@ -264,7 +408,7 @@ def generate_daily_statistics():
         logging.error(f"Daily statistics generation failed: {e}")
         return {'status': 'error', 'error': str(e)}
 
-@celery_app.task
+@celery_app.task(name='image_hosting.system_health_check')
 def system_health_check():
     """
     Периодическая проверка здоровья системы.
@@ -281,7 +425,7 @@ def system_health_check():
         db_health = db_pool.health_check()
         
         # Проверка системных ресурсов
-        cpu_percent = psutil.cpu_percent(interval=1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
@@ -18,9 +18,13 @@ CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_upload_time
 ON images(upload_time DESC);
 
 -- Индекс по дате истечения для очистки просроченных файлов
-CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_expires_at 
-ON images(expires_at) 
-WHERE expires_at IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_expiration_date 
+ON images(expiration_date) 
+WHERE expiration_date IS NOT NULL;
+
+-- Составной индекс для выборки изображений пользователя по списку ID
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_user_id 
+ON images(user_email, id);
 
 -- Составной индекс для пагинации пользовательских изображений
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_images_user_time 
@@ -58,15 +62,45 @@ ON statistics(action_type);
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_statistics_timestamp 
 ON statistics(timestamp DESC);
 
+-- Покрывающий индекс для keyset-пагинации журнала действий:
+-- WHERE (timestamp, id) < (...) ORDER BY timestamp DESC, id DESC LIMIT N.
+-- INCLUDE содержит все выбираемые колонки, поэтому страница читается
+-- index-only scan'ом в нужном порядке - без обращения к таблице и без сортировки.
+-- Он заменяет прежний idx_statistics_time_id с тем же ключом
+DROP INDEX CONCURRENTLY IF EXISTS idx_statistics_time_id;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stats_ts_desc 
+ON statistics(timestamp DESC, id DESC) 
+INCLUDE (action_type, user_email, ip_address, additional_info);
+
 -- Индекс по пользователю для персональной статистики
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_statistics_user_email 
 ON statistics(user_email) 
 WHERE user_email IS NOT NULL;
 
+-- Частичный индекс только по скачиваниям для счетчика на панели администратора:
+-- COUNT(*) WHERE action_type = 'download' выполняется index-only scan'ом
+-- по маленькому индексу (нужна актуальная visibility map, ее поддерживает
+-- autovacuum; после массовой загрузки данных выполните VACUUM statistics)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_statistics_downloads 
+ON statistics(action_type) 
+WHERE action_type = 'download';
+
 -- Составной индекс для частых запросов статистики
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_statistics_type_time 
 ON statistics(action_type, timestamp DESC);
 
+-- Покрывающие индексы для журнала с фильтром по типу действия или
+-- по пользователю: равенство по первой колонке дает уже отсортированный
+-- диапазон (timestamp DESC, id DESC), который обрезается LIMIT
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stats_type_ts_desc 
+ON statistics(action_type, timestamp DESC, id DESC) 
+INCLUDE (user_email, ip_address, additional_info);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stats_user_ts_desc 
+ON statistics(user_email, timestamp DESC, id DESC) 
+INCLUDE (action_type, ip_address, additional_info) 
+WHERE user_email IS NOT NULL;
+
 -- Составной индекс для пользовательской статистики
 CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_statistics_user_type_time 
 ON statistics(user_email, action_type, timestamp DESC) 
@@ -149,6 +183,10 @@ END $$;
 CREATE INDEX IF NOT EXISTS idx_statistics_part_action_type ON statistics(action_type);
 CREATE INDEX IF NOT EXISTS idx_statistics_part_timestamp ON statistics(timestamp DESC);
 CREATE INDEX IF NOT EXISTS idx_statistics_part_user_email ON statistics(user_email) WHERE user_email IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_statistics_part_downloads ON statistics(action_type) WHERE action_type = 'download';
+CREATE INDEX IF NOT EXISTS idx_statistics_part_ts_desc ON statistics(timestamp DESC, id DESC) INCLUDE (action_type, user_email, ip_address, additional_info);
+CREATE INDEX IF NOT EXISTS idx_statistics_part_type_ts_desc ON statistics(action_type, timestamp DESC, id DESC) INCLUDE (user_email, ip_address, additional_info);
+CREATE INDEX IF NOT EXISTS idx_statistics_part_user_ts_desc ON statistics(user_email, timestamp DESC, id DESC) INCLUDE (action_type, ip_address, additional_info) WHERE user_email IS NOT NULL;
 
 -- ============================================================================
 -- ФУНКЦИИ ДЛЯ АВТОМАТИЧЕСКОГО СОЗДАНИЯ ПАРТИЦИЙ
@@ -18,10 +18,28 @@
 # ============================================================================
 
 import psycopg2                    # Драйвер PostgreSQL для Python
+import psycopg2.extensions         # Базовый класс курсора (кортежи)
+import psycopg2.pool               # Ошибка исчерпания пула соединений (PoolError)
 from psycopg2 import OperationalError  # Исключения операций БД
-import hashlib                     # Хеширование паролей (SHA-256)
+from psycopg2.extras import RealDictCursor, execute_values  # Курсор-словарь и пакетная вставка
+import hashlib                     # Проверка паролей в прежнем формате (SHA-256)
+import hmac                        # Сравнение хешей за постоянное время
+import io                          # Буфер данных для COPY
+import struct                      # Кодирование строк двоичного формата COPY
+import threading                   # Блокировка при ленивой инициализации пула
+import time                        # Интервал повторной попытки создания пула
+from contextlib import ExitStack, contextmanager  # Контекстный менеджер курсора и соединения пула
 from datetime import datetime, timedelta  # Работа с датой и временем
 import os                          # Переменные окружения
+from typing import Final           # Константы конфигурации
+
+# Argon2 для хеширования паролей (опционально, без него - SHA-256)
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHash, VerificationError
+    ARGON2_AVAILABLE = True
+except ImportError:
+    ARGON2_AVAILABLE = False
 
 # ============================================================================
 # КОНФИГУРАЦИЯ ПОДКЛЮЧЕНИЯ К POSTGRESQL
@@ -35,6 +53,19 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "")             # Пароль БД
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")            # Хост БД (localhost)
 DB_PORT = int(os.getenv("DB_PORT", "5432"))            # Порт БД (стандартный PostgreSQL)
 
+# ============================================================================
+# КОНФИГУРАЦИЯ АДМИНИСТРАТОРОВ
+# ============================================================================
+
+# Основной администратор (ADMIN_EMAIL) и список администраторов
+# (ADMIN_EMAILS: "admin1@example.com,admin2@example.com") задаются при
+# развертывании, поэтому разбираются один раз при импорте модуля.
+# Основной администратор всегда входит в множество
+MAIN_ADMIN_EMAIL: Final[str] = os.getenv('ADMIN_EMAIL', 'admin@example.com')
+ADMIN_EMAILS: Final[frozenset[str]] = frozenset(
+    e.strip() for e in os.getenv('ADMIN_EMAILS', 'admin@example.com').split(',') if e.strip()
+) | {MAIN_ADMIN_EMAIL}
+
 # ============================================================================
 # ФУНКЦИИ ПОДКЛЮЧЕНИЯ К БАЗЕ ДАННЫХ
 # ============================================================================
@@ -107,10 +138,137 @@ def close_db(conn):
         conn.close()
 
 
+# ============================================================================
+# ПУЛ СОЕДИНЕНИЙ И КОНТЕКСТНЫЙ МЕНЕДЖЕР КУРСОРА
+# ============================================================================
+
+# Пул создается лениво при первом запросе: модуль db_pool открывает
+# соединения при импорте, а БД может быть еще недоступна при старте
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_pool_retry_at = 0.0
+
+# Через сколько секунд повторять попытку создать пул после неудачи
+DB_POOL_RETRY_INTERVAL = 30
+
+
+def get_db_pool():
+    """
+    Возвращает общий пул соединений или None, если он недоступен.
+    
+    Неудачная попытка запоминается на DB_POOL_RETRY_INTERVAL секунд,
+    чтобы не пытаться создать пул на каждом запросе.
+    
+    Returns:
+        DatabasePool: Экземпляр пула из модуля db_pool или None
+    """
+    global _db_pool, _db_pool_retry_at
+    if _db_pool is not None or time.monotonic() < _db_pool_retry_at:
+        return _db_pool
+    
+    with _db_pool_lock:
+        if _db_pool is None and time.monotonic() >= _db_pool_retry_at:
+            try:
+                from db_pool import db_pool
+                _db_pool = db_pool
+            except Exception as e:
+                print(f'Database pool unavailable, using direct connections: {e}')
+                _db_pool_retry_at = time.monotonic() + DB_POOL_RETRY_INTERVAL
+    return _db_pool
+
+
+@contextmanager
+def _acquire_connection():
+    """Выдает соединение из пула, а без пула - прямое соединение connect_db()."""
+    pool = get_db_pool()
+    if pool is not None:
+        # Исчерпание пула (PoolError) - тоже недоступность БД: вызывающий код
+        # обрабатывает OperationalError, как при ошибке прямого подключения
+        with ExitStack() as stack:
+            try:
+                conn = stack.enter_context(pool.get_connection())
+            except psycopg2.pool.PoolError as e:
+                raise OperationalError(f'Database connection pool error: {e}') from e
+            yield conn
+        return
+    
+    conn = connect_db()
+    if conn is None:
+        raise OperationalError('Database connection is not available')
+    try:
+        yield conn
+    finally:
+        close_db(conn)
+
+
+@contextmanager
+def db_cursor(dict_cursor=False, name=None):
+    """
+    Контекстный менеджер курсора поверх пула соединений.
+    
+    Берет соединение из пула (или открывает прямое, если пул недоступен),
+    фиксирует транзакцию при успешном выходе из блока и откатывает ее
+    при исключении. Курсор закрывается, соединение возвращается в пул.
+    
+    Использование:
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM images")
+            total = cur.fetchone()[0]
+    
+    Args:
+        dict_cursor (bool): True - строки в виде словарей (RealDictCursor),
+                            False - обычные кортежи
+        name (str, optional): Имя серверного (именованного) курсора. Строки
+                            такого курсора читаются с сервера порциями по
+                            cur.itersize, а не целиком в память
+    
+    Yields:
+        psycopg2.cursor: Курсор базы данных
+    
+    Raises:
+        OperationalError: Если соединение с БД установить не удалось
+    """
+    # Фабрика указывается явно: у соединений пула по умолчанию RealDictCursor
+    cursor_factory = RealDictCursor if dict_cursor else psycopg2.extensions.cursor
+    with _acquire_connection() as conn:
+        cur = conn.cursor(name=name, cursor_factory=cursor_factory)
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            # Если сервер разорвал соединение, rollback сам завершится
+            # ошибкой (InterfaceError) - наружу уходит исходное исключение,
+            # которое обрабатывают вызывающие функции (OperationalError)
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                # Закрытие серверного курсора на разорванном соединении
+                pass
+
+
 # ============================================================================
 # ФУНКЦИИ СОЗДАНИЯ ТАБЛИЦ
 # ============================================================================
 
+# Индексы таблицы images для пакетных запросов:
+# - (user_email, id): выборка изображений пользователя по списку ID
+#   (get_images_by_ids) и удаление с проверкой владельца
+# - частичный индекс по expiration_date: поиск просроченных изображений
+#   читает только строки со сроком хранения, а не всю таблицу
+IMAGES_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_images_user_id ON images(user_email, id)",
+    "CREATE INDEX IF NOT EXISTS idx_images_expiration_date ON images(expiration_date) "
+    "WHERE expiration_date IS NOT NULL",
+)
+
+
 def create_table_images():
     """
     Создание таблицы изображений в базе данных.
@@ -127,6 +285,7 @@ def create_table_images():
         - file_type: Тип/расширение файла
         - user_email: Email владельца (внешний ключ)
         - expiration_date: Дата истечения срока хранения
+        - crc32: Контрольная сумма CRC-32 файла (для ZIP-архивов без сжатия)
     
     Returns:
         bool: True при успешном создании, False при ошибке
@@ -135,13 +294,6 @@ def create_table_images():
         Использует CASCADE для автоматического удаления изображений
         при удалении пользователя
     """
-    conn = connect_db()
-    if not conn:
-        print("Не удалось подключиться к базе данных для создания таблицы")
-        return False
-    
-    cur = conn.cursor()
-
     # SQL запрос для создания таблицы изображений
     sql = """
         CREATE TABLE IF NOT EXISTS images (
@@ -153,18 +305,31 @@ def create_table_images():
         file_type TEXT NOT NULL,                  -- Тип файла (расширение)
         user_email TEXT,                          -- Email владельца
         expiration_date TIMESTAMP,                -- Дата истечения срока
+        crc32 BIGINT,                             -- CRC-32 содержимого файла
         FOREIGN KEY (user_email) REFERENCES users(email) ON DELETE CASCADE
     );"""
-    # Выполняем SQL запрос для создания таблицы
-    cur.execute(sql)
-    conn.commit()  # Подтверждаем изменения в БД
-
-    # Закрываем курсор и соединение
-    cur.close()
-    close_db(conn)
+    # Выполняем SQL запрос для создания таблицы; db_cursor фиксирует
+    # транзакцию и возвращает соединение в пул
+    try:
+        with db_cursor() as cur:
+            cur.execute(sql)
+            for index_sql in IMAGES_INDEX_SQL:
+                cur.execute(index_sql)
+    except OperationalError:
+        print("Не удалось подключиться к базе данных для создания таблицы")
+        return False
     return True
 
 
+# Признак "активного" пользователя для фильтра ACTIVE_USERS в статистике:
+# адреса без example.com и без admin. Колонка вычисляется PostgreSQL при
+# вставке, поэтому фильтр не сканирует statistics с LIKE '%...%'
+ACTIVE_USER_EXPRESSION = "email NOT LIKE '%example.com%' AND LOWER(email) NOT LIKE '%admin%'"
+
+# Частичный индекс по активным пользователям для полусоединения со statistics
+ACTIVE_USERS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_users_active ON users(email) WHERE is_active_user"
+
+
 def create_table_users():
     """
     Создание таблицы пользователей в базе данных.
@@ -174,8 +339,9 @@ def create_table_users():
     
     Структура таблицы:
         - email: Email пользователя (первичный ключ)
-        - password_hash: Хеш пароля (SHA-256)
+        - password_hash: Хеш пароля (Argon2id, у старых записей SHA-256)
         - registration_date: Дата регистрации (автоматически)
+        - is_active_user: Признак реального пользователя (вычисляется из email)
     
     Returns:
         bool: True при успешном создании, False при ошибке
@@ -184,28 +350,23 @@ def create_table_users():
         Пароли хранятся в виде хеша для безопасности.
         Email используется как уникальный идентификатор пользователя.
     """
-    conn = connect_db()
-    if not conn:
-        print("Не удалось подключиться к базе данных для создания таблицы пользователей")
-        return False
-    
-    cur = conn.cursor()
-
     # SQL запрос для создания таблицы пользователей
     sql = """
         CREATE TABLE IF NOT EXISTS users (
         email TEXT PRIMARY KEY,                   -- Email (уникальный идентификатор)
-        password_hash TEXT NOT NULL,              -- Хеш пароля (SHA-256)
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- Дата регистрации
-    );"""
+        password_hash TEXT NOT NULL,              -- Хеш пароля (Argon2id или SHA-256)
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Дата регистрации
+        is_active_user BOOLEAN GENERATED ALWAYS AS ({expr}) STORED  -- Реальный (не тестовый и не админский) пользователь
+    );""".format(expr=ACTIVE_USER_EXPRESSION)
     
     # Выполняем SQL запрос для создания таблицы
-    cur.execute(sql)
-    conn.commit()  # Подтверждаем изменения в БД
-
-    # Закрываем курсор и соединение
-    cur.close()
-    close_db(conn)
+    try:
+        with db_cursor() as cur:
+            cur.execute(sql)
+            cur.execute(ACTIVE_USERS_INDEX_SQL)
+    except OperationalError:
+        print("Не удалось подключиться к базе данных для создания таблицы пользователей")
+        return False
     return True
 
 
@@ -230,18 +391,12 @@ def save_image(filename, original_name, size, upload_time, file_type, user_email
         storage_days (int): Количество дней хранения (по умолчанию 30)
     
     Returns:
-        bool: True при успешном сохранении, False при ошибке
+        int: ID созданной записи (из RETURNING id) или None при ошибке
         
     Note:
         Для авторизованных пользователей устанавливается срок хранения.
         Анонимные загрузки (user_email=None) хранятся без ограничений.
     """
-    conn = connect_db()
-    if not conn:
-        return False
-    
-    cur = conn.cursor()
-
     # Вычисляем дату истечения срока хранения
     # Только для авторизованных пользователей
     expiration_date = None
@@ -249,19 +404,143 @@ def save_image(filename, original_name, size, upload_time, file_type, user_email
         expiration_date = datetime.now() + timedelta(days=storage_days)
 
     # SQL запрос для вставки метаданных изображения
+    # RETURNING id возвращает ключ новой записи в том же запросе
     sql = """
         INSERT INTO images (filename, original_name, size, upload_time, file_type, user_email, expiration_date)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
     """
     
-    # Выполняем запрос с параметрами (защита от SQL-инъекций)
-    cur.execute(sql, (filename, original_name, size, upload_time, file_type, user_email, expiration_date))
-    conn.commit()  # Подтверждаем изменения в БД
+    # Вставка и получение ID выполняются на одном соединении из пула;
+    # db_cursor фиксирует транзакцию и возвращает соединение в пул
+    try:
+        with db_cursor() as cur:
+            # Выполняем запрос с параметрами (защита от SQL-инъекций)
+            cur.execute(sql, (filename, original_name, size, upload_time, file_type, user_email, expiration_date))
+            return cur.fetchone()[0]
+    except OperationalError:
+        # Нет подключения к базе данных
+        return None
 
-    # Закрываем курсор и соединение
-    cur.close()
-    close_db(conn)
-    return True
+
+# ============================================================================
+# ДВОИЧНЫЙ COPY ДЛЯ ПАКЕТНОЙ ВСТАВКИ ИЗОБРАЖЕНИЙ
+# ============================================================================
+
+# Начиная с этого числа строк save_images_bulk использует COPY вместо
+# INSERT ... VALUES: на малых пакетах лишний запрос nextval не окупается
+COPY_BULK_THRESHOLD: Final[int] = int(os.getenv('COPY_BULK_THRESHOLD', '10'))
+
+# Заголовок двоичного формата COPY: сигнатура, флаги, длина расширения
+_COPY_HEADER: Final[bytes] = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+_COPY_TRAILER: Final[bytes] = struct.pack('!h', -1)
+_COPY_NULL: Final[bytes] = struct.pack('!i', -1)
+# Точка отсчета TIMESTAMP в PostgreSQL (микросекунды от 2000-01-01)
+_PG_EPOCH: Final[datetime] = datetime(2000, 1, 1)
+
+
+def _copy_field(value, int_size=4):
+    """
+    Кодирование одного значения в двоичный формат COPY (длина + данные).
+    
+    Поддерживаются типы столбцов images: INTEGER (int_size=4),
+    BIGINT (int_size=8), TEXT, TIMESTAMP и NULL.
+    """
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, datetime):
+        delta = value - _PG_EPOCH
+        micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+        return struct.pack('!iq', 8, micros)
+    if isinstance(value, int):
+        return struct.pack('!iq' if int_size == 8 else '!ii', int_size, value)
+    data = value.encode('utf-8')
+    return struct.pack('!i', len(data)) + data
+
+
+def _copy_images(cur, values):
+    """
+    Вставка записей изображений через COPY ... FROM STDIN (FORMAT BINARY).
+    
+    COPY не поддерживает RETURNING, поэтому ID заранее выделяются из
+    последовательности столбца images.id и передаются вместе с данными.
+    
+    Args:
+        cur: Курсор открытой транзакции
+        values (list): Кортежи (filename, original_name, size, upload_time,
+                       file_type, user_email, expiration_date, crc32)
+    
+    Returns:
+        list: ID созданных записей в порядке values
+    """
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('images', 'id')) FROM generate_series(1, %s)",
+        (len(values),)
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    
+    field_count = struct.pack('!h', 9)
+    buffer = io.BytesIO()
+    buffer.write(_COPY_HEADER)
+    for image_id, row in zip(ids, values):
+        buffer.write(field_count)
+        buffer.write(_copy_field(image_id))
+        for value in row[:-1]:
+            buffer.write(_copy_field(value))
+        # crc32 хранится в BIGINT: значения до 2^32 не помещаются в INTEGER
+        buffer.write(_copy_field(row[-1], int_size=8))
+    buffer.write(_COPY_TRAILER)
+    buffer.seek(0)
+    
+    cur.copy_expert("""
+        COPY images (id, filename, original_name, size, upload_time, file_type, user_email, expiration_date, crc32)
+        FROM STDIN WITH (FORMAT BINARY)
+    """, buffer)
+    return ids
+
+
+def save_images_bulk(rows):
+    """
+    Сохранение метаданных нескольких изображений одним запросом.
+    
+    Все записи вставляются одним INSERT ... VALUES ... RETURNING id
+    (от COPY_BULK_THRESHOLD строк - двоичным COPY, см. _copy_images)
+    в одной транзакции: при ошибке не сохраняется ни одна запись.
+    
+    Args:
+        rows (list): Кортежи (filename, original_name, size, upload_time,
+                     file_type, user_email, storage_days, crc32)
+    
+    Returns:
+        list: ID созданных записей в порядке rows
+        
+    Raises:
+        psycopg2.Error: При ошибке БД (например, нарушении внешнего ключа)
+    """
+    if not rows:
+        return []
+    
+    now = datetime.now()
+    values = [
+        (filename, original_name, size, upload_time, file_type, user_email,
+         # Срок хранения - только для авторизованных пользователей
+         now + timedelta(days=storage_days) if user_email else None,
+         crc32)
+        for filename, original_name, size, upload_time, file_type, user_email, storage_days, crc32 in rows
+    ]
+    
+    with db_cursor() as cur:
+        if len(values) >= COPY_BULK_THRESHOLD:
+            return _copy_images(cur, values)
+        
+        # page_size не меньше числа строк - весь пакет уходит одним запросом,
+        # и RETURNING возвращает ID в порядке VALUES
+        result = execute_values(cur, """
+            INSERT INTO images (filename, original_name, size, upload_time, file_type, user_email, expiration_date, crc32)
+            VALUES %s
+            RETURNING id
+        """, values, page_size=len(values), fetch=True)
+        return [row[0] for row in result]
 
 
 def get_images_list(page=1, per_page=10, sort_by='upload_time'):
@@ -274,25 +553,19 @@ def get_images_list(page=1, per_page=10, sort_by='upload_time'):
     Returns:
         list: Список кортежей с данными изображений
     """
-    conn = connect_db()
-    if not conn:
-        return []
-    
-    cur = conn.cursor()
-    
     # Валидация параметров сортировки
     allowed_columns = ['id', 'filename', 'size', 'upload_time']
     sort_by = sort_by if sort_by in allowed_columns else 'upload_time'
     
     # Расчёт смещения для SQL запроса
     offset = (page - 1) * per_page
-    query = f"SELECT * FROM images ORDER BY {sort_by} DESC LIMIT {per_page} OFFSET {offset}"
-    cur.execute(query)
-    result = cur.fetchall()
-    
-    cur.close()
-    close_db(conn)
-    return result
+    query = f"SELECT * FROM images ORDER BY {sort_by} DESC LIMIT %s OFFSET %s"
+    try:
+        with db_cursor() as cur:
+            cur.execute(query, (per_page, offset))
+            return cur.fetchall()
+    except OperationalError:
+        return []
 
 
 def get_total_images():
@@ -301,17 +574,12 @@ def get_total_images():
     Returns:
         int: Количество изображений
     """
-    conn = connect_db()
-    if not conn:
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM images")
+            return cur.fetchone()[0]
+    except OperationalError:
         return 0
-    
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM images")
-    result = cur.fetchone()[0]
-    
-    cur.close()
-    close_db(conn)
-    return result
 
 
 def get_image_by_id(image_id):
@@ -322,17 +590,12 @@ def get_image_by_id(image_id):
     Returns:
         tuple: Кортеж с данными изображения или None, если изображение не найдено
     """
-    conn = connect_db()
-    if not conn:
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM images WHERE id = %s", (image_id,))
+            return cur.fetchone()
+    except OperationalError:
         return None
-    
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM images WHERE id = %s", (image_id,))
-    result = cur.fetchone()
-    
-    cur.close()
-    close_db(conn)
-    return result
 
 
 def delete_image(image_id):
@@ -343,17 +606,61 @@ def delete_image(image_id):
     Returns:
         bool: True, если удаление прошло успешно, иначе False
     """
-    conn = connect_db()
-    if not conn:
+    try:
+        with db_cursor() as cur:
+            cur.execute("DELETE FROM images WHERE id = %s", (image_id,))
+    except OperationalError:
         return False
+    return True
+
+
+def get_images_by_ids(image_ids, user_email=None):
+    """
+    Получает информацию о нескольких изображениях одним запросом
+    Args:
+        image_ids (list): Список ID изображений
+        user_email (str, optional): Если указан, возвращаются только
+                                    изображения этого пользователя
+    Returns:
+        list: Кортежи с данными найденных изображений (в том же формате,
+              что и get_image_by_id); отсутствующие ID пропускаются
+    """
+    if not image_ids:
+        return []
     
-    cur = conn.cursor()
-    cur.execute("DELETE FROM images WHERE id = %s", (image_id,))
-    conn.commit()
+    with db_cursor() as cur:
+        if user_email is None:
+            cur.execute("SELECT * FROM images WHERE id = ANY(%s)", (list(image_ids),))
+        else:
+            cur.execute(
+                "SELECT * FROM images WHERE id = ANY(%s) AND user_email = %s",
+                (list(image_ids), user_email)
+            )
+        return cur.fetchall()
+
+
+def delete_images_bulk(image_ids, user_email=None):
+    """
+    Удаляет несколько изображений из базы данных одним запросом
+    Args:
+        image_ids (list): Список ID изображений
+        user_email (str, optional): Если указан, удаляются только
+                                    изображения этого пользователя
+    Returns:
+        list: Кортежи (id, filename) фактически удаленных записей
+    """
+    if not image_ids:
+        return []
     
-    cur.close()
-    close_db(conn)
-    return True
+    sql = "DELETE FROM images WHERE id = ANY(%s)"
+    params = [list(image_ids)]
+    if user_email is not None:
+        sql += " AND user_email = %s"
+        params.append(user_email)
+    
+    with db_cursor() as cur:
+        cur.execute(sql + " RETURNING id, filename", params)
+        return cur.fetchall()
     
 
 
@@ -365,6 +672,69 @@ def delete_image(image_id):
 
 
 
+# ============================================================================
+# ХЕШИРОВАНИЕ ПАРОЛЕЙ
+# ============================================================================
+
+# Параметры Argon2id: 2 прохода по 64MB памяти в 2 потока (~50ms на
+# проверку). Вычисление идет в C-коде argon2-cffi без GIL
+if ARGON2_AVAILABLE:
+    _password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
+
+def hash_password(password):
+    """
+    Хеширование пароля для хранения в users.password_hash.
+    
+    Args:
+        password (str): Пароль в открытом виде
+    
+    Returns:
+        str: Хеш Argon2id ($argon2id$...), без argon2-cffi - SHA-256 (hex)
+    """
+    if ARGON2_AVAILABLE:
+        return _password_hasher.hash(password)
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def verify_password(stored_hash, password):
+    """
+    Проверка пароля по сохраненному хешу.
+    
+    Поддерживает хеши Argon2 и хеши SHA-256 пользователей,
+    зарегистрированных до перехода на Argon2.
+    
+    Args:
+        stored_hash (str): Хеш из users.password_hash
+        password (str): Пароль в открытом виде
+    
+    Returns:
+        bool: True если пароль верный
+    """
+    if stored_hash.startswith('$argon2'):
+        if not ARGON2_AVAILABLE:
+            print('Argon2 password hash found, but argon2-cffi is not installed')
+            return False
+        try:
+            return _password_hasher.verify(stored_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+    
+    return hmac.compare_digest(stored_hash, hashlib.sha256(password.encode()).hexdigest())
+
+
+def password_needs_rehash(stored_hash):
+    """
+    Нужно ли пересчитать хеш после успешного входа: хеш SHA-256 или
+    Argon2 с параметрами, отличными от текущих.
+    """
+    if not ARGON2_AVAILABLE:
+        return False
+    if not stored_hash.startswith('$argon2'):
+        return True
+    return _password_hasher.check_needs_rehash(stored_hash)
+
+
 def register_user(email, password):
     """
     Регистрирует нового пользователя с проверкой безопасности.
@@ -384,19 +754,10 @@ def register_user(email, password):
     Security Notes:
         - Блокирует регистрацию с email главного администратора
         - Блокирует регистрацию с email из списка администраторов
-        - Использует безопасное хеширование SHA-256
+        - Хеширует пароль Argon2id (hash_password)
     """
-    # Получаем список администраторов из переменных окружения
-    admin_email = os.getenv('ADMIN_EMAIL', 'admin@example.com')
-    admin_emails_str = os.getenv('ADMIN_EMAILS', 'admin@example.com')
-    admin_emails = [e.strip() for e in admin_emails_str.split(',') if e.strip()]
-    
-    # Добавляем главный email администратора в список, если его там нет
-    if admin_email not in admin_emails:
-        admin_emails.append(admin_email)
-    
     # Проверяем, пытается ли пользователь зарегистрироваться с email администратора
-    if email in admin_emails:
+    if email in ADMIN_EMAILS:
         # Для администратора проверяем соответствие пароля из переменных окружения
         admin_password = os.getenv('ADMIN_PASSWORD')
         if not admin_password:
@@ -412,67 +773,67 @@ def register_user(email, password):
         # Если email и пароль администратора совпадают с переменными окружения, разрешаем регистрацию
         # Это позволяет администратору зарегистрироваться с правильными данными
     
-    conn = connect_db()
-    if not conn:
-        return False, "Ошибка подключения к базе данных"
-    
-    # Проверяем, существует ли пользователь с таким email
-    cur = conn.cursor()
-    cur.execute("SELECT email FROM users WHERE email = %s", (email,))
-    if cur.fetchone():
-        cur.close()
-        close_db(conn)
-        return False, "Пользователь с таким email уже существует"
-    
-    # Хешируем пароль
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    # Хешируем пароль до получения соединения: Argon2 занимает десятки
+    # миллисекунд, соединение пула на это время не удерживается
+    password_hash = hash_password(password)
     
-    # Добавляем пользователя в базу данных
     try:
-        cur.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s)", (email, password_hash))
-        conn.commit()
-        cur.close()
-        close_db(conn)
+        with db_cursor() as cur:
+            # Проверяем, существует ли пользователь с таким email
+            cur.execute("SELECT email FROM users WHERE email = %s", (email,))
+            if cur.fetchone():
+                return False, "Пользователь с таким email уже существует"
+            
+            # Добавляем пользователя в базу данных
+            cur.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s)", (email, password_hash))
         return True, "Регистрация прошла успешно"
+    except OperationalError:
+        return False, "Ошибка подключения к базе данных"
     except Exception as e:
-        conn.rollback()
-        cur.close()
-        close_db(conn)
+        # db_cursor уже откатил транзакцию
         return False, f"Ошибка при регистрации: {str(e)}"
 
 
 def authenticate_user(email, password):
     """
     Аутентифицирует пользователя
+    
+    Хеш SHA-256 (пользователи, зарегистрированные до перехода на Argon2)
+    после успешного входа заменяется хешем Argon2id.
+    
     Args:
         email (str): Email пользователя
         password (str): Пароль пользователя
     Returns:
         tuple: (bool, str) - статус аутентификации и сообщение
     """
-    conn = connect_db()
-    if not conn:
-        return False, "Ошибка подключения к базе данных"
-    
-    cur = conn.cursor()
-    
     # Сначала проверяем, существует ли пользователь
-    cur.execute("SELECT email, password_hash FROM users WHERE email = %s", (email,))
-    user = cur.fetchone()
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT email, password_hash FROM users WHERE email = %s", (email,))
+            user = cur.fetchone()
+    except psycopg2.Error:
+        # Включая PoolError: при исчерпании пула соединений вход
+        # возвращает сообщение об ошибке, а не 500
+        return False, "Ошибка подключения к базе данных"
     
     if not user:
-        cur.close()
-        close_db(conn)
         return False, "Пользователь с таким email не зарегистрирован. Пожалуйста, зарегистрируйтесь."
     
     # Если пользователь существует, проверяем пароль
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
     stored_password_hash = user[1]
     
-    cur.close()
-    close_db(conn)
-    
-    if password_hash == stored_password_hash:
+    if verify_password(stored_password_hash, password):
+        if password_needs_rehash(stored_password_hash):
+            try:
+                with db_cursor() as cur:
+                    cur.execute(
+                        "UPDATE users SET password_hash = %s WHERE email = %s AND password_hash = %s",
+                        (hash_password(password), email, stored_password_hash)
+                    )
+            except psycopg2.Error as e:
+                # Вход не срывается: хеш будет обновлен при следующем входе
+                print(f'Error rehashing password for {email}: {str(e)}')
         return True, "Аутентификация прошла успешно"
     else:
         return False, "Неверный пароль. Проверьте правильность ввода."
@@ -488,19 +849,14 @@ def get_user_images(email, page=1, per_page=10):
     Returns:
         list: Список изображений пользователя
     """
-    conn = connect_db()
-    if not conn:
-        return []
-    
-    cur = conn.cursor()
     offset = (page - 1) * per_page
-    cur.execute("SELECT * FROM images WHERE user_email = %s ORDER BY upload_time DESC LIMIT %s OFFSET %s", 
-                (email, per_page, offset))
-    result = cur.fetchall()
-    
-    cur.close()
-    close_db(conn)
-    return result
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM images WHERE user_email = %s ORDER BY upload_time DESC LIMIT %s OFFSET %s", 
+                        (email, per_page, offset))
+            return cur.fetchall()
+    except OperationalError:
+        return []
 
 
 def get_total_user_images(email):
@@ -511,17 +867,12 @@ def get_total_user_images(email):
     Returns:
         int: Количество изображений пользователя
     """
-    conn = connect_db()
-    if not conn:
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM images WHERE user_email = %s", (email,))
+            return cur.fetchone()[0]
+    except OperationalError:
         return 0
-    
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM images WHERE user_email = %s", (email,))
-    result = cur.fetchone()[0]
-    
-    cur.close()
-    close_db(conn)
-    return result
 
 
 def get_expired_images():
@@ -530,17 +881,12 @@ def get_expired_images():
     Returns:
         list: Список изображений с истекшим сроком хранения
     """
-    conn = connect_db()
-    if not conn:
+    try:
+        with db_cursor() as cur:
+            cur.execute("SELECT * FROM images WHERE expiration_date IS NOT NULL AND expiration_date < %s", (datetime.now(),))
+            return cur.fetchall()
+    except OperationalError:
         return []
-    
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM images WHERE expiration_date IS NOT NULL AND expiration_date < %s", (datetime.now(),))
-    result = cur.fetchall()
-    
-    cur.close()
-    close_db(conn)
-    return result
 
 
 def ensure_schema():
@@ -569,6 +915,24 @@ def ensure_schema():
         if not cur.fetchone()[0]:
             create_table_users()
             print("Создана таблица users")
+        else:
+            # Проверяем наличие вычисляемой колонки is_active_user в таблице users
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.columns 
+                    WHERE table_schema = 'public' 
+                    AND table_name = 'users' 
+                    AND column_name = 'is_active_user'
+                );
+            """)
+            if not cur.fetchone()[0]:
+                cur.execute(
+                    "ALTER TABLE users ADD COLUMN is_active_user BOOLEAN "
+                    f"GENERATED ALWAYS AS ({ACTIVE_USER_EXPRESSION}) STORED"
+                )
+                cur.execute(ACTIVE_USERS_INDEX_SQL)
+                conn.commit()
+                print("Добавлена колонка is_active_user в таблицу users")
         
         # Проверяем существование таблицы images
         cur.execute("""
@@ -614,6 +978,27 @@ def ensure_schema():
                 cur.execute("ALTER TABLE images ADD COLUMN expiration_date TIMESTAMP")
                 conn.commit()
                 print("Добавлена колонка expiration_date в таблицу images")
+            
+            # Проверяем наличие колонки crc32 в таблице images.
+            # У ранее загруженных файлов она остается NULL: такие файлы
+            # упаковываются в архив с вычислением CRC по ходу чтения
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.columns 
+                    WHERE table_schema = 'public' 
+                    AND table_name = 'images' 
+                    AND column_name = 'crc32'
+                );
+            """)
+            if not cur.fetchone()[0]:
+                cur.execute("ALTER TABLE images ADD COLUMN crc32 BIGINT")
+                conn.commit()
+                print("Добавлена колонка crc32 в таблицу images")
+            
+            # Индексы для пакетных запросов (IF NOT EXISTS - повторно не создаются)
+            for index_sql in IMAGES_INDEX_SQL:
+                cur.execute(index_sql)
+            conn.commit()
         
         # Проверяем существование таблицы statistics
         cur.execute("""
@@ -626,6 +1011,26 @@ def ensure_schema():
         if not cur.fetchone()[0]:
             create_table_statistics()
             print("Создана таблица statistics")
+        else:
+            # Проверяем наличие внешнего ключа statistics.user_email -> users.email
+            # Проверку существования пользователя при записи статистики выполняет БД
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM pg_constraint 
+                    WHERE conname = 'fk_statistics_user_email'
+                );
+            """)
+            if not cur.fetchone()[0]:
+                # NOT VALID: старые записи не перепроверяются, ключ действует
+                # только для новых строк и не блокирует таблицу надолго
+                cur.execute("""
+                    ALTER TABLE statistics 
+                    ADD CONSTRAINT fk_statistics_user_email 
+                    FOREIGN KEY (user_email) REFERENCES users(email) ON DELETE SET NULL
+                    NOT VALID
+                """)
+                conn.commit()
+                print("Добавлен внешний ключ user_email в таблицу statistics")
         
         # Создаем администратора если его нет
         ensure_admin_user()
@@ -650,14 +1055,14 @@ def create_table_statistics():
         bool: True если таблица создана успешно, False в противном случае
     """
     try:
-        conn = connect_db()
-        cur = conn.cursor()
-        
-        cur.execute("""
+        with db_cursor() as cur:
+            cur.execute("""
         CREATE TABLE IF NOT EXISTS statistics (
             id SERIAL PRIMARY KEY,
             action_type VARCHAR(50) NOT NULL,
-            user_email VARCHAR(255),
+            user_email VARCHAR(255)
+                CONSTRAINT fk_statistics_user_email
+                REFERENCES users(email) ON DELETE SET NULL,
             file_id INTEGER,
             ip_address INET,
             user_agent TEXT,
@@ -666,10 +1071,6 @@ def create_table_statistics():
         )
         """)
         
-        conn.commit()
-        cur.close()
-        close_db(conn)
-        
         return True
     except Exception as e:
         print(f'Error creating statistics table: {str(e)}')
@@ -691,8 +1092,6 @@ def ensure_admin_user():
     Returns:
         bool: True если администратор создан или уже существует, False при ошибке
     """
-    import hashlib
-    
     # Проверяем, нужно ли создавать администратора
     create_admin = os.getenv('CREATE_ADMIN_USER', 'false').lower() == 'true'
     if not create_admin:
@@ -707,30 +1106,22 @@ def ensure_admin_user():
         return False
     
     try:
-        conn = connect_db()
-        if not conn:
-            return False
-        
-        cur = conn.cursor()
-        
-        # Проверяем, существует ли администратор
-        cur.execute("SELECT email FROM users WHERE email = %s", (admin_email,))
-        existing_admin = cur.fetchone()
-        
-        if not existing_admin:
-            # Создаем администратора только если его нет
-            password_hash = hashlib.sha256(admin_password.encode()).hexdigest()
-            cur.execute(
-                "INSERT INTO users (email, password_hash, created_at) VALUES (%s, %s, NOW())",
-                (admin_email, password_hash)
-            )
-            conn.commit()
-            print(f"Создан администратор: {admin_email}")
-        else:
-            print(f"Администратор уже существует: {admin_email}")
+        with db_cursor() as cur:
+            # Проверяем, существует ли администратор
+            cur.execute("SELECT email FROM users WHERE email = %s", (admin_email,))
+            existing_admin = cur.fetchone()
+            
+            if not existing_admin:
+                # Создаем администратора только если его нет
+                password_hash = hash_password(admin_password)
+                cur.execute(
+                    "INSERT INTO users (email, password_hash, created_at) VALUES (%s, %s, NOW())",
+                    (admin_email, password_hash)
+                )
+                print(f"Создан администратор: {admin_email}")
+            else:
+                print(f"Администратор уже существует: {admin_email}")
         
-        cur.close()
-        close_db(conn)
         return True
         
     except Exception as e:
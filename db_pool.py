@@ -21,6 +21,7 @@ import threading
 import time
 from contextlib import contextmanager
 from psycopg2 import pool, OperationalError
+from psycopg2.extensions import QueryCanceledError
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -42,6 +43,10 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
 
+# Предельное время запроса проверки здоровья (мс): при деградации БД
+# /health должен быстро ответить "unhealthy", а не ждать таймаута сервера
+HEALTH_CHECK_TIMEOUT_MS = int(os.getenv("HEALTH_CHECK_TIMEOUT_MS", "200"))
+
 # ============================================================================
 # КЛАСС УПРАВЛЕНИЯ ПУЛОМ СОЕДИНЕНИЙ
 # ============================================================================
@@ -83,6 +88,9 @@ class DatabasePool:
                 port=DB_PORT,
                 # Дополнительные параметры для производительности
                 cursor_factory=RealDictCursor,
+                # Кодировка клиента (UTF-8), как и в db.connect_db():
+                # без нее на Windows ломались сообщения об ошибках
+                client_encoding='utf8',
                 # Настройки соединения
                 connect_timeout=10,
                 # Параметры для поддержания соединений
@@ -114,18 +122,14 @@ class DatabasePool:
         try:
             # Получаем соединение из пула
             conn = self._pool.getconn()
-            if conn:
-                # Проверяем состояние соединения
-                if conn.closed:
-                    # Соединение закрыто, получаем новое
-                    self._pool.putconn(conn, close=True)
-                    conn = self._pool.getconn()
-                
-                self._stats['active_connections'] += 1
-                yield conn
-            else:
+            if conn and conn.closed:
+                # Соединение закрыто, получаем новое
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            
+            if not conn:
                 self._stats['pool_exhausted'] += 1
-                raise Exception("Pool exhausted: no available connections")
+                raise OperationalError("Pool exhausted: no available connections")
                 
         except pool.PoolError as e:
             self._stats['failed_connections'] += 1
@@ -136,15 +140,19 @@ class DatabasePool:
             self._stats['failed_connections'] += 1
             logging.error(f"Database connection error: {e}")
             raise
-            
+        
+        # Ошибки внутри блока with относятся к запросам вызывающего кода,
+        # а не к пулу, поэтому здесь только возвращаем соединение
+        self._stats['active_connections'] += 1
+        try:
+            yield conn
         finally:
-            # Возвращаем соединение в пул
-            if conn:
-                try:
-                    self._pool.putconn(conn)
-                    self._stats['active_connections'] -= 1
-                except Exception as e:
-                    logging.error(f"Error returning connection to pool: {e}")
+            try:
+                # Незавершенная транзакция откатывается самим пулом
+                self._pool.putconn(conn)
+                self._stats['active_connections'] -= 1
+            except Exception as e:
+                logging.error(f"Error returning connection to pool: {e}")
     
     def get_stats(self):
         """
@@ -166,15 +174,26 @@ class DatabasePool:
         """
         Проверка здоровья пула соединений.
         
+        Выполняет SELECT 1 с ограничением statement_timeout
+        (HEALTH_CHECK_TIMEOUT_MS), действующим только внутри этой транзакции.
+        
         Returns:
             bool: True если пул работает нормально
         """
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1")
-                result = cursor.fetchone()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SET LOCAL statement_timeout = %s", (HEALTH_CHECK_TIMEOUT_MS,))
+                        cursor.execute("SELECT 1")
+                        result = cursor.fetchone()
+                finally:
+                    # Завершаем транзакцию, SET LOCAL на этом сбрасывается
+                    conn.rollback()
                 return result is not None
+        except QueryCanceledError:
+            logging.warning(f"Pool health check timed out after {HEALTH_CHECK_TIMEOUT_MS} ms")
+            return False
         except Exception as e:
             logging.error(f"Pool health check failed: {e}")
             return False
@@ -226,15 +245,20 @@ def close_db(conn):
 # МОНИТОРИНГ И МЕТРИКИ
 # ============================================================================
 
-def get_pool_metrics():
+def get_pool_metrics(health=None):
     """
     Получение метрик пула для мониторинга.
     
+    Args:
+        health (bool, optional): Уже полученный результат health_check(),
+                                 чтобы не проверять БД повторно
+    
     Returns:
         dict: Детальные метрики пула соединений
     """
     stats = db_pool.get_stats()
-    health = db_pool.health_check()
+    if health is None:
+        health = db_pool.health_check()
     
     return {
         'pool_health': health,
@@ -114,6 +114,7 @@ def create_table_images():
     - file_type (TEXT, NOT NULL): MIME-тип файла (image/jpeg, image/png, etc.)
     - user_email (TEXT): Email владельца файла (может быть NULL для анонимных)
     - expiration_date (TIMESTAMP): Дата истечения срока хранения (опционально)
+    - crc32 (BIGINT): Контрольная сумма CRC-32 файла для ZIP-архивов без сжатия
     
     Связи с другими таблицами:
     - FOREIGN KEY (user_email) → users(email): Связь с таблицей пользователей
@@ -146,6 +147,7 @@ def create_table_images():
             file_type TEXT NOT NULL,
             user_email TEXT,
             expiration_date TIMESTAMP,
+            crc32 BIGINT,
             FOREIGN KEY (user_email) REFERENCES users(email) ON DELETE CASCADE
         );
     """
@@ -170,6 +172,7 @@ def create_table_images():
         file_type TEXT NOT NULL,
         user_email TEXT,
         expiration_date TIMESTAMP,
+        crc32 BIGINT,
         FOREIGN KEY (user_email) REFERENCES users(email) ON DELETE CASCADE
     );"""
     
@@ -38,6 +38,11 @@ except ImportError:
 # Временно отключен из-за проблем с кодировкой
 # from db_pool import db_pool, get_pool_metrics
 
+# Первый вызов cpu_percent(interval=None) запоминает точку отсчета:
+# следующие вызовы возвращают загрузку CPU с предыдущего вызова сразу,
+# без секундного ожидания замера
+psutil.cpu_percent(interval=None)
+
 # ============================================================================
 # PROMETHEUS МЕТРИКИ
 # ============================================================================
@@ -132,8 +137,8 @@ class PerformanceMonitor:
             dict: Системные метрики
         """
         try:
-            # CPU метрики
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU метрики: загрузка с предыдущего сбора, без блокировки запроса
+            cpu_percent = psutil.cpu_percent(interval=None)
             cpu_count = psutil.cpu_count()
             
             # Память